@@ -0,0 +1,345 @@
+import bisect
+from functools import lru_cache
+import cv2
+import numpy as np
+from PIL import Image, ImageDraw, ImageFont
+
+# Caption style (matches the original TextClip styling: Franklin Gothic,
+# #2699ff fill, 2px black outline, ~6.5% of video height, 100px bottom margin)
+CAPTION_FONT = "Franklin Gothic"
+CAPTION_COLOR = "#2699ff"
+CAPTION_STROKE_COLOR = "black"
+CAPTION_STROKE_WIDTH = 2
+CAPTION_FONTSIZE_RATIO = 0.065
+CAPTION_SIDE_MARGIN = 50
+CAPTION_BOTTOM_MARGIN = 100
+# Karaoke captions: color of the word being spoken
+CAPTION_HIGHLIGHT_COLOR = "#ffe600"
+
+# Font files tried for a font name, in order, before falling back to
+# Pillow's built-in font
+FONT_FILES = {
+    "Franklin Gothic": ["framd.ttf", "FranklinGothic.ttf", "Franklin Gothic Medium.ttf",
+                        "LibreFranklin-SemiBold.ttf", "DejaVuSans-Bold.ttf", "LiberationSans-Bold.ttf"],
+}
+
+
+def get_relevant_transcriptions(transcriptions, video_start_time, video_duration):
+    """
+    Filter transcriptions to only those within the video timeframe, with times
+    adjusted relative to video_start_time and clamped to [0, video_duration].
+    """
+    relevant_transcriptions = []
+    for text, start, end in transcriptions:
+        # Adjust times relative to video start
+        adjusted_start = start - video_start_time
+        adjusted_end = end - video_start_time
+        
+        # Only include if within video duration
+        if adjusted_end > 0 and adjusted_start < video_duration:
+            adjusted_start = max(0, adjusted_start)
+            adjusted_end = min(video_duration, adjusted_end)
+            relevant_transcriptions.append([text.strip(), adjusted_start, adjusted_end])
+    return relevant_transcriptions
+
+
+@lru_cache(maxsize=32)
+def load_font(font, fontsize):
+    """PIL font for a font name or file, falling back to a common bold sans and then the default font"""
+    for candidate in FONT_FILES.get(font, []) + [font, "DejaVuSans-Bold.ttf", "Arial.ttf"]:
+        try:
+            return ImageFont.truetype(candidate, fontsize)
+        except OSError:
+            continue
+    print(f"Warning: Font '{font}' not found, using Pillow's default font")
+    return ImageFont.load_default(fontsize)
+
+
+def wrap_text(text, font, max_width):
+    """Greedy word wrap of text into lines no wider than max_width pixels"""
+    lines = []
+    current = ""
+    for word in text.split():
+        candidate = f"{current} {word}" if current else word
+        if current and font.getlength(candidate) > max_width:
+            lines.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        lines.append(current)
+    return lines
+
+
+class CaptionSprite:
+    """
+    A rasterized caption, cropped to its visible pixels.
+
+    rgba is the RGBA image. For blending it is split once into the fully
+    opaque pixels (a mask, copied with cv2.copyTo) and the few anti-aliased
+    edge pixels (coordinates with premultiplied color and inverse alpha as
+    uint16), so a blend never does per-pixel math on transparent or opaque
+    pixels.
+    """
+
+    __slots__ = ('rgba', 'width', 'height', 'x_offset', 'y_offset', 'rgb', 'bgr', 'opaque',
+                 'edge_y', 'edge_x', 'edge_inv_alpha', 'edge_premul_rgb', 'edge_premul_bgr')
+
+    def __init__(self, rgba, x_offset=0, y_offset=0):
+        self.rgba = rgba
+        # Position of the sprite's top-left corner relative to the text origin
+        self.x_offset = x_offset
+        self.y_offset = y_offset
+        self.height, self.width = rgba.shape[:2]
+        alpha = rgba[..., 3]
+        self.rgb = np.ascontiguousarray(rgba[..., :3])
+        self.bgr = np.ascontiguousarray(rgba[..., 2::-1])
+        self.opaque = (alpha == 255).astype(np.uint8)
+        self.edge_y, self.edge_x = np.nonzero((alpha > 0) & (alpha < 255))
+        edge_alpha = alpha[self.edge_y, self.edge_x].astype(np.uint16)[:, None]
+        self.edge_inv_alpha = 255 - edge_alpha
+        self.edge_premul_rgb = self.rgb[self.edge_y, self.edge_x].astype(np.uint16) * edge_alpha
+        self.edge_premul_bgr = np.ascontiguousarray(self.edge_premul_rgb[:, ::-1])
+
+
+@lru_cache(maxsize=2048)
+def rasterize_caption(text, font=CAPTION_FONT, fontsize=47, color=CAPTION_COLOR,
+                      stroke_color=CAPTION_STROKE_COLOR, stroke_width=CAPTION_STROKE_WIDTH, max_width=620):
+    """
+    Render caption text once into a CaptionSprite (centered lines, wrapped to
+    max_width). Cached by text, font, size, colors and width, so a caption
+    repeated across frames, clips or runs in the same process costs one
+    rasterization. Returns None for empty text.
+    """
+    pil_font = load_font(font, fontsize)
+    lines = wrap_text(text, pil_font, max_width)
+    if not lines:
+        return None
+
+    ascent, descent = pil_font.getmetrics()
+    line_height = ascent + descent + 2 * stroke_width
+    width = int(max(pil_font.getlength(line) for line in lines)) + 2 * stroke_width + 2
+    image = Image.new('RGBA', (width, line_height * len(lines)), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    for i, line in enumerate(lines):
+        x = (width - pil_font.getlength(line)) / 2
+        draw.text((x, i * line_height + stroke_width), line, font=pil_font, fill=color,
+                  stroke_width=stroke_width, stroke_fill=stroke_color)
+
+    bbox = image.getbbox()
+    if bbox is None:
+        return None
+    return CaptionSprite(np.asarray(image.crop(bbox)))
+
+
+@lru_cache(maxsize=2048)
+def rasterize_text(text, font=CAPTION_FONT, fontsize=47, color=CAPTION_COLOR,
+                   stroke_color=CAPTION_STROKE_COLOR, stroke_width=CAPTION_STROKE_WIDTH):
+    """
+    Render one line of text (no wrapping) into a CaptionSprite whose
+    x_offset/y_offset place it relative to the text origin, so separately
+    rendered pieces of a line (karaoke words over their line) line up.
+    Cached like rasterize_caption. Returns None for empty text.
+    """
+    pil_font = load_font(font, fontsize)
+    ascent, descent = pil_font.getmetrics()
+    width = int(pil_font.getlength(text)) + 2 * stroke_width + 2
+    image = Image.new('RGBA', (width, ascent + descent + 2 * stroke_width), (0, 0, 0, 0))
+    ImageDraw.Draw(image).text((stroke_width, stroke_width), text, font=pil_font, fill=color,
+                               stroke_width=stroke_width, stroke_fill=stroke_color)
+    bbox = image.getbbox()
+    if bbox is None:
+        return None
+    return CaptionSprite(np.asarray(image.crop(bbox)), bbox[0] - stroke_width, bbox[1] - stroke_width)
+
+
+def blend_sprite(frame, sprite, x, y, bgr=True):
+    """Alpha-blend sprite onto frame (in place) with its top-left corner at (x, y), clipped to the frame"""
+    frame_h, frame_w = frame.shape[:2]
+    x0, y0 = max(0, x), max(0, y)
+    x1, y1 = min(frame_w, x + sprite.width), min(frame_h, y + sprite.height)
+    if x0 >= x1 or y0 >= y1:
+        return frame
+    sx, sy = x0 - x, y0 - y
+    rows, cols = slice(sy, sy + y1 - y0), slice(sx, sx + x1 - x0)
+    region = frame[y0:y1, x0:x1]
+
+    # Opaque pixels: straight copy
+    color = sprite.bgr if bgr else sprite.rgb
+    cv2.copyTo(color[rows, cols], sprite.opaque[rows, cols], region)
+
+    # Anti-aliased edges: (bg * (255 - a) + fg * a) / 255 on those pixels only
+    edge_y, edge_x = sprite.edge_y - sy, sprite.edge_x - sx
+    inv_alpha = sprite.edge_inv_alpha
+    premul = sprite.edge_premul_bgr if bgr else sprite.edge_premul_rgb
+    if (x0, y0, x1, y1) != (x, y, x + sprite.width, y + sprite.height):
+        inside = (edge_y >= 0) & (edge_y < y1 - y0) & (edge_x >= 0) & (edge_x < x1 - x0)
+        edge_y, edge_x, inv_alpha, premul = edge_y[inside], edge_x[inside], inv_alpha[inside], premul[inside]
+    blended = region[edge_y, edge_x].astype(np.uint16)
+    blended *= inv_alpha
+    blended += premul
+    blended += 127
+    blended //= 255
+    region[edge_y, edge_x] = blended
+    return frame
+
+
+class SubtitleRenderer:
+    """
+    Burns transcript captions into frames of a clip.
+
+    The segments inside the clip are looked up by time with bisect, each
+    caption is rasterized once (rasterize_caption) and only its bounding box
+    is blended into the frame. Frames are BGR (the render pipe) unless bgr=False
+    (moviepy frames are RGB).
+    """
+
+    def __init__(self, transcriptions, frame_width, frame_height, video_start_time=0,
+                 video_duration=float('inf'), bgr=True):
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.bgr = bgr
+        self.fontsize = int(frame_height * CAPTION_FONTSIZE_RATIO)
+        self.max_width = frame_width - 2 * CAPTION_SIDE_MARGIN
+        self.cues = [cue for cue in get_relevant_transcriptions(transcriptions, video_start_time, video_duration)
+                     if cue[0] and cue[2] > cue[1]]
+        self.starts = [start for _, start, _ in self.cues]
+
+    def __len__(self):
+        return len(self.cues)
+
+    def active_index(self, t):
+        """Index of the cue shown at clip time t, or None"""
+        i = bisect.bisect_right(self.starts, t) - 1
+        # Cues may overlap slightly; the latest one that started wins
+        while i >= 0:
+            if t < self.cues[i][2]:
+                return i
+            if i == 0 or self.cues[i - 1][2] <= t:
+                break
+            i -= 1
+        return None
+
+    def active_cue(self, t):
+        """The [text, start, end] cue shown at clip time t, or None"""
+        i = self.active_index(t)
+        return None if i is None else self.cues[i]
+
+    def sprite(self, text):
+        return rasterize_caption(text, CAPTION_FONT, self.fontsize, CAPTION_COLOR,
+                                 CAPTION_STROKE_COLOR, CAPTION_STROKE_WIDTH, self.max_width)
+
+    def overlay(self, frame, t):
+        """Draw the caption active at clip time t onto frame; returns the (possibly copied) frame"""
+        cue = self.active_cue(t)
+        if cue is None:
+            return frame
+        sprite = self.sprite(cue[0])
+        if sprite is None:
+            return frame
+        if not frame.flags.writeable:
+            frame = frame.copy()
+        x = (self.frame_width - sprite.width) // 2
+        y = self.frame_height - sprite.height - CAPTION_BOTTOM_MARGIN
+        return blend_sprite(frame, sprite, x, y, self.bgr)
+
+
+class KaraokeRenderer(SubtitleRenderer):
+    """
+    Captions that highlight the word being spoken.
+
+    For each cue, the words (from a WordTimings, source times) are laid out
+    once into wrapped lines: one base sprite per line and one highlight
+    sprite per word, positioned over that word in the line. A frame then
+    blends the cue's line sprites plus the sprite of the last word that has
+    started. Sprites come from the shared rasterize_text cache, so repeated
+    words and lines are rendered once. Cues without word timings fall back
+    to plain captions.
+    """
+
+    def __init__(self, transcriptions, words, frame_width, frame_height, video_start_time=0,
+                 video_duration=float('inf'), bgr=True):
+        super().__init__(transcriptions, frame_width, frame_height, video_start_time, video_duration, bgr)
+        self.words = words
+        self.video_start_time = video_start_time
+        self.layouts = {}
+
+    def layout(self, i):
+        """Lines and word highlights for cue i (built on first use), or None if it has no words"""
+        if i in self.layouts:
+            return self.layouts[i]
+
+        # Words spoken inside the cue (and the clip), in source time
+        text, start, end = self.cues[i]
+        lo, hi = self.words.index_range(start + self.video_start_time - 0.05, end + self.video_start_time)
+        texts = [self.words.word(w) for w in range(lo, hi)]
+        if not texts:
+            self.layouts[i] = None
+            return None
+
+        font = load_font(CAPTION_FONT, self.fontsize)
+        lines = []
+        for index, text in enumerate(texts):
+            if lines and font.getlength(" ".join(texts[j] for j in lines[-1] + [index])) <= self.max_width:
+                lines[-1].append(index)
+            else:
+                lines.append([index])
+
+        ascent, descent = font.getmetrics()
+        line_height = ascent + descent + 2 * CAPTION_STROKE_WIDTH
+        top = self.frame_height - len(lines) * line_height - CAPTION_BOTTOM_MARGIN
+
+        line_sprites = []
+        word_sprites = [None] * len(texts)
+        for row, indices in enumerate(lines):
+            line_text = " ".join(texts[j] for j in indices)
+            x = (self.frame_width - font.getlength(line_text)) / 2
+            y = top + row * line_height
+            base = rasterize_text(line_text, CAPTION_FONT, self.fontsize, CAPTION_COLOR,
+                                  CAPTION_STROKE_COLOR, CAPTION_STROKE_WIDTH)
+            if base is not None:
+                line_sprites.append((base, int(round(x)) + base.x_offset, y + base.y_offset))
+            prefix = ""
+            for j in indices:
+                word_x = x + font.getlength(prefix)
+                sprite = rasterize_text(texts[j], CAPTION_FONT, self.fontsize, CAPTION_HIGHLIGHT_COLOR,
+                                        CAPTION_STROKE_COLOR, CAPTION_STROKE_WIDTH)
+                if sprite is not None:
+                    word_sprites[j] = (sprite, int(round(word_x)) + sprite.x_offset, y + sprite.y_offset)
+                prefix += texts[j] + " "
+
+        layout = {
+            'lines': line_sprites,
+            'words': word_sprites,
+            'starts': self.words.starts[lo:hi] - self.video_start_time,
+        }
+        self.layouts[i] = layout
+        return layout
+
+    def overlay(self, frame, t):
+        i = self.active_index(t)
+        if i is None:
+            return frame
+        layout = self.layout(i)
+        if layout is None:
+            return super().overlay(frame, t)
+        if not frame.flags.writeable:
+            frame = frame.copy()
+        for sprite, x, y in layout['lines']:
+            blend_sprite(frame, sprite, x, y, self.bgr)
+        # The last word that has started stays highlighted until the next one
+        j = int(np.searchsorted(layout['starts'], t, side='right')) - 1
+        if j >= 0 and layout['words'][j] is not None:
+            sprite, x, y = layout['words'][j]
+            blend_sprite(frame, sprite, x, y, self.bgr)
+        return frame
+
+
+if __name__ == "__main__":
+    import time
+    renderer = SubtitleRenderer([[" Hello there, this is a caption test.", 0.0, 2.0]], 1080, 1920)
+    frame = np.zeros((1920, 1080, 3), np.uint8)
+    start = time.time()
+    for i in range(300):
+        renderer.overlay(frame, (i % 60) / 30)
+    print(f"300 frames: {time.time() - start:.3f}s")
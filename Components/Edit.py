@@ -1,12 +1,28 @@
 from moviepy.video.io.VideoFileClip import VideoFileClip
 from moviepy.editor import VideoFileClip
+import os
 import subprocess
+import wave
+import numpy as np
+import ffmpeg
 
-def extractAudio(video_path, audio_path="audio.wav"):
+# Whisper and webrtcvad both work on 16 kHz mono 16-bit PCM
+AUDIO_SAMPLE_RATE = 16000
+
+def extractAudio(video_path, audio_path="audio.wav", sample_rate=AUDIO_SAMPLE_RATE):
+    """
+    Demux only the audio stream (no video decode) and write it as mono 16-bit
+    PCM WAV at sample_rate, the format transcription and VAD consume directly.
+    """
     try:
-        video_clip = VideoFileClip(video_path)
-        video_clip.audio.write_audiofile(audio_path)
-        video_clip.close()
+        (
+            ffmpeg
+            .input(video_path)
+            .output(audio_path, vn=None, acodec='pcm_s16le', ac=1, ar=sample_rate)
+            .global_args('-loglevel', 'error')
+            .overwrite_output()
+            .run()
+        )
         print(f"Extracted audio to: {audio_path}")
         return audio_path
     except Exception as e:
@@ -14,7 +30,194 @@ def extractAudio(video_path, audio_path="audio.wav"):
         return None
 
 
-def crop_video(input_file, output_file, start_time, end_time):
+def load_audio(path, sample_rate=AUDIO_SAMPLE_RATE, mmap_path=None):
+    """
+    Return the audio of any media file as a mono int16 NumPy array at sample_rate.
+
+    A WAV that is already in that format (e.g. from extractAudio) is read
+    as-is with no decode. Anything else is decoded by ffmpeg straight into
+    memory, or, if mmap_path is given, into a raw PCM file there that is
+    memory-mapped, so long videos don't need the samples resident in RAM.
+    """
+    try:
+        with wave.open(path, 'rb') as wf:
+            if wf.getframerate() == sample_rate and wf.getnchannels() == 1 and wf.getsampwidth() == 2:
+                return np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16)
+    except (wave.Error, EOFError):
+        pass  # Not a WAV file
+
+    stream = ffmpeg.input(path).output(mmap_path or 'pipe:', vn=None, format='s16le', acodec='pcm_s16le', ac=1, ar=sample_rate)
+    stream = stream.global_args('-loglevel', 'error')
+    if mmap_path:
+        stream.overwrite_output().run()
+        return np.memmap(mmap_path, dtype=np.int16, mode='r')
+    out, _ = stream.run(capture_stdout=True)
+    return np.frombuffer(out, dtype=np.int16)
+
+
+def pcm_to_float(audio):
+    """int16 PCM -> float32 in [-1, 1], the format WhisperModel.transcribe accepts"""
+    return audio.astype(np.float32) / 32768.0
+
+
+def probe_keyframes(input_file, around, window=10.0):
+    """
+    Probe the video stream near `around` seconds without decoding it.
+
+    Returns (codec_name, duration, keyframe_times) where keyframe_times are
+    the keyframe timestamps within +/- window seconds of `around`.
+    """
+    probe = ffmpeg.probe(
+        input_file,
+        select_streams='v:0',
+        skip_frame='nokey',
+        show_entries='frame=pts_time',
+        read_intervals=f"{max(0.0, around - window)}%{around + window}",
+    )
+    codec_name = probe['streams'][0].get('codec_name') if probe.get('streams') else None
+    duration = float(probe.get('format', {}).get('duration', 0) or 0)
+    keyframes = sorted(
+        float(frame['pts_time']) for frame in probe.get('frames', [])
+        if frame.get('pts_time') not in (None, 'N/A')
+    )
+    return codec_name, duration, keyframes
+
+
+# ffprobe profile names -> libx264 -profile:v
+X264_PROFILES = {
+    'Constrained Baseline': 'baseline', 'Baseline': 'baseline', 'Main': 'main', 'High': 'high',
+    'High 10': 'high10', 'High 4:2:2': 'high422', 'High 4:4:4 Predictive': 'high444',
+}
+
+
+def probe_video_format(input_file):
+    """
+    libx264 output options (profile, level, pix_fmt) matching the source's
+    first video stream, so a re-encoded head is as close as possible to the
+    stream-copied rest.
+    """
+    stream = ffmpeg.probe(input_file, select_streams='v:0')['streams'][0]
+    options = {'pix_fmt': stream.get('pix_fmt') or 'yuv420p'}
+    profile = X264_PROFILES.get(stream.get('profile'))
+    if profile:
+        options['profile:v'] = profile
+    level = stream.get('level')
+    if level and level > 0:
+        options['level'] = f"{level / 10:g}"
+    return options
+
+
+def _run_ffmpeg(stream):
+    stream.global_args('-loglevel', 'error').overwrite_output().run()
+
+
+def _reencode_trim(input_file, output_file, start_time, end_time):
+    _run_ffmpeg(
+        ffmpeg
+        .input(input_file, ss=start_time, t=end_time - start_time)
+        .output(output_file, vcodec='libx264', acodec='aac', preset='veryfast', crf=18)
+    )
+
+
+def fast_trim(input_file, output_file, start_time, end_time, exact=True):
+    """
+    Trim input_file to start_time-end_time mostly by stream copy.
+
+    The input is seeked directly (no full decode). With exact=False the clip
+    is stream-copied from the last keyframe at or before start_time, so it may
+    begin up to one GOP early. With exact=True (H.264 sources) only the head
+    from start_time up to the next keyframe is re-encoded; the rest of the
+    video is stream-copied and the two parts are joined, and audio is
+    stream-copied from start_time. Falls back to a full re-encode when the
+    source isn't H.264 or no usable keyframe is found.
+
+    The joined parts carry different codec headers (SPS/PPS), which only an
+    MPEG-TS output_file (.ts) can hold: TS repeats the headers in front of
+    every keyframe. For any other container an exact cut that doesn't start
+    on a keyframe is re-encoded in full.
+    """
+    codec_name, duration, keyframes = probe_keyframes(input_file, start_time)
+
+    # Ensure end_time doesn't exceed video duration
+    if duration:
+        max_time = duration - 0.1  # Small buffer to avoid edge cases
+        if end_time > max_time:
+            print(f"Warning: Requested end time ({end_time}s) exceeds video duration ({duration}s). Capping to {max_time}s")
+            end_time = max_time
+
+    before = [t for t in keyframes if t <= start_time + 0.001]
+    after = [t for t in keyframes if t >= start_time - 0.001]
+
+    if not exact and before:
+        print(f"Stream-copying from keyframe at {before[-1]:.3f}s")
+        _run_ffmpeg(
+            ffmpeg
+            .input(input_file, ss=before[-1], t=end_time - before[-1])
+            .output(output_file, c='copy', avoid_negative_ts='make_zero')
+        )
+        return output_file
+
+    if codec_name != 'h264' or not after or after[0] >= end_time:
+        print("Re-encoding clip (no usable keyframe for stream copy)")
+        _reencode_trim(input_file, output_file, start_time, end_time)
+        return output_file
+
+    keyframe = after[0]
+    transport_stream = output_file.lower().endswith('.ts')
+    if keyframe - start_time > 0.001 and not transport_stream:
+        print("Re-encoding clip (a smart cut needs a .ts output)")
+        _reencode_trim(input_file, output_file, start_time, end_time)
+        return output_file
+
+    base = os.path.splitext(output_file)[0]
+    head_file = f"{base}_head.ts"
+    tail_file = f"{base}_tail.ts"
+    list_file = f"{base}_parts.txt"
+    parts = []
+    try:
+        if keyframe - start_time > 0.001:
+            print(f"Re-encoding head {start_time:.3f}s - {keyframe:.3f}s, stream-copying the rest")
+            _run_ffmpeg(
+                ffmpeg
+                .input(input_file, ss=start_time, t=keyframe - start_time)
+                .output(head_file, an=None, vcodec='libx264', preset='veryfast', crf=18,
+                        **probe_video_format(input_file))
+            )
+            parts.append(head_file)
+        else:
+            print(f"Start is on a keyframe, stream-copying {start_time:.3f}s - {end_time:.3f}s")
+
+        # Seeking a hair past the keyframe still lands on it for stream copy
+        _run_ffmpeg(
+            ffmpeg
+            .input(input_file, ss=keyframe + 0.001, t=end_time - keyframe)
+            .output(tail_file, an=None, vcodec='copy', avoid_negative_ts='make_zero')
+        )
+        parts.append(tail_file)
+
+        with open(list_file, 'w') as f:
+            for part in parts:
+                f.write(f"file '{os.path.abspath(part)}'\n")
+
+        video = ffmpeg.input(list_file, format='concat', safe=0).video
+        audio = ffmpeg.input(input_file, ss=start_time, t=end_time - start_time).audio
+        # In TS, dump_extra puts the headers in front of every keyframe
+        extra = {'bsf:v': 'dump_extra'} if transport_stream else {}
+        _run_ffmpeg(ffmpeg.output(video, audio, output_file, c='copy', **extra))
+    finally:
+        for temp_file in (head_file, tail_file, list_file):
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+    return output_file
+
+
+def crop_video(input_file, output_file, start_time, end_time, fast=True, exact=True):
+    if fast:
+        try:
+            return fast_trim(input_file, output_file, start_time, end_time, exact=exact)
+        except Exception as e:
+            print(f"Fast trim failed ({e}), falling back to full re-encode")
+
     with VideoFileClip(input_file) as video:
         # Ensure end_time doesn't exceed video duration
         max_time = video.duration - 0.1  # Small buffer to avoid edge cases
@@ -24,6 +227,7 @@ def crop_video(input_file, output_file, start_time, end_time):
         
         cropped_video = video.subclip(start_time, end_time)
         cropped_video.write_videofile(output_file, codec='libx264')
+    return output_file
 
 # Example usage:
 if __name__ == "__main__":
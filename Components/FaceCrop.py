@@ -1,23 +1,336 @@
 import cv2
 import numpy as np
 from moviepy.editor import *
-from Components.Speaker import detect_faces_and_speakers, Frames
-global Fps
+from Components.Speaker import detect_faces_and_speakers, Frames, analyze_speakers, speaker_model_available
+from Components.Models import get_face_cascade
 
-def crop_to_vertical(input_video_path, output_video_path):
-    """Crop video to vertical 9:16 format with static face detection (no tracking)"""
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+# Face detection sampling: how many frames to probe per clip, and the width
+# frames are downscaled to before running the cascade
+FACE_SAMPLE_BUDGET = 30
+FACE_DETECT_WIDTH = 640
+
+
+def sample_frame_indices(first_frame, last_frame, budget):
+    """Up to `budget` frame indices spread evenly over [first_frame, last_frame)"""
+    count = max(0, last_frame - first_frame)
+    if count == 0 or budget <= 0:
+        return []
+    n = min(budget, count)
+    # Center of each of n equal bins
+    return sorted(set((first_frame + (2 * np.arange(n) + 1) * count // (2 * n)).tolist()))
+
+
+def detect_faces_downscaled(face_cascade, frame, detect_width=FACE_DETECT_WIDTH):
+    """
+    Run the cascade on a downscaled gray copy of frame and return the boxes
+    (x, y, w, h) in full-resolution coordinates.
+    """
+    height, width = frame.shape[:2]
+    scale = min(1.0, detect_width / width)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if scale < 1.0:
+        gray = cv2.resize(gray, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+    min_size = max(24, int(30 * scale))
+    faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=8, minSize=(min_size, min_size))
+    if len(faces) == 0:
+        return []
+    return [tuple(int(round(v / scale)) for v in face) for face in faces]
+
+
+def detect_face_positions(input_video_path, clip_ranges, sample_budget=FACE_SAMPLE_BUDGET, detect_width=FACE_DETECT_WIDTH):
+    """
+    Face analysis for one or more clips of a source in a single capture
+    session. For each (start, end) range (end None = end of video), up to
+    sample_budget frames spread across the whole range are probed by seeking,
+    and detection runs on a downscaled gray image. Returns one list of
+    face center x positions (full resolution) per range, suitable for
+    plan_vertical_crop(face_positions=...).
+    """
+    face_cascade = get_face_cascade()
 
     cap = cv2.VideoCapture(input_video_path, cv2.CAP_FFMPEG)
     if not cap.isOpened():
         print("Error: Could not open video.")
-        return
+        return [[] for _ in clip_ranges]
+
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    # Closer than this, reading forward is cheaper than a seek (which decodes from a keyframe)
+    max_skip = max(1, int(fps * 2))
+
+    all_positions = []
+    for start_time, end_time in clip_ranges:
+        first_frame = int(round((start_time or 0) * fps))
+        last_frame = total_frames if end_time is None else min(total_frames, int(round(end_time * fps)))
+
+        face_positions = []
+        position = None  # index of the next frame cap.read() will return
+        for index in sample_frame_indices(first_frame, last_frame, sample_budget):
+            if position is None or index < position or index - position > max_skip:
+                cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            else:
+                for _ in range(index - position):
+                    cap.grab()
+            ret, frame = cap.read()
+            if not ret:
+                position = None
+                continue
+            position = index + 1
+
+            faces = detect_faces_downscaled(face_cascade, frame, detect_width)
+            if faces:
+                # Get largest face
+                x, y, w, h = max(faces, key=lambda f: f[2] * f[3])
+                face_positions.append(x + w // 2)
+        all_positions.append(face_positions)
+
+    cap.release()
+    return all_positions
+
+
+# Face tracking: seconds between detections and the smoothing window applied
+# to the crop trajectory
+FACE_TRACK_INTERVAL = 0.5
+FACE_TRACK_SMOOTHING = 1.0
+# Offset the crop slightly to the right of the face to prevent right-side cutoff
+FACE_X_OFFSET = 60
+
+# Screen-recording motion tracking: width of the gray image optical flow runs
+# on, and the minimum motion (in scaled-frame pixels) that counts
+MOTION_ANALYSIS_WIDTH = 160
+MOTION_THRESHOLD = 2.0
+
+
+def motion_center(prev_gray, curr_gray, threshold):
+    """
+    Motion-weighted mean column between two small gray frames, or None if
+    nothing moved more than threshold pixels. The flow magnitude is computed
+    and thresholded in place and summed per column with cv2.reduce, so no
+    full-size temporaries are created beyond the flow field itself.
+    """
+    flow = cv2.calcOpticalFlowFarneback(prev_gray, curr_gray, None, 0.5, 2, 9, 2, 5, 1.1, 0)
+    magnitude = cv2.magnitude(flow[..., 0], flow[..., 1])
+    cv2.threshold(magnitude, threshold, 0, cv2.THRESH_TOZERO, dst=magnitude)
+    col_motion = cv2.reduce(magnitude, 0, cv2.REDUCE_SUM).ravel()
+    total = col_motion.sum()
+    if total <= 0:
+        return None
+    return float(np.dot(np.arange(len(col_motion), dtype=np.float32), col_motion) / total)
+
+
+def pick_tracked_face(faces, previous_x):
+    """
+    Choose the face to follow: the largest one, unless a face of comparable
+    size (>= 70% of the largest area) sits close to where the crop already
+    is, so two similar faces don't make the crop flip back and forth.
+    """
+    largest = max(faces, key=lambda f: f[2] * f[3])
+    if previous_x is None or len(faces) == 1:
+        return largest
+    min_area = 0.7 * largest[2] * largest[3]
+    candidates = [f for f in faces if f[2] * f[3] >= min_area]
+    return min(candidates, key=lambda f: abs(f[0] + f[2] // 2 - previous_x))
+
+
+def smooth_trajectory(centers, cuts, window):
+    """
+    Moving-average smoothing of a per-frame center array, applied separately
+    to each shot (frames between consecutive indices in cuts), so the crop
+    jumps cleanly at hard cuts instead of panning across them.
+    """
+    smoothed = np.empty_like(centers)
+    bounds = [0] + [c for c in sorted(cuts) if 0 < c < len(centers)] + [len(centers)]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        segment = centers[lo:hi]
+        k = min(window, len(segment))
+        if k <= 1:
+            smoothed[lo:hi] = segment
+            continue
+        padded = np.pad(segment, (k // 2, k - 1 - k // 2), mode='edge')
+        smoothed[lo:hi] = np.convolve(padded, np.ones(k) / k, mode='valid')
+    return smoothed
+
+
+def compute_face_trajectory(input_video_path, start_time=0, end_time=None, crop_width=None,
+                            interval=FACE_TRACK_INTERVAL, smoothing=FACE_TRACK_SMOOTHING, cuts=None):
+    """
+    Precompute a per-frame crop x position that follows faces.
+
+    Faces are detected (downscaled) only every `interval` seconds and on the
+    first frame after each cut in `cuts` (frame indices relative to
+    start_time). Between detections the face center is linearly
+    interpolated, within a shot only; the result is smoothed per shot and
+    converted to the crop's left edge.
+
+    Returns an int32 NumPy array with one x_start per frame, or None if no
+    face was found anywhere in the clip.
+    """
+    face_cascade = get_face_cascade()
+
+    cap = cv2.VideoCapture(input_video_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        print("Error: Could not open video.")
+        return None
+
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    first_frame = int(round(start_time * fps)) if start_time else 0
+    last_frame = total_frames if end_time is None else min(total_frames, int(round(end_time * fps)))
+    section_frames = max(0, last_frame - first_frame)
+    if crop_width is None:
+        crop_width = int(height * 9 / 16) - int(height * 9 / 16) % 2
+
+    cuts = sorted(set(c for c in (cuts or []) if 0 < c < section_frames))
+    cut_set = set(cuts)
+    step = max(1, int(round(interval * fps)))
+    schedule = sorted(set(range(0, section_frames, step)) | set(cuts))
+
+    # Sparse detection pass: grab() through the frames in between
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    position = 0
+    sample_frames = []
+    sample_centers = []
+    previous_x = None
+    for index in schedule:
+        while position < index:
+            if not cap.grab():
+                break
+            position += 1
+        ret, frame = cap.read()
+        if not ret:
+            break
+        position += 1
+        if index in cut_set:
+            previous_x = None  # New shot: don't bias towards the last shot's face
+        faces = detect_faces_downscaled(face_cascade, frame)
+        if faces:
+            x, y, w, h = pick_tracked_face(faces, previous_x)
+            previous_x = x + w // 2
+            sample_frames.append(index)
+            sample_centers.append(previous_x)
+    cap.release()
+
+    if not sample_frames:
+        return None
+    print(f"Face tracking: {len(sample_frames)}/{len(schedule)} sampled frames with a face")
+
+    return centers_to_track(sample_frames, sample_centers, section_frames, cuts, fps, width, crop_width, smoothing)
+
+
+def centers_to_track(sample_frames, sample_centers, section_frames, cuts, fps, width, crop_width, smoothing):
+    """
+    Turn face centers found on some frames into a per-frame crop x_start
+    (int32): interpolated and smoothed one shot at a time, so nothing is
+    blended across a cut. A shot without any detection holds the nearest
+    detected position.
+    """
+    sample_frames = np.asarray(sample_frames)
+    sample_centers = np.asarray(sample_centers, dtype=np.float64)
+    frames = np.arange(section_frames)
+    centers = np.empty(section_frames, dtype=np.float64)
+    bounds = [0] + cuts + [section_frames]
+    for lo, hi in zip(bounds[:-1], bounds[1:]):
+        in_shot = (sample_frames >= lo) & (sample_frames < hi)
+        if np.any(in_shot):
+            centers[lo:hi] = np.interp(frames[lo:hi], sample_frames[in_shot], sample_centers[in_shot])
+        else:
+            nearest = np.argmin(np.abs(sample_frames - lo))
+            centers[lo:hi] = sample_centers[nearest]
+
+    centers = smooth_trajectory(centers, cuts, max(1, int(round(smoothing * fps))))
+    x_starts = np.clip(centers + FACE_X_OFFSET - crop_width // 2, 0, width - crop_width)
+    return x_starts.astype(np.int32)
+
+
+def compute_speaker_trajectory(input_video_path, start_time=0, end_time=None, crop_width=None,
+                               smoothing=FACE_TRACK_SMOOTHING, cuts=None, vad=None):
+    """
+    Per-frame crop x_start that follows the active speaker found by the
+    batched SSD face detector (Speaker.analyze_speakers), the more accurate
+    alternative to compute_face_trajectory's Haar cascade. vad is the
+    VadTrack of the video's audio: the crop follows whoever moves their lips
+    while there is speech. Without it the crop follows the largest face.
+    Returns an int32 array, or None if no face was found.
+    """
+    speakers = analyze_speakers(input_video_path, start_time, end_time, vad_track=vad)
+    if speakers is None or not len(speakers):
+        return None
+    centers = speakers.centers()
+    found = ~np.isnan(centers)
+    if not np.any(found):
+        return None
+    if crop_width is None:
+        crop_width = int(speakers.height * 9 / 16) - int(speakers.height * 9 / 16) % 2
+    cuts = sorted(set(c for c in (cuts or []) if 0 < c < speakers.frame_count))
+    return centers_to_track(speakers.frames[found], centers[found], speakers.frame_count, cuts, speakers.fps,
+                            speakers.width, crop_width, smoothing)
+
+
+def plan_shot_crops(input_video_path, first_frame, section_frames, fps, cuts, original_width, vertical_width):
+    """
+    Static face-centered crop chosen separately for every shot between cuts.
+    Returns a per-frame int32 x_start array, or None if no shot has a face.
+    Shots without a face use the median position of the shots that have one.
+    """
+    bounds = [0] + cuts + [section_frames]
+    ranges = [((first_frame + lo) / fps, (first_frame + hi) / fps) for lo, hi in zip(bounds[:-1], bounds[1:])]
+    budget = max(5, FACE_SAMPLE_BUDGET // len(ranges))
+    print(f"Detecting face position per shot ({len(ranges)} shots)...")
+    shot_positions = detect_face_positions(input_video_path, ranges, sample_budget=budget)
+
+    medians = [int(sorted(p)[len(p) // 2]) for p in shot_positions if p]
+    if not medians:
+        return None
+    fallback = sorted(medians)[len(medians) // 2]
+
+    track = np.empty(section_frames, dtype=np.int32)
+    for (lo, hi), positions in zip(zip(bounds[:-1], bounds[1:]), shot_positions):
+        face_x = int(sorted(positions)[len(positions) // 2]) if positions else fallback
+        face_x += FACE_X_OFFSET
+        track[lo:hi] = max(0, min(face_x - vertical_width // 2, original_width - vertical_width))
+    return track
+
+
+def plan_vertical_crop(input_video_path, start_time=0, end_time=None, face_positions=None, track_faces=False, cuts=None,
+                       vad=None):
+    """
+    Decide how to crop a video (or a start_time-end_time section of it) to 9:16
+    without writing any frames.
+
+    Returns a dict describing the crop, consumed by apply_vertical_crop:
+        mode: 'static' (face-centered x_start), 'follow' (face tracking,
+              per-frame x_start in 'track') or 'track' (screen recording,
+              scaled frame with a per-frame x position in 'track')
+    or None if the video can't be opened / is too narrow.
+
+    face_positions: optional face center x positions already detected for
+    this clip (see detect_face_positions); skips the detection pass.
+    track_faces: follow faces over time (compute_face_trajectory) instead of
+    using one static position. With the SSD model available the crop
+    follows the active speaker, picked with vad (the VadTrack of the video's
+    audio) if given (see compute_speaker_trajectory).
+    cuts: shot boundaries (frame indices relative to start_time, see
+    ShotDetection.ShotIndex.cut_frames). No crop is smoothed across a cut:
+    the static crop is chosen per shot ('follow' mode with a stepped track)
+    and the face / motion trajectories restart at each cut.
+    """
+    cap = cv2.VideoCapture(input_video_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        print("Error: Could not open video.")
+        return None
 
     original_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     original_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     fps = cap.get(cv2.CAP_PROP_FPS)
     total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
 
+    # Restrict to the requested section (whole video by default)
+    first_frame = int(round(start_time * fps)) if start_time else 0
+    last_frame = total_frames if end_time is None else min(total_frames, int(round(end_time * fps)))
+    section_frames = max(0, last_frame - first_frame)
+
     vertical_height = int(original_height)
     vertical_width = int(vertical_height * 9 / 16)
     # Ensure dimensions are even (required by many codecs)
@@ -27,59 +340,217 @@ def crop_to_vertical(input_video_path, output_video_path):
 
     if original_width < vertical_width:
         print("Error: Original video width is less than the desired vertical width.")
-        return
+        cap.release()
+        return None
+
+    plan = {
+        'width': original_width,
+        'height': original_height,
+        'fps': fps,
+        'frames': section_frames,
+        'vertical_width': vertical_width,
+        'vertical_height': vertical_height,
+    }
+
+    if track_faces:
+        print("Tracking faces across the clip...")
+        track = None
+        if speaker_model_available():
+            track = compute_speaker_trajectory(input_video_path, start_time, end_time, vertical_width, cuts=cuts,
+                                               vad=vad)
+        if track is None:
+            track = compute_face_trajectory(input_video_path, start_time, end_time, vertical_width, cuts=cuts)
+        if track is not None:
+            print(f"✓ Face detected. Using face-tracking crop (x={track.min()}-{track.max()})")
+            plan['mode'] = 'follow'
+            plan['track'] = track
+            cap.release()
+            return plan
+        face_positions = []
+
+    cuts = sorted(set(c for c in (cuts or []) if 0 < c < section_frames))
+    if cuts and face_positions is None:
+        track = plan_shot_crops(input_video_path, first_frame, section_frames, fps, cuts,
+                                original_width, vertical_width)
+        if track is not None:
+            print(f"✓ Face detected. Using per-shot crop across {len(cuts) + 1} shots")
+            plan['mode'] = 'follow'
+            plan['track'] = track
+            cap.release()
+            return plan
+        face_positions = []
+
+    # Detect face position on frames sampled across the clip to determine static crop position
+    if face_positions is None:
+        print("Detecting face position for static crop...")
+        face_positions = detect_face_positions(input_video_path, [(start_time, end_time)])[0]
 
-    # Detect face position in first 30 frames to determine static crop position
-    print("Detecting face position for static crop...")
-    face_positions = []
-    for i in range(min(30, total_frames)):
-        ret, frame = cap.read()
-        if not ret:
-            break
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        faces = face_cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=8, minSize=(30, 30))
-        if len(faces) > 0:
-            # Get largest face
-            best_face = max(faces, key=lambda f: f[2] * f[3])
-            x, y, w, h = best_face
-            face_center_x = x + w // 2
-            face_positions.append(face_center_x)
-    
     # Calculate static crop position
     if face_positions:
         # Use median face position for stability
         avg_face_x = int(sorted(face_positions)[len(face_positions) // 2])
         # Offset slightly to the right to prevent right-side cutoff
-        avg_face_x += 60
+        avg_face_x += FACE_X_OFFSET
         x_start = max(0, min(avg_face_x - vertical_width // 2, original_width - vertical_width))
         print(f"✓ Face detected. Using face-centered crop at x={x_start}")
-        use_motion_tracking = False
-    else:
-        # No face detected - likely a screen recording
-        # Scale so exactly half the width is visible, then track motion
-        print(f"✗ No face detected. Using half-width with motion tracking for screen recording")
-        use_motion_tracking = True
-        x_start = 0  # Initial position, will be updated by tracking
-    
-    # Reset video to beginning
-    cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
-
-    # For screen recordings, calculate scale factor for half-width display
-    if use_motion_tracking:
-        # Scale so original width fits into vertical_width
-        target_display_width = original_width * 0.67
-        scale = vertical_width / target_display_width
+        plan['mode'] = 'static'
+        plan['x_start'] = x_start
+        cap.release()
+        return plan
+
+    # No face detected - likely a screen recording
+    # Scale so exactly half the width is visible, then track motion
+    print(f"✗ No face detected. Using half-width with motion tracking for screen recording")
+
+    # Scale so original width fits into vertical_width
+    target_display_width = original_width * 0.67
+    scale = vertical_width / target_display_width
+    scaled_width = int(original_width * scale)
+    scaled_height = int(original_height * scale)
+
+    # If scaled height exceeds vertical height, adjust scale
+    if scaled_height > vertical_height:
+        scale = vertical_height / original_height
         scaled_width = int(original_width * scale)
         scaled_height = int(original_height * scale)
-        
-        # If scaled height exceeds vertical height, adjust scale
-        if scaled_height > vertical_height:
-            scale = vertical_height / original_height
-            scaled_width = int(original_width * scale)
-            scaled_height = int(original_height * scale)
-        
-        print(f"Scaling video from {original_width}x{original_height} to {scaled_width}x{scaled_height}")
-        print(f"Half-width display: showing {scaled_width//2}px wide section from {scaled_width}px scaled frame")
+
+    print(f"Scaling video from {original_width}x{original_height} to {scaled_width}x{scaled_height}")
+    print(f"Half-width display: showing {scaled_width//2}px wide section from {scaled_width}px scaled frame")
+
+    # Calculate update interval for motion tracking (max 1 shift per second)
+    update_interval = max(1, int(fps))
+    print(f"Motion tracking: updating every {update_interval} frames (~1 shift/second)")
+
+    # Motion is estimated on a small gray copy of the frame
+    analysis_width = min(MOTION_ANALYSIS_WIDTH, original_width)
+    analysis_height = max(1, int(round(original_height * analysis_width / original_width)))
+    analysis_scale = scaled_width / analysis_width
+    motion_threshold = MOTION_THRESHOLD / analysis_scale
+
+    # Precompute the crop x position for every frame. Only one frame per
+    # update interval is decoded and analysed, the rest are skipped with grab().
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    track = np.zeros(section_frames, dtype=np.int32)
+    smoothed_x = 0  # Smoothed horizontal position in scaled coordinates
+    prev_gray = None
+    cut_set = set(cuts)
+    jump = True  # take the first motion target directly instead of easing into it
+    for frame_count in range(section_frames):
+        if frame_count in cut_set:
+            # New shot: don't compute flow across the cut, restart the smoothing
+            prev_gray = None
+            jump = True
+        if frame_count % update_interval == 0 or frame_count in cut_set:
+            ret, frame = cap.read()
+            if not ret:
+                track = track[:frame_count]
+                break
+            curr_gray = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (analysis_width, analysis_height),
+                                   interpolation=cv2.INTER_AREA)
+
+            if prev_gray is not None:
+                center = motion_center(prev_gray, curr_gray, motion_threshold)
+                if center is not None:
+                    motion_x = int(center * analysis_scale)
+                    # Target x position to center motion in the crop
+                    target_x = max(0, min(motion_x - vertical_width // 2, scaled_width - vertical_width))
+
+                    # Smooth tracking (90% previous, 10% new)
+                    smoothed_x = target_x if jump else int(0.90 * smoothed_x + 0.10 * target_x)
+                    jump = False
+
+            prev_gray = curr_gray
+        elif not cap.grab():
+            track = track[:frame_count]
+            break
+        track[frame_count] = smoothed_x
+
+    cap.release()
+    plan['mode'] = 'track'
+    plan['scaled_width'] = scaled_width
+    plan['scaled_height'] = scaled_height
+    plan['track'] = track
+    return plan
+
+
+def apply_vertical_crop(frame, plan, frame_index):
+    """Crop one full-resolution frame according to a plan from plan_vertical_crop"""
+    vertical_width = plan['vertical_width']
+    vertical_height = plan['vertical_height']
+
+    if plan['mode'] == 'track':
+        scaled_width = plan['scaled_width']
+        scaled_height = plan['scaled_height']
+
+        track = plan['track']
+        smoothed_x = track[min(frame_index, len(track) - 1)] if len(track) else 0
+
+        # Crop from scaled frame
+        crop_x_start = int(smoothed_x)
+        crop_x_end = min(crop_x_start + vertical_width, scaled_width)
+
+        # Ensure we get full width
+        if crop_x_end - crop_x_start < vertical_width:
+            crop_x_start = max(0, crop_x_end - vertical_width)
+
+        # Only the visible columns are scaled: map the crop window back to the
+        # full-resolution frame and resize that slice (area filter when shrinking)
+        scale = scaled_width / frame.shape[1]
+        src_start = int(crop_x_start / scale)
+        src_end = min(frame.shape[1], max(src_start + 1, int(round(crop_x_end / scale))))
+        interpolation = cv2.INTER_AREA if scale < 1 else cv2.INTER_LINEAR
+        cropped_frame = cv2.resize(frame[:, src_start:src_end], (crop_x_end - crop_x_start, scaled_height),
+                                   interpolation=interpolation)
+
+        # If scaled height is less than vertical height, add letterboxing
+        if scaled_height < vertical_height:
+            canvas = np.zeros((vertical_height, vertical_width, 3), dtype=np.uint8)
+            offset_y = (vertical_height - scaled_height) // 2
+            canvas[offset_y:offset_y+scaled_height, :cropped_frame.shape[1]] = cropped_frame
+            cropped_frame = canvas
+        elif scaled_height > vertical_height:
+            # Crop height from top
+            cropped_frame = cropped_frame[:vertical_height, :]
+    elif plan['mode'] == 'follow':
+        # Face tracking: per-frame x from the precomputed trajectory
+        track = plan['track']
+        x_start = int(track[min(frame_index, len(track) - 1)])
+        cropped_frame = frame[:vertical_height, x_start:x_start+vertical_width]
+    else:
+        # Face-detected videos: static crop
+        x_start = plan['x_start']
+        cropped_frame = frame[:vertical_height, x_start:x_start+vertical_width]
+
+    # Ensure frame matches expected dimensions
+    if cropped_frame.shape[1] > 0 and (cropped_frame.shape[0] != vertical_height or cropped_frame.shape[1] != vertical_width):
+        cropped_frame = cv2.resize(cropped_frame, (vertical_width, vertical_height), interpolation=cv2.INTER_LANCZOS4)
+
+    return cropped_frame
+
+
+def crop_to_vertical(input_video_path, output_video_path, face_positions=None, track_faces=False, cuts=None,
+                     cancel=None, vad=None):
+    """
+    Crop video to vertical 9:16 format with static face detection (or face
+    tracking if track_faces, following the speaker given the VadTrack vad of
+    the video's audio). Returns the frame rate written, for combine_videos,
+    or None on failure. Setting the optional cancel Event stops between
+    frames (and returns None).
+    """
+    plan = plan_vertical_crop(input_video_path, face_positions=face_positions, track_faces=track_faces, cuts=cuts,
+                              vad=vad)
+    if plan is None:
+        return
+
+    cap = cv2.VideoCapture(input_video_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        print("Error: Could not open video.")
+        return
+
+    fps = plan['fps']
+    total_frames = plan['frames']
+    vertical_width = plan['vertical_width']
+    vertical_height = plan['vertical_height']
 
     # Write output - use XVID for better Windows compatibility
     import platform
@@ -88,99 +559,41 @@ def crop_to_vertical(input_video_path, output_video_path):
     else:
         fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(output_video_path, fourcc, fps, (vertical_width, vertical_height))
-    global Fps
-    Fps = fps
 
     frame_count = 0
-    smoothed_x = 0  # Smoothed horizontal position in scaled coordinates
-    prev_gray = None
-    
-    # Calculate update interval for motion tracking (max 1 shift per second)
-    if use_motion_tracking:
-        update_interval = int(fps)  # Update once per second
-        print(f"Motion tracking: updating every {update_interval} frames (~1 shift/second)")
-    
+    cancelled = False
     while True:
+        if cancel is not None and cancel.is_set():
+            cancelled = True
+            break
         ret, frame = cap.read()
         if not ret:
             break
-        
-        if use_motion_tracking:
-            # Resize frame first
-            resized_frame = cv2.resize(frame, (scaled_width, scaled_height), interpolation=cv2.INTER_LANCZOS4)
-            
-            # Update motion tracking once per second
-            if frame_count % update_interval == 0:
-                curr_gray = cv2.cvtColor(resized_frame, cv2.COLOR_BGR2GRAY)
-                
-                if prev_gray is not None:
-                    # Calculate optical flow
-                    flow = cv2.calcOpticalFlowFarneback(prev_gray, curr_gray, None,
-                                                         0.5, 3, 15, 3, 5, 1.2, 0)
-                    magnitude = np.sqrt(flow[..., 0]**2 + flow[..., 1]**2)
-                    
-                    # Focus on significant motion
-                    motion_threshold = 2.0
-                    significant_motion = magnitude > motion_threshold
-                    
-                    if np.any(significant_motion):
-                        # Weight columns by motion
-                        col_motion = np.sum(magnitude * significant_motion, axis=0)
-                        
-                        if np.sum(col_motion) > 0:
-                            motion_x = int(np.average(np.arange(scaled_width), weights=col_motion))
-                            # Target x position to center motion in the crop
-                            target_x = max(0, min(motion_x - vertical_width // 2, scaled_width - vertical_width))
-                            
-                            # Smooth tracking (90% previous, 10% new)
-                            smoothed_x = int(0.90 * smoothed_x + 0.10 * target_x)
-                
-                prev_gray = curr_gray
-            
-            # Crop from scaled frame
-            crop_x_start = int(smoothed_x)
-            crop_x_end = min(crop_x_start + vertical_width, scaled_width)
-            
-            # Ensure we get full width
-            if crop_x_end - crop_x_start < vertical_width:
-                crop_x_start = max(0, crop_x_end - vertical_width)
-            
-            cropped_frame = resized_frame[:, crop_x_start:crop_x_end]
-            
-            # If scaled height is less than vertical height, add letterboxing
-            if scaled_height < vertical_height:
-                canvas = np.zeros((vertical_height, vertical_width, 3), dtype=np.uint8)
-                offset_y = (vertical_height - scaled_height) // 2
-                canvas[offset_y:offset_y+scaled_height, :] = cropped_frame
-                cropped_frame = canvas
-            elif scaled_height > vertical_height:
-                # Crop height from top
-                cropped_frame = cropped_frame[:vertical_height, :]
-        else:
-            # Face-detected videos: static crop
-            cropped_frame = frame[:, x_start:x_start+vertical_width]
-        
+
+        cropped_frame = apply_vertical_crop(frame, plan, frame_count)
+
         if cropped_frame.shape[1] == 0:
             print(f"Warning: Empty crop at frame {frame_count}")
             break
 
-        # Ensure frame matches expected dimensions before writing
-        if cropped_frame.shape[0] != vertical_height or cropped_frame.shape[1] != vertical_width:
-            cropped_frame = cv2.resize(cropped_frame, (vertical_width, vertical_height), interpolation=cv2.INTER_LANCZOS4)
-
         out.write(cropped_frame)
         frame_count += 1
-        
+
         if frame_count % 100 == 0:
             print(f"Processed {frame_count}/{total_frames} frames")
 
     cap.release()
     out.release()
+    if cancelled:
+        print(f"Cropping of {output_video_path} cancelled after {frame_count} frames")
+        return None
     print(f"Cropping complete. Processed {frame_count} frames -> {output_video_path}")
+    return fps
 
 
 
-def combine_videos(video_with_audio, video_without_audio, output_filename):
+def combine_videos(video_with_audio, video_without_audio, output_filename, fps=None):
+    """Mux the audio of one video onto another; fps defaults to the silent video's frame rate"""
     try:
         # Load video clips
         clip_with_audio = VideoFileClip(video_with_audio)
@@ -190,8 +603,8 @@ def combine_videos(video_with_audio, video_without_audio, output_filename):
 
         combined_clip = clip_without_audio.set_audio(audio)
 
-        global Fps
-        combined_clip.write_videofile(output_filename, codec='libx264', audio_codec='aac', fps=Fps, preset='medium', bitrate='3000k')
+        combined_clip.write_videofile(output_filename, codec='libx264', audio_codec='aac',
+                                      fps=fps or clip_without_audio.fps, preset='medium', bitrate='3000k')
         print(f"Combined video saved successfully as {output_filename}")
     
     except Exception as e:
@@ -204,8 +617,8 @@ if __name__ == "__main__":
     output_video_path = 'Croped_output_video.mp4'
     final_video_path = 'final_video_with_audio.mp4'
     detect_faces_and_speakers(input_video_path, "DecOut.mp4")
-    crop_to_vertical(input_video_path, output_video_path)
-    combine_videos(input_video_path, output_video_path, final_video_path)
+    fps = crop_to_vertical(input_video_path, output_video_path)
+    combine_videos(input_video_path, output_video_path, final_video_path, fps)
 
 
 
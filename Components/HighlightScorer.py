@@ -0,0 +1,217 @@
+import re
+import numpy as np
+from Components.Edit import load_audio, AUDIO_SAMPLE_RATE
+from Components.VoiceActivity import get_vad_track
+
+# Candidate clip lengths in seconds (the LLM prompt asks for ~2 minutes;
+# shorter clips in the 30-90s range are preferred)
+HIGHLIGHT_MIN_SECONDS = 30
+HIGHLIGHT_MAX_SECONDS = 120
+HIGHLIGHT_TARGET_SECONDS = 60
+
+# Relative weight of each feature in the window score. Features are
+# standardized across all candidate windows of a video before weighting.
+HIGHLIGHT_WEIGHTS = {
+    'density': 1.0,       # words per second
+    'cues': 1.5,          # "hook" words per word
+    'qa': 0.75,           # a question that gets answered inside the window
+    'complete': 1.5,      # starts and ends on sentence boundaries
+    'energy': 0.75,       # loudness relative to the rest of the video
+    'length': 0.5,        # closeness to HIGHLIGHT_TARGET_SECONDS
+}
+
+# Words that tend to mark a hook, a strong claim or a story beat
+CUE_WORDS = {
+    "secret", "secrets", "mistake", "mistakes", "never", "always", "best", "worst", "biggest",
+    "most", "important", "truth", "actually", "surprising", "shocking", "crazy", "insane",
+    "why", "how", "because", "problem", "lesson", "learned", "realized", "story", "finally",
+    "first", "only", "nobody", "everyone", "stop", "wrong", "right", "money", "million",
+    "billion", "free", "fail", "failed", "win", "changed", "tip", "trick", "hack", "rule",
+}
+
+WORD_RE = re.compile(r"[a-z0-9']+")
+SENTENCE_END = ('.', '!', '?')
+
+
+def segment_features(segments):
+    """
+    Per-segment arrays: word count, cue-word count, is-question, ends-sentence.
+    segments is a list of [text, start, end].
+    """
+    n = len(segments)
+    words = np.zeros(n)
+    cues = np.zeros(n)
+    questions = np.zeros(n, dtype=bool)
+    ends_sentence = np.zeros(n, dtype=bool)
+    for i, (text, start, end) in enumerate(segments):
+        tokens = WORD_RE.findall(text.lower())
+        words[i] = len(tokens)
+        cues[i] = sum(1 for t in tokens if t in CUE_WORDS or t.isdigit())
+        stripped = text.strip()
+        questions[i] = stripped.endswith('?')
+        ends_sentence[i] = stripped.endswith(SENTENCE_END)
+    return words, cues, questions, ends_sentence
+
+
+def segment_energies(segments, audio_path, frame_seconds=0.1):
+    """
+    Mean RMS loudness of each segment, from 100ms frames of the 16kHz mono
+    audio (int16 samples are never expanded to float for the whole file).
+    """
+    audio = load_audio(audio_path, AUDIO_SAMPLE_RATE)
+    frame = int(AUDIO_SAMPLE_RATE * frame_seconds)
+    n_frames = len(audio) // frame
+    if n_frames == 0:
+        return np.zeros(len(segments))
+    rms = np.empty(n_frames, dtype=np.float32)
+    # Blocks of frames keep the float temporaries small
+    block = 6000
+    for lo in range(0, n_frames, block):
+        hi = min(n_frames, lo + block)
+        chunk = audio[lo * frame:hi * frame].reshape(hi - lo, frame).astype(np.float32)
+        rms[lo:hi] = np.sqrt(np.square(chunk).mean(axis=1))
+    cumulative = np.concatenate([[0.0], np.cumsum(rms, dtype=np.float64)])
+
+    energies = np.zeros(len(segments))
+    for i, (text, start, end) in enumerate(segments):
+        a = min(n_frames, int(start / frame_seconds))
+        b = min(n_frames, max(a + 1, int(np.ceil(end / frame_seconds))))
+        if b > a:
+            energies[i] = (cumulative[b] - cumulative[a]) / (b - a)
+    return energies
+
+
+def _standardize(values):
+    std = values.std()
+    return (values - values.mean()) / std if std > 0 else np.zeros_like(values)
+
+
+def score_windows(segments, energies=None, min_seconds=HIGHLIGHT_MIN_SECONDS, max_seconds=HIGHLIGHT_MAX_SECONDS,
+                  target_seconds=HIGHLIGHT_TARGET_SECONDS, weights=None, vad=None):
+    """
+    Score every candidate window of consecutive segments lasting between
+    min_seconds and max_seconds.
+
+    Window sums come from prefix sums over per-segment features, so each
+    candidate costs O(1). With a VadTrack of the audio (vad), the speech
+    coverage of a window is measured from voice activity instead of from
+    the segment timestamps. Returns (scores, window_starts, window_ends) arrays
+    in seconds, highest score first. Deterministic for a given input.
+    """
+    weights = {**HIGHLIGHT_WEIGHTS, **(weights or {})}
+    if not segments:
+        return np.zeros(0), np.zeros(0), np.zeros(0)
+
+    starts = np.array([s[1] for s in segments], dtype=np.float64)
+    ends = np.array([s[2] for s in segments], dtype=np.float64)
+    words, cues, questions, ends_sentence = segment_features(segments)
+    # A segment starts a sentence if it's the first or the previous one ended one
+    starts_sentence = np.concatenate([[True], ends_sentence[:-1]])
+
+    def prefix(values):
+        return np.concatenate([[0.0], np.cumsum(values, dtype=np.float64)])
+
+    words_sum, cues_sum, questions_sum = prefix(words), prefix(cues), prefix(questions)
+    speech_sum = prefix(ends - starts)
+    energy_sum = prefix(energies) if energies is not None else None
+
+    # All (i, j) pairs: window from segment i through segment j
+    i_idx, j_idx = [], []
+    for i in range(len(segments)):
+        # Last segment whose end is within max_seconds of this start
+        j_max = int(np.searchsorted(ends, starts[i] + max_seconds, side='right')) - 1
+        j_min = int(np.searchsorted(ends, starts[i] + min_seconds, side='left'))
+        if j_min <= j_max:
+            j = np.arange(j_min, j_max + 1)
+            i_idx.append(np.full(len(j), i))
+            j_idx.append(j)
+    if not i_idx:
+        # Transcript shorter than min_seconds: the whole thing is the only candidate
+        i_idx, j_idx = [np.array([0])], [np.array([len(segments) - 1])]
+    i_idx = np.concatenate(i_idx)
+    j_idx = np.concatenate(j_idx)
+
+    duration = np.maximum(ends[j_idx] - starts[i_idx], 1e-3)
+    count = (j_idx - i_idx + 1).astype(np.float64)
+    n_words = words_sum[j_idx + 1] - words_sum[i_idx]
+
+    density = n_words / duration
+    cue_rate = (cues_sum[j_idx + 1] - cues_sum[i_idx]) / np.maximum(n_words, 1)
+    # Questions before the last segment are answered inside the window
+    answered = questions_sum[j_idx] - questions_sum[i_idx]
+    qa = np.minimum(answered, 2) - 0.5 * questions[j_idx]
+    complete = starts_sentence[i_idx].astype(np.float64) + ends_sentence[j_idx]
+    length = -np.abs(duration - target_seconds) / target_seconds
+    # Long silences inside a window make a poor short
+    if vad is not None and len(vad):
+        coverage = vad.speech_ratio(starts[i_idx], ends[j_idx])
+    else:
+        coverage = (speech_sum[j_idx + 1] - speech_sum[i_idx]) / duration
+
+    score = (weights['density'] * _standardize(density * np.minimum(coverage, 1))
+             + weights['cues'] * _standardize(cue_rate)
+             + weights['qa'] * _standardize(qa)
+             + weights['complete'] * _standardize(complete)
+             + weights['length'] * _standardize(length))
+    if energy_sum is not None:
+        energy = (energy_sum[j_idx + 1] - energy_sum[i_idx]) / count
+        score += weights['energy'] * _standardize(energy)
+
+    # Stable sort so ties resolve to the earliest window
+    order = np.argsort(-score, kind='stable')
+    return score[order], starts[i_idx][order], ends[j_idx][order]
+
+
+def top_highlights(segments, k=1, audio_path=None, exclude=None, min_seconds=HIGHLIGHT_MIN_SECONDS,
+                   max_seconds=HIGHLIGHT_MAX_SECONDS, target_seconds=HIGHLIGHT_TARGET_SECONDS, weights=None):
+    """
+    Pick the k best non-overlapping windows, offline.
+
+    Args:
+        segments: List of [text, start, end] (seconds)
+        k: Number of highlights
+        audio_path: Optional 16kHz mono audio for the loudness and speech coverage features
+        exclude: Optional (start_ms, end_ms) ranges to skip (e.g. ones already rejected)
+    Returns:
+        List of (start_ms, end_ms) integer tuples, best first
+    """
+    energies = None
+    vad = None
+    if audio_path:
+        try:
+            energies = segment_energies(segments, audio_path)
+            vad = get_vad_track(audio_path)
+        except Exception as e:
+            print(f"Warning: Could not read audio for loudness scoring: {e}")
+
+    scores, starts, ends = score_windows(segments, energies, min_seconds, max_seconds, target_seconds, weights, vad)
+    taken = [(s / 1000, e / 1000) for s, e in (exclude or [])]
+    selected = []
+    for start, end in zip(starts, ends):
+        if any(start < e and s < end for s, e in taken):
+            continue
+        taken.append((start, end))
+        selected.append((int(round(start * 1000)), int(round(end * 1000))))
+        if len(selected) == k:
+            break
+    return selected
+
+
+def prefilter_segments(segments, keep=5, padding_seconds=30, audio_path=None):
+    """
+    Reduce a transcript to the neighbourhood of its `keep` best local
+    candidates (plus padding on each side) before sending it to the LLM.
+    Returns the kept segments in time order.
+    """
+    windows = top_highlights(segments, keep, audio_path)
+    if not windows:
+        return segments
+    ranges = [(s / 1000 - padding_seconds, e / 1000 + padding_seconds) for s, e in windows]
+    return [seg for seg in segments if any(seg[2] > lo and seg[1] < hi for lo, hi in ranges)]
+
+
+if __name__ == "__main__":
+    sample = [[f" Sentence number {i} is here.", i * 5.0, i * 5.0 + 4.5] for i in range(60)]
+    sample[20][0] = " Why does nobody talk about the biggest mistake?"
+    sample[21][0] = " Because the truth is actually simple."
+    print(top_highlights(sample, k=3))
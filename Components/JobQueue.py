@@ -0,0 +1,122 @@
+import contextlib
+import json
+import sqlite3
+import time
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueue:
+    """
+    Local job queue in a SQLite table, shared by `main.py --enqueue` and one or
+    more `main.py --worker` processes.
+
+    Every operation uses its own short-lived connection, so the queue can be
+    used from several threads and processes at once. Each job records its
+    current stage, its outputs and any error, which is what `--status` shows.
+    """
+
+    def __init__(self, db_path="jobs.db"):
+        self.db_path = db_path
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    url TEXT NOT NULL,
+                    options TEXT NOT NULL DEFAULT '{}',
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    stage TEXT,
+                    outputs TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+                """
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, id)")
+
+    @contextlib.contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def add(self, url, options=None):
+        """Queue a URL or local file; returns the job id"""
+        now = time.time()
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "INSERT INTO jobs (url, options, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (url, json.dumps(options or {}), QUEUED, now, now),
+            )
+            return cursor.lastrowid
+
+    def claim(self):
+        """Atomically take the oldest queued job, or return None if there is none"""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY id LIMIT 1", (QUEUED,)
+                ).fetchone()
+                if row is not None:
+                    conn.execute(
+                        "UPDATE jobs SET status = ?, updated_at = ? WHERE id = ?",
+                        (RUNNING, time.time(), row["id"]),
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if row is None:
+            return None
+
+        job = dict(row)
+        job["options"] = json.loads(job["options"] or "{}")
+        job["status"] = RUNNING
+        return job
+
+    def set_stage(self, job_id, stage):
+        self._update(job_id, stage=stage)
+
+    def finish(self, job_id, outputs):
+        self._update(job_id, status=DONE, stage=None, outputs=json.dumps(outputs))
+
+    def fail(self, job_id, error):
+        self._update(job_id, status=FAILED, error=str(error))
+
+    def requeue_running(self):
+        """Put jobs left 'running' by a worker that died back in the queue"""
+        with self._connect() as conn:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = ?, stage = NULL, updated_at = ? WHERE status = ?",
+                (QUEUED, time.time(), RUNNING),
+            )
+            return cursor.rowcount
+
+    def _update(self, job_id, **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def jobs(self, status=None):
+        with self._connect() as conn:
+            if status:
+                rows = conn.execute("SELECT * FROM jobs WHERE status = ? ORDER BY id", (status,)).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY id").fetchall()
+        return [dict(row) for row in rows]
+
+    def counts(self):
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
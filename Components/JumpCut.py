@@ -0,0 +1,135 @@
+import re
+import numpy as np
+from Components.WordTimings import WordTimings
+
+# Pauses shorter than this stay in (natural gaps between words and sentences)
+JUMPCUT_MIN_SILENCE = 0.35
+# Audio kept on each side of speech so word onsets and tails aren't clipped
+JUMPCUT_PADDING = 0.08
+# Kept pieces shorter than this are dropped
+JUMPCUT_MIN_KEEP = 0.15
+
+FILLER_WORDS = {"um", "umm", "uh", "uhh", "uhm", "erm", "er", "ah", "hmm", "mm", "mhm"}
+FILLER_RE = re.compile(r"\b(?:" + "|".join(sorted(FILLER_WORDS, key=len, reverse=True)) + r")\b[,.]?\s*",
+                       re.IGNORECASE)
+
+
+def is_filler(word):
+    return word.strip().strip(".,!?").lower() in FILLER_WORDS
+
+
+def merge_ranges(ranges, min_gap=0.0):
+    """Sort (start, end) ranges and merge the ones that overlap or are less than min_gap apart"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start - merged[-1][1] < min_gap:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        elif end > start:
+            merged.append((start, end))
+    return merged
+
+
+def subtract_ranges(ranges, holes):
+    """Parts of sorted, disjoint ranges not covered by any of holes"""
+    result = []
+    holes = merge_ranges(holes)
+    for start, end in ranges:
+        for hole_start, hole_end in holes:
+            if hole_end <= start or hole_start >= end:
+                continue
+            if hole_start > start:
+                result.append((start, hole_start))
+            start = max(start, hole_end)
+        if end > start:
+            result.append((start, end))
+    return result
+
+
+def compute_keep_intervals(start, end, vad=None, segments=None, words=None, fps=None,
+                           min_silence=JUMPCUT_MIN_SILENCE, padding=JUMPCUT_PADDING, min_keep=JUMPCUT_MIN_KEEP,
+                           remove_fillers=True):
+    """
+    The parts of the clip [start, end) (source seconds) to keep for a
+    jump-cut version: speech, padded, with pauses longer than min_silence
+    and (given word timings) filler words cut out.
+
+    Speech comes from the VadTrack when given - Whisper's segment times
+    include most pauses - otherwise from the transcript segments. With fps
+    the boundaries are snapped to the clip's frame grid, so each kept
+    piece has exactly as much audio as video.
+
+    Returns a list of (start, end) ranges in source seconds; the whole clip
+    if no speech was found.
+    """
+    if vad is not None and len(vad):
+        speech = vad.speech_ranges(start, end, min_silence)
+    else:
+        speech = merge_ranges([(max(s, start), min(e, end)) for _, s, e in segments or [] if e > start and s < end],
+                              min_silence)
+    keep = merge_ranges([(max(start, s - padding), min(end, e + padding)) for s, e in speech], min_silence)
+
+    if remove_fillers and words is not None and len(words):
+        fillers = [(s, e) for word, s, e in words.words_between(start, end) if is_filler(word)]
+        keep = subtract_ranges(keep, fillers)
+
+    keep = [(s, e) for s, e in keep if e - s >= min_keep]
+    if fps:
+        snapped = [(start + round((s - start) * fps) / fps, start + round((e - start) * fps) / fps) for s, e in keep]
+        keep = merge_ranges([(s, e) for s, e in snapped if e > s])
+    return keep or [(start, end)]
+
+
+def remap_times(times, keep):
+    """
+    Output times (seconds from the start of the cut clip) for source times.
+    A time inside a cut maps to the start of the next kept piece.
+    """
+    starts = np.array([s for s, _ in keep], dtype=np.float64)
+    ends = np.array([e for _, e in keep], dtype=np.float64)
+    offsets = np.concatenate([[0.0], np.cumsum(ends - starts)])
+    t = np.asarray(times, dtype=np.float64)
+    i = np.minimum(np.searchsorted(ends, t, side='right'), len(keep) - 1)
+    out = offsets[i] + np.clip(t - starts[i], 0.0, ends[i] - starts[i])
+    return np.where(t >= ends[-1], offsets[-1], out)
+
+
+def kept_duration(keep):
+    return sum(e - s for s, e in keep)
+
+
+def remap_transcriptions(transcriptions, keep, remove_fillers=True):
+    """
+    [text, start, end] cues in output time of the cut clip (so they render
+    with video_start_time=0). Cues that fall entirely inside cuts are
+    dropped; filler words are removed from the text.
+    """
+    if not transcriptions:
+        return []
+    starts = remap_times([cue[1] for cue in transcriptions], keep)
+    ends = remap_times([cue[2] for cue in transcriptions], keep)
+    remapped = []
+    for (text, _, _), start, end in zip(transcriptions, starts, ends):
+        if remove_fillers:
+            text = FILLER_RE.sub("", text).strip()
+        if end - start > 0.05 and text:
+            remapped.append([text, float(start), float(end)])
+    return remapped
+
+
+def remap_words(words, keep, remove_fillers=True):
+    """WordTimings in output time of the cut clip, without cut or filler words"""
+    items = [(w, s, e) for w, s, e in words.words_between(keep[0][0] - 0.05, keep[-1][1])
+             if not (remove_fillers and is_filler(w))]
+    if not items:
+        return WordTimings()
+    starts = remap_times([s for _, s, _ in items], keep)
+    ends = remap_times([e for _, _, e in items], keep)
+    return WordTimings.from_words((w, float(s), float(e))
+                                  for (w, _, _), s, e in zip(items, starts, ends) if e > s)
+
+
+if __name__ == "__main__":
+    sample = [[" Um, so this is the point.", 10.0, 13.0], [" And here is another one.", 15.5, 18.0]]
+    keep = compute_keep_intervals(10.0, 20.0, segments=sample, fps=30)
+    print(keep, kept_duration(keep))
+    print(remap_transcriptions(sample, keep))
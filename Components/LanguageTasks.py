@@ -1,13 +1,27 @@
 from pydantic import BaseModel,Field
+from typing import List
 from dotenv import load_dotenv
+import asyncio
+import hashlib
+import json
 import os
+import random
+import threading
+import time
+from queue import Queue
+from Components.Cache import DiskCache, make_key
+from Components.TranscriptWindows import iter_sentences, format_compact, iter_token_windows, estimate_tokens
 
 load_dotenv()
 
 api_key = os.getenv("OPENAI_API")
 
-if not api_key:
-    raise ValueError("API key not found. Make sure it is defined in the .env file.")
+
+def require_api_key():
+    # Checked per call rather than at import, so offline highlight scoring
+    # (Components/HighlightScorer.py) works without a key
+    if not api_key:
+        raise ValueError("API key not found. Make sure it is defined in the .env file.")
 
 class JSONResponse(BaseModel):
     """
@@ -38,48 +52,293 @@ Return a JSON object with the following structure:
     end: "End time of the segment in seconds (number)"
 }}]
 
-## Input
-{Transcription}
+The timestamped transcription is the user message.
+"""
+
+class HighlightsResponse(BaseModel):
+    """
+    The response should strictly follow the following structure: -
+     {
+        highlights: [
+            {start: "Start time of the clip", content: "Highlight Text", end: "End Time for the highlighted clip"},
+            ...
+        ]
+     }
+    """
+    highlights: List[JSONResponse] = Field(description="Non-overlapping highlight segments, most interesting first")
+
+system_multi = """
+The input contains a timestamped transcription of a video.
+Select {Count} different, non-overlapping 2-minute segments from the transcription that each contain something interesting, useful, surprising, controversial, or thought-provoking.
+Order them from most to least interesting.
+The selected text should contain only complete sentences.
+Do not cut the sentences in the middle.
+Each selected segment should form a complete thought on its own.
+Return a JSON object with the following structure:
+## Output 
+{{
+  highlights: [{{
+    start: "Start time of the segment in seconds (number)",
+    content: "The transcribed text from the selected segment (clean text only, NO timestamps)",
+    end: "End time of the segment in seconds (number)"
+  }}]
+}}
+
+The timestamped transcription is the user message.
 """
 
 # User = """
 # Example
 # """
 
+# Chat model and endpoint. OPENAI_BASE_URL points the client at any server
+# that speaks the OpenAI chat completions API (e.g. a local stub for testing).
+LLM_MODEL = os.getenv("OPENAI_MODEL", "gpt-4o-mini")  # Cost-effective model
+LLM_TEMPERATURE = 1.0
+LLM_BASE_URL = os.getenv("OPENAI_BASE_URL") or None
+LLM_TIMEOUT = 120
+
+# Requests in flight at once, request rate cap and retries per request
+LLM_MAX_CONCURRENCY = 4
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("OPENAI_RPM", "500"))
+LLM_MAX_RETRIES = 4
+LLM_BACKOFF_SECONDS = 1.0
+LLM_MAX_BACKOFF_SECONDS = 30.0
+
+LLM_CACHE_DIR = os.getenv("LLM_CACHE_DIR", os.path.join(".cache", "llm"))
+llm_cache = DiskCache(LLM_CACHE_DIR, max_bytes=20 * 1024 * 1024)
+
+
+class RateLimiter:
+    """
+    Token bucket for an asyncio loop: up to `burst` requests start at once,
+    then one more every 60/per_minute seconds. per_minute=0 disables it.
+    """
+
+    def __init__(self, per_minute, burst=1):
+        self.rate = per_minute / 60.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = None
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        while True:
+            now = loop.time()
+            if self._updated is not None:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+def _is_transient(error):
+    """Connection errors, timeouts, 408/409/429 and 5xx are worth retrying"""
+    import openai
+    if isinstance(error, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def _retry_delay(error, attempt):
+    """Retry-After if the server sent one, else exponential backoff with jitter"""
+    response = getattr(error, 'response', None)
+    if response is not None:
+        try:
+            return min(LLM_MAX_BACKOFF_SECONDS, float(response.headers.get("retry-after")))
+        except (TypeError, ValueError):
+            pass
+    delay = min(LLM_MAX_BACKOFF_SECONDS, LLM_BACKOFF_SECONDS * 2 ** attempt)
+    return delay * (0.5 + random.random() / 2)
+
+
+def _parse_json(text):
+    """JSON from a message body, tolerating a ```json fence around it"""
+    text = (text or "").strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        text = text.rsplit("```", 1)[0]
+    return text
+
+
+class HighlightClient:
+    """
+    One pooled AsyncOpenAI client shared by every highlight request.
+
+    The client runs on a background event loop thread, so synchronous callers
+    use run() while the requests themselves overlap: at most max_concurrency
+    in flight, started no faster than requests_per_minute. Transient errors
+    are retried with exponential backoff. Parsed responses are cached on disk,
+    keyed by model, temperature, response schema and a hash of the prompt.
+    """
+
+    def __init__(self, model=LLM_MODEL, temperature=LLM_TEMPERATURE, base_url=LLM_BASE_URL, api_key=None,
+                 max_concurrency=LLM_MAX_CONCURRENCY, requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+                 max_retries=LLM_MAX_RETRIES, timeout=LLM_TIMEOUT, cache=llm_cache):
+        self.model = model
+        self.temperature = temperature
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.cache = cache
+        self.limiter = RateLimiter(requests_per_minute, burst=max_concurrency)
+        self._client = None
+        self._semaphore = None
+        self._loop = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_loop(self):
+        with self._start_lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-client", daemon=True).start()
+                self._loop = loop
+        return self._loop
+
+    def run(self, coro):
+        """Run a coroutine on the client's loop from synchronous code and wait for its result"""
+        return self.submit(coro).result()
+
+    def submit(self, coro):
+        """Start a coroutine on the client's loop without waiting; returns a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop())
+
+    def _get_client(self):
+        # Only called on the client's loop, so no locking needed
+        if self._client is None:
+            from openai import AsyncOpenAI
+            key = self.api_key or api_key
+            if not self.base_url:
+                require_api_key()
+            # The SDK's own retries are off; complete() retries with backoff
+            self._client = AsyncOpenAI(api_key=key or "not-needed", base_url=self.base_url,
+                                       max_retries=0, timeout=self.timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._client
+
+    def cache_key(self, messages, schema):
+        prompt_hash = hashlib.sha256(json.dumps(messages, sort_keys=True).encode('utf-8')).hexdigest()
+        return make_key("llm", self.model, self.temperature, schema.__name__, prompt_hash)
+
+    async def complete(self, system_prompt, user_text, schema, use_cache=True):
+        """
+        One chat request whose answer is forced through a function call with
+        the schema's parameters. Returns a schema instance; raises once the
+        retries are exhausted or the answer doesn't match the schema.
+        """
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_text},
+        ]
+        key = self.cache_key(messages, schema)
+        if use_cache and self.cache is not None:
+            cached = self.cache.get(key)
+            if cached is not None:
+                print("✓ LLM response loaded from cache")
+                return schema.model_validate(cached)
+
+        client = self._get_client()
+        tool = {
+            "type": "function",
+            "function": {
+                "name": schema.__name__,
+                "description": (schema.__doc__ or "").strip(),
+                "parameters": schema.model_json_schema(),
+            },
+        }
+        async with self._semaphore:
+            for attempt in range(self.max_retries + 1):
+                await self.limiter.acquire()
+                try:
+                    completion = await client.chat.completions.create(
+                        model=self.model,
+                        temperature=self.temperature,
+                        messages=messages,
+                        tools=[tool],
+                        tool_choice={"type": "function", "function": {"name": schema.__name__}},
+                    )
+                    break
+                except Exception as e:
+                    if attempt == self.max_retries or not _is_transient(e):
+                        raise
+                    delay = _retry_delay(e, attempt)
+                    print(f"LLM request failed ({type(e).__name__}), retry {attempt + 1}/{self.max_retries} in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+
+        message = completion.choices[0].message
+        if message.tool_calls:
+            arguments = message.tool_calls[0].function.arguments
+        else:
+            arguments = _parse_json(message.content)
+        result = schema.model_validate_json(arguments)
+        if self.cache is not None:
+            self.cache.set(key, result.model_dump())
+        return result
+
+    def close(self):
+        """Close the HTTP pool and stop the loop thread"""
+        if self._loop is None:
+            return
+        if self._client is not None:
+            self.run(self._client.close())
+            self._client = None
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+
+
+_highlight_client = None
+_highlight_client_lock = threading.Lock()
+
+
+def get_highlight_client():
+    """The process-wide HighlightClient, created on first use"""
+    global _highlight_client
+    with _highlight_client_lock:
+        if _highlight_client is None:
+            _highlight_client = HighlightClient()
+        return _highlight_client
+
+
+def _exclude_note(exclude):
+    """Prompt line asking the LLM to avoid already rejected (start, end) ranges"""
+    if not exclude:
+        return ""
+    ranges = ", ".join(f"{start:g}s-{end:g}s" for start, end in exclude)
+    return f"\nDo not select anything overlapping these rejected ranges: {ranges}\n"
 
 
+def _report_error(function, e):
+    print(f"\n{'='*60}")
+    print(f"ERROR IN {function} FUNCTION:")
+    print(f"{'='*60}")
+    print(f"Exception type: {type(e).__name__}")
+    print(f"Exception message: {str(e)}")
+    print(f"{'='*60}\n")
+
 
 def GetHighlight(Transcription):
-    from langchain_openai import ChatOpenAI
-    
     try:
-        llm = ChatOpenAI(
-            model="gpt-4o-mini",  # Cost-effective model
-            temperature=1.0,
-            api_key = api_key
-        )
-
-        from langchain.prompts import ChatPromptTemplate
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system",system),
-                ("user",Transcription)
-            ]
-        )
-        chain = prompt |llm.with_structured_output(JSONResponse,method="function_calling")
-        
+        client = get_highlight_client()
         print("Calling LLM for highlight selection...")
-        response = chain.invoke({"Transcription":Transcription})
-        
+        response = client.run(client.complete(system.format(), Transcription, JSONResponse))
+
         # Validate response
         if not response:
             print("ERROR: LLM returned empty response")
             return None, None
-        
+
         if not hasattr(response, 'start') or not hasattr(response, 'end'):
             print(f"ERROR: Invalid response structure: {response}")
             return None, None
-        
+
         try:
             Start = int(response.start)
             End = int(response.end)
@@ -89,42 +348,241 @@ def GetHighlight(Transcription):
             print(f"  response.end: {response.end}")
             print(f"  Error: {e}")
             return None, None
-        
+
         # Validate times
         if Start < 0 or End < 0:
             print(f"ERROR: Negative time values - Start: {Start}s, End: {End}s")
             return None, None
-        
+
         if End <= Start:
             print(f"ERROR: Invalid time range - Start: {Start}s, End: {End}s (end must be > start)")
             return None, None
-        
+
         # Log the selected segment
         print(f"\n{'='*60}")
         print(f"SELECTED SEGMENT DETAILS:")
         print(f"Time: {Start}s - {End}s ({End-Start}s duration)")
         print(f"Content: {response.content}")
         print(f"{'='*60}\n")
-        
-        if Start==End:
-            Ask = input("Error - Get Highlights again (y/n) -> ").lower()
-            if Ask == "y":
-                Start, End = GetHighlight(Transcription)
-            return Start, End
         return Start,End
-        
+
     except Exception as e:
-        print(f"\n{'='*60}")
-        print(f"ERROR IN GetHighlight FUNCTION:")
-        print(f"{'='*60}")
-        print(f"Exception type: {type(e).__name__}")
-        print(f"Exception message: {str(e)}")
-        print(f"\nTranscription length: {len(Transcription)} characters")
-        print(f"First 200 chars: {Transcription[:200]}...")
-        print(f"{'='*60}\n")
+        _report_error("GetHighlight", e)
+        print(f"Transcription length: {len(Transcription)} characters")
+        print(f"First 200 chars: {Transcription[:200]}...\n")
         import traceback
         traceback.print_exc()
         return None, None
 
+
+def _select_highlights(response, count, exclude=None):
+    """Valid, non-overlapping (start, end) pairs from a HighlightsResponse"""
+    if not response or not getattr(response, 'highlights', None):
+        print("ERROR: LLM returned empty response")
+        return []
+
+    selected = []
+    for highlight in response.highlights:
+        try:
+            Start = int(highlight.start)
+            End = int(highlight.end)
+        except (ValueError, TypeError):
+            print(f"Skipping highlight with unparseable times: {highlight.start} - {highlight.end}")
+            continue
+        if Start < 0 or End <= Start:
+            print(f"Skipping invalid time range - Start: {Start}s, End: {End}s")
+            continue
+        if any(Start < e and s < End for s, e in selected):
+            print(f"Skipping overlapping highlight: {Start}s - {End}s")
+            continue
+        if any(Start < e and s < End for s, e in exclude or []):
+            print(f"Skipping previously rejected highlight: {Start}s - {End}s")
+            continue
+        selected.append((Start, End))
+        if len(selected) == count:
+            break
+
+    print(f"\n{'='*60}")
+    print(f"SELECTED {len(selected)} SEGMENTS:")
+    for i, (Start, End) in enumerate(selected, 1):
+        print(f"  {i}. {Start}s - {End}s ({End-Start}s duration)")
+    print(f"{'='*60}\n")
+    return selected
+
+
+async def get_highlights_async(Transcription, count, exclude=None, client=None):
+    """GetHighlights as a coroutine on the HighlightClient's loop (raises on failure)"""
+    client = client or get_highlight_client()
+    print(f"Calling LLM for {count} highlight selections...")
+    prompt = system_multi.format(Count=count) + _exclude_note(exclude)
+    response = await client.complete(prompt, Transcription, HighlightsResponse)
+    return _select_highlights(response, count, exclude)
+
+
+def GetHighlights(Transcription, count, exclude=None):
+    """
+    Ask the LLM for `count` non-overlapping highlights in one call.
+
+    exclude is an optional list of (start, end) ranges in seconds that were
+    already rejected; the LLM is told to avoid them and any overlap is dropped.
+    Returns a list of (start, end) tuples in seconds, most interesting first,
+    with invalid or overlapping segments dropped (so it may be shorter than
+    count). Returns [] on failure.
+    """
+    try:
+        client = get_highlight_client()
+        return client.run(get_highlights_async(Transcription, count, exclude, client))
+    except Exception as e:
+        _report_error("GetHighlights", e)
+        import traceback
+        traceback.print_exc()
+        return []
+
+
+# Token budget of one transcript window, and how much consecutive windows overlap
+WINDOW_TOKENS = 4000
+WINDOW_OVERLAP_TOKENS = 400
+
+
+def prompt_tokens(Transcription, count):
+    """Estimated input tokens of one GetHighlights call"""
+    return estimate_tokens(system_multi.format(Count=count)) + estimate_tokens(Transcription)
+
+
+class HighlightStream:
+    """
+    Windowed highlight selection fed while the transcript is still coming in.
+
+    feed() takes [text, start, end] segments as stream_transcription yields
+    them. A background thread merges them into sentences and cuts
+    overlapping token-budgeted windows (iter_token_windows); each window's
+    LLM request is started on the shared HighlightClient as soon as the
+    window is complete, so on long videos most requests are answered while
+    Whisper is still decoding. finish() waits for the last window and
+    reduces the candidates from all windows to `count`.
+    """
+
+    def __init__(self, count=1, max_tokens=WINDOW_TOKENS, overlap_tokens=WINDOW_OVERLAP_TOKENS, exclude=None,
+                 client=None):
+        self.count = count
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.exclude = exclude
+        self.client = client
+        self.sentences = []
+        self.requests = []  # concurrent Futures, one per window
+        self.tokens_sent = 0
+        self._started = time.time()
+        self._first_candidate = None
+        self._segments = Queue()
+        self._thread = threading.Thread(target=self._run, name="highlight-stream", daemon=True)
+        self._thread.start()
+
+    def feed(self, segment):
+        self._segments.put(segment)
+
+    def _sentences(self):
+        for sentence in iter_sentences(iter(self._segments.get, None)):
+            self.sentences.append(sentence)
+            yield sentence
+
+    def _run(self):
+        for window in iter_token_windows(self._sentences(), self.max_tokens, self.overlap_tokens):
+            text = format_compact(window)
+            self.tokens_sent += prompt_tokens(text, self.count)
+            if self.client is None:
+                self.client = get_highlight_client()
+            number = len(self.requests) + 1
+            print(f"Window {number} ({window[0][1]:.0f}s - {window[-1][2]:.0f}s) sent to the LLM")
+            future = self.client.submit(get_highlights_async(text, self.count, self.exclude, self.client))
+            future.add_done_callback(self._on_window_done)
+            self.requests.append(future)
+
+    def _on_window_done(self, future):
+        if self._first_candidate is None and not future.exception() and future.result():
+            self._first_candidate = time.time() - self._started
+            print(f"✓ First highlight candidates after {self._first_candidate:.1f}s")
+
+    def close(self):
+        """End the feed without waiting for the requests (e.g. when the job failed)"""
+        self._segments.put(None)
+
+    def finish(self):
+        """
+        End of the transcript: wait for every window and return the final
+        (start, end) highlights in seconds, best first ([] on failure).
+        """
+        self._segments.put(None)
+        self._thread.join()
+        if not self.requests:
+            return []
+
+        results = []
+        for future in self.requests:
+            try:
+                results.append(future.result())
+            except Exception as e:
+                results.append(e)
+        if len(self.requests) == 1:
+            if isinstance(results[0], Exception):
+                _report_error("GetHighlights", results[0])
+                return []
+            print(f"LLM input: ~{self.tokens_sent} tokens in 1 request")
+            return results[0]
+
+        print(f"Transcript split into {len(self.requests)} windows of <= {self.max_tokens} tokens")
+        # Candidates from every window, in window order, without overlaps
+        candidates = []
+        for i, window_highlights in enumerate(results, 1):
+            if isinstance(window_highlights, Exception):
+                print(f"✗ Window {i} failed: {type(window_highlights).__name__}: {window_highlights}")
+                continue
+            for start, end in window_highlights:
+                if not any(start < e and s < end for s, e in candidates):
+                    candidates.append((start, end))
+
+        requests = len(self.requests)
+        if len(candidates) > self.count:
+            # Reduce: only the sentences inside a candidate are sent
+            kept = [seg for seg in self.sentences if any(seg[2] > s and seg[1] < e for s, e in candidates)]
+            text = format_compact(kept)
+            self.tokens_sent += prompt_tokens(text, self.count)
+            requests += 1
+            print(f"Reducing {len(candidates)} candidates to {self.count}...")
+            try:
+                reduced = self.client.run(get_highlights_async(text, self.count, self.exclude, self.client))
+            except Exception as e:
+                _report_error("GetHighlights", e)
+                reduced = []
+            highlights = reduced or candidates[:self.count]
+        else:
+            highlights = candidates
+
+        print(f"LLM input: ~{self.tokens_sent} tokens in {requests} requests")
+        return highlights
+
+
+def GetHighlightsWindowed(segments, count=1, max_tokens=WINDOW_TOKENS, overlap_tokens=WINDOW_OVERLAP_TOKENS,
+                          exclude=None):
+    """
+    Highlight selection for transcripts of any length.
+
+    Segments are merged into sentences and rendered with compact timestamps.
+    A transcript that fits in max_tokens is sent in one request; a longer one
+    is split into overlapping windows (iter_token_windows) that are requested
+    concurrently through the shared HighlightClient, and the candidates from
+    all windows are reduced to the final `count` in one more call that only
+    sees the candidates' text (see HighlightStream). Ranges in exclude
+    (seconds) are avoided. The estimated number of input tokens sent is
+    printed.
+
+    Returns a list of (start, end) tuples in seconds, best first ([] on failure).
+    """
+    stream = HighlightStream(count, max_tokens, overlap_tokens, exclude)
+    for segment in segments:
+        stream.feed(segment)
+    return stream.finish()
+
+
 if __name__ == "__main__":
     print(GetHighlight(User))
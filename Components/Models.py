@@ -0,0 +1,171 @@
+import os
+import threading
+import time
+
+# Process-wide cache of loaded models, so a long-running process (or several
+# videos in one run) only pays the load cost once per configuration.
+_whisper_models = {}  # (model_size, device, compute_type, cpu_threads) -> WhisperModel
+_whisper_lock = threading.Lock()
+_whisper_device = None
+
+# Face / voice models. OpenCV classifiers and networks keep state between
+# calls, so those are shared per thread rather than per process.
+FACE_DNN_PROTOTXT = os.path.join("models", "deploy.prototxt")
+FACE_DNN_MODEL = os.path.join("models", "res10_300x300_ssd_iter_140000_fp16.caffemodel")
+HAAR_FACE_CASCADE = "haarcascade_frontalface_default.xml"
+VAD_AGGRESSIVENESS = 2  # webrtcvad mode, 0 (least) to 3 (most aggressive)
+
+_models = {}  # name -> model
+_models_lock = threading.Lock()
+_thread_models = threading.local()
+_load_times_lock = threading.Lock()
+
+# Seconds spent loading each model, summed over threads (see print_model_load_times)
+model_load_times = {}
+
+
+def _timed_load(name, loader):
+    load_start = time.time()
+    model = loader()
+    elapsed = time.time() - load_start
+    with _load_times_lock:
+        model_load_times[name] = model_load_times.get(name, 0.0) + elapsed
+    print(f"Loaded {name} in {elapsed * 1000:.0f}ms")
+    return model
+
+
+def load_model(name, loader, per_thread=False):
+    """
+    Return the shared model called name, calling loader() on first use.
+    With per_thread=True each thread gets its own instance (for objects that
+    aren't safe to use from several threads at once). Load times are printed
+    and added to model_load_times.
+    """
+    if per_thread:
+        models = getattr(_thread_models, 'models', None)
+        if models is None:
+            models = _thread_models.models = {}
+        model = models.get(name)
+        if model is None:
+            model = models[name] = _timed_load(name, loader)
+        return model
+
+    with _models_lock:
+        model = _models.get(name)
+        if model is None:
+            model = _models[name] = _timed_load(name, loader)
+    return model
+
+
+def get_face_cascade(cascade=HAAR_FACE_CASCADE):
+    """OpenCV Haar cascade (one per thread)"""
+    def load():
+        import cv2
+        classifier = cv2.CascadeClassifier(cv2.data.haarcascades + cascade)
+        if classifier.empty():
+            raise RuntimeError(f"Could not load Haar cascade {cascade}")
+        return classifier
+    return load_model(f"haar:{cascade}", load, per_thread=True)
+
+
+def get_face_dnn(prototxt_path=FACE_DNN_PROTOTXT, model_path=FACE_DNN_MODEL):
+    """OpenCV DNN SSD face detector (one per thread); raises FileNotFoundError if the model files are missing"""
+    def load():
+        import cv2
+        for path in (prototxt_path, model_path):
+            if not os.path.isfile(path):
+                raise FileNotFoundError(f"Face detection model not found: {path}")
+        return cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+    return load_model(f"face-dnn:{os.path.basename(model_path)}", load, per_thread=True)
+
+
+def get_vad(aggressiveness=VAD_AGGRESSIVENESS):
+    """webrtcvad voice activity detector (one per thread)"""
+    def load():
+        import webrtcvad
+        return webrtcvad.Vad(aggressiveness)
+    return load_model(f"vad:{aggressiveness}", load, per_thread=True)
+
+
+def print_model_load_times():
+    """Print the time spent loading each model so far"""
+    with _load_times_lock:
+        times = sorted(model_load_times.items(), key=lambda item: -item[1])
+    if not times:
+        return
+    print("Model load times:")
+    for name, seconds in times:
+        print(f"  {name}: {seconds:.2f}s")
+
+
+def get_whisper_device():
+    """Return "cuda" if CTranslate2 can see a GPU, else "cpu" (probed once)"""
+    global _whisper_device
+    if _whisper_device is None:
+        try:
+            import ctranslate2
+            _whisper_device = "cuda" if ctranslate2.get_cuda_device_count() > 0 else "cpu"
+        except Exception:
+            _whisper_device = "cpu"
+    return _whisper_device
+
+
+def default_compute_type(device):
+    # int8 is several times faster than float32 on CPU with negligible WER loss
+    return "float16" if device == "cuda" else "int8"
+
+
+def get_whisper_model(model_size="base.en", device=None, compute_type=None, cpu_threads=0):
+    """
+    Return a shared WhisperModel for this configuration, loading it on first use.
+
+    Args:
+        model_size: faster-whisper model name (e.g. "base.en", "small")
+        device: "cuda" or "cpu" (auto-detected if None)
+        compute_type: CTranslate2 compute type (float16 on GPU, int8 on CPU if None)
+        cpu_threads: CPU threads per model (0 = CTranslate2 default)
+    """
+    device = device or get_whisper_device()
+    compute_type = compute_type or default_compute_type(device)
+    key = (model_size, device, compute_type, cpu_threads)
+
+    with _whisper_lock:
+        model = _whisper_models.get(key)
+        if model is None:
+            from faster_whisper import WhisperModel
+            print(f"Loading Whisper model {model_size} on {device} ({compute_type})...")
+            load_start = time.time()
+            model = WhisperModel(model_size, device=device, compute_type=compute_type, cpu_threads=cpu_threads)
+            elapsed = time.time() - load_start
+            print(f"Model loaded in {elapsed:.1f}s")
+            with _load_times_lock:
+                name = f"whisper:{model_size}:{device}:{compute_type}"
+                model_load_times[name] = model_load_times.get(name, 0.0) + elapsed
+            _whisper_models[key] = model
+    return model
+
+
+def preload_whisper_model(model_size="base.en", device=None, compute_type=None, cpu_threads=0, background=True):
+    """
+    Load a Whisper model ahead of time so the first transcribeAudio call doesn't
+    wait for it. With background=True the load runs in a daemon thread (which is
+    returned) so it overlaps with downloading / audio extraction.
+    """
+    def load():
+        try:
+            get_whisper_model(model_size, device, compute_type, cpu_threads)
+        except Exception as e:
+            print(f"Warning: Could not preload Whisper model {model_size}: {e}")
+
+    if not background:
+        load()
+        return None
+    thread = threading.Thread(target=load, name="whisper-preload", daemon=True)
+    thread.start()
+    return thread
+
+
+def clear_whisper_models():
+    """Drop all cached Whisper models (frees GPU/CPU memory)"""
+    with _whisper_lock:
+        _whisper_models.clear()
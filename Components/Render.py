@@ -0,0 +1,181 @@
+import os
+import cv2
+import numpy as np
+import ffmpeg
+from Components.FaceCrop import plan_vertical_crop, apply_vertical_crop
+from Components.Captions import SubtitleRenderer, KaraokeRenderer
+from Components.JumpCut import remap_transcriptions, remap_words, kept_duration
+
+
+def get_video_info(video_path):
+    """Return (width, height, fps, duration) of a video, or None if it can't be opened"""
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        return None
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    duration = total_frames / fps if fps else 0
+    return width, height, fps, duration
+
+
+def render_short(input_file, output_file, start_time, end_time, transcriptions=None, crop_plan=None,
+                 preset='medium', bitrate='3000k', words=None, cancel=None, keep_intervals=None):
+    """
+    Render a vertical short in a single pass.
+
+    The source is decoded once (video piped out of ffmpeg as raw BGR frames),
+    each frame is cropped to 9:16 in memory, and the frames are piped into a
+    single libx264 encode that also muxes the source audio for the same time
+    range. Subtitles are blended into the cropped frames from cached caption
+    sprites (see Components.Captions). Replaces crop_video ->
+    crop_to_vertical -> add_subtitles_to_video -> combine_videos, which wrote
+    and re-encoded three intermediate files.
+
+    Args:
+        input_file: Path to the source video
+        output_file: Path of the final short
+        start_time, end_time: Clip range in seconds
+        transcriptions: Optional list of [text, start, end] (source times) to burn in
+        crop_plan: Optional precomputed plan from plan_vertical_crop
+        words: Optional WordTimings; captions then highlight the spoken word
+        cancel: Optional threading.Event; once set, rendering stops and the
+            partial output is deleted
+        keep_intervals: Optional (start, end) source ranges to keep (see
+            JumpCut.compute_keep_intervals); everything else is cut out in
+            the same pass and the captions are moved to match
+    Returns:
+        output_file on success, None on failure or cancellation
+    """
+    info = get_video_info(input_file)
+    if info is None:
+        print(f"Error: Could not open video {input_file}")
+        return None
+    width, height, fps, video_duration = info
+
+    # Ensure end_time doesn't exceed video duration
+    max_time = video_duration - 0.1  # Small buffer to avoid edge cases
+    if end_time > max_time:
+        print(f"Warning: Requested end time ({end_time}s) exceeds video duration ({video_duration}s). Capping to {max_time}s")
+        end_time = max_time
+    duration = end_time - start_time
+    if duration <= 0:
+        print(f"Error: Invalid clip range {start_time}s - {end_time}s")
+        return None
+
+    plan = crop_plan or plan_vertical_crop(input_file, start_time, end_time)
+    if plan is None:
+        return None
+    out_w, out_h = plan['vertical_width'], plan['vertical_height']
+
+    # Jump cuts: which decoded frames are kept, and the captions in output time
+    keep_frames = None
+    caption_start, caption_duration = start_time, duration
+    if keep_intervals:
+        keep_intervals = [(s, min(e, end_time)) for s, e in keep_intervals if s < end_time]
+    if keep_intervals:
+        keep_frames = np.zeros(plan['frames'] + 1, dtype=bool)
+        for s, e in keep_intervals:
+            keep_frames[int(round((s - start_time) * fps)):int(round((e - start_time) * fps))] = True
+        if transcriptions:
+            transcriptions = remap_transcriptions(transcriptions, keep_intervals)
+        if words is not None and len(words):
+            words = remap_words(words, keep_intervals)
+        caption_start, caption_duration = 0, kept_duration(keep_intervals)
+        print(f"Jump cuts: keeping {caption_duration:.1f}s of {duration:.1f}s in {len(keep_intervals)} pieces")
+
+    subtitles = None
+    if transcriptions:
+        if words is not None and len(words):
+            subtitles = KaraokeRenderer(transcriptions, words, out_w, out_h, video_start_time=caption_start,
+                                        video_duration=caption_duration)
+        else:
+            subtitles = SubtitleRenderer(transcriptions, out_w, out_h, video_start_time=caption_start,
+                                         video_duration=caption_duration)
+        if not len(subtitles):
+            print("No transcriptions found for this video segment")
+            subtitles = None
+
+    video_stream = ffmpeg.input('pipe:', format='rawvideo', pix_fmt='bgr24', s=f'{out_w}x{out_h}', framerate=fps)
+
+    audio_stream = ffmpeg.input(input_file, ss=start_time, t=duration).audio
+    if keep_intervals:
+        # Sample-accurate pieces of the same audio input, joined back to back
+        parts = audio_stream.filter_multi_output('asplit', len(keep_intervals))
+        pieces = [parts[i].filter('atrim', start=s - start_time, end=e - start_time).filter('asetpts', 'PTS-STARTPTS')
+                  for i, (s, e) in enumerate(keep_intervals)]
+        audio_stream = ffmpeg.concat(*pieces, v=0, a=1) if len(pieces) > 1 else pieces[0]
+
+    decoder = (
+        ffmpeg
+        .input(input_file, ss=start_time, t=duration)
+        .video
+        .output('pipe:', format='rawvideo', pix_fmt='bgr24')
+        .global_args('-loglevel', 'error')
+        .run_async(pipe_stdout=True)
+    )
+    encoder = (
+        ffmpeg
+        .output(video_stream, audio_stream, output_file, vcodec='libx264', acodec='aac',
+                preset=preset, video_bitrate=bitrate, pix_fmt='yuv420p', r=fps)
+        .global_args('-loglevel', 'error')
+        .overwrite_output()
+        .run_async(pipe_stdin=True)
+    )
+
+    frame_size = width * height * 3
+    frame_count = 0
+    source_index = 0
+    total_frames = plan['frames'] if keep_frames is None else int(keep_frames.sum())
+    cancelled = False
+    try:
+        while True:
+            if cancel is not None and cancel.is_set():
+                cancelled = True
+                break
+            raw = decoder.stdout.read(frame_size)
+            if len(raw) < frame_size:
+                break
+            index = source_index
+            source_index += 1
+            if keep_frames is not None and (index >= len(keep_frames) or not keep_frames[index]):
+                continue  # cut out
+            frame = np.frombuffer(raw, np.uint8).reshape(height, width, 3)
+            cropped_frame = apply_vertical_crop(frame, plan, index)
+            if subtitles is not None:
+                cropped_frame = subtitles.overlay(cropped_frame, frame_count / fps)
+            try:
+                encoder.stdin.write(np.ascontiguousarray(cropped_frame).tobytes())
+            except BrokenPipeError:
+                break
+            frame_count += 1
+
+            if frame_count % 100 == 0:
+                print(f"Rendered {frame_count}/{total_frames} frames")
+    finally:
+        decoder.stdout.close()
+        decoder.wait()
+        try:
+            encoder.stdin.close()
+        except BrokenPipeError:
+            pass
+        encoder.wait()
+
+    if cancelled:
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        print(f"Render of {output_file} cancelled")
+        return None
+
+    if encoder.returncode != 0:
+        print(f"Error: ffmpeg encode failed with exit code {encoder.returncode}")
+        return None
+
+    print(f"✓ Rendered {frame_count} frames in a single pass -> {output_file}")
+    return output_file
+
+
+if __name__ == "__main__":
+    render_short("Example.mp4", "Short.mp4", 31.92, 49.2)
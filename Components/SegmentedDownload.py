@@ -0,0 +1,166 @@
+import os
+import re
+import json
+import time
+import shutil
+import http.client
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+# Parallel HTTP range requests per file; files smaller than
+# DOWNLOAD_MIN_SEGMENT_BYTES per segment use fewer segments
+DOWNLOAD_SEGMENTS = 4
+DOWNLOAD_MIN_SEGMENT_BYTES = 2 * 1024 * 1024
+DOWNLOAD_CHUNK_BYTES = 256 * 1024
+DOWNLOAD_TIMEOUT = 30
+DOWNLOAD_RETRIES = 3
+DOWNLOAD_BACKOFF_SECONDS = 1.0
+
+USER_AGENT = "Mozilla/5.0"
+
+CONTENT_RANGE_RE = re.compile(r"bytes\s+\d+-\d+/(\d+)")
+
+
+def _open(url, start=None, end=None, timeout=DOWNLOAD_TIMEOUT, validator=None):
+    headers = {"User-Agent": USER_AGENT}
+    if start is not None:
+        headers["Range"] = f"bytes={start}-" + ("" if end is None else str(end))
+        if validator:
+            # The server sends the whole (new) body instead of the range if the resource changed
+            headers["If-Range"] = validator
+    return urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=timeout)
+
+
+def probe(url, timeout=DOWNLOAD_TIMEOUT):
+    """
+    (total size in bytes or None, whether the server answers range requests,
+    ETag or Last-Modified or None), from a request for the first byte.
+    """
+    with _open(url, 0, 0, timeout) as response:
+        validator = response.headers.get("ETag") or response.headers.get("Last-Modified")
+        if response.status == 206:
+            match = CONTENT_RANGE_RE.match(response.headers.get("Content-Range", ""))
+            if match:
+                return int(match.group(1)), True, validator
+        length = response.headers.get("Content-Length")
+        return (int(length) if length else None), False, validator
+
+
+def segment_bounds(size, segments=DOWNLOAD_SEGMENTS, min_segment=DOWNLOAD_MIN_SEGMENT_BYTES):
+    """Inclusive (start, end) byte ranges splitting size bytes into at most `segments` parts"""
+    count = max(1, min(segments, -(-size // max(1, min_segment))))
+    step = -(-size // count)
+    return [(start, min(size, start + step) - 1) for start in range(0, size, step)]
+
+
+def fetch_range(url, part_path, start, end, timeout=DOWNLOAD_TIMEOUT, retries=DOWNLOAD_RETRIES, validator=None):
+    """
+    Fill part_path with bytes start..end (inclusive) of url. Whatever the
+    file already holds from an earlier, interrupted attempt is kept and only
+    the rest is requested; dropped connections are retried with backoff.
+    """
+    expected = end - start + 1
+    for attempt in range(retries + 1):
+        have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if have >= expected:
+            return
+        try:
+            with _open(url, start + have, end, timeout, validator) as response:
+                if response.status != 206:
+                    raise RuntimeError(f"server ignored the range request (HTTP {response.status})")
+                remaining = expected - have
+                with open(part_path, 'ab') as f:
+                    while remaining > 0:
+                        chunk = response.read(min(DOWNLOAD_CHUNK_BYTES, remaining))
+                        if not chunk:
+                            break
+                        f.write(chunk)
+                        remaining -= len(chunk)
+        except (urllib.error.URLError, http.client.HTTPException, OSError) as e:
+            if attempt == retries:
+                raise
+            delay = DOWNLOAD_BACKOFF_SECONDS * 2 ** attempt
+            print(f"Segment {start}-{end} interrupted ({type(e).__name__}), retry {attempt + 1}/{retries} in {delay:.0f}s")
+            time.sleep(delay)
+    if os.path.getsize(part_path) < expected:
+        raise RuntimeError(f"segment {start}-{end} incomplete after {retries} retries")
+
+
+def _resume_state(path, size, validator, count):
+    """
+    Check the <path>.part.json sidecar written next to the part files: if it
+    describes another version of the resource (size, ETag/Last-Modified or
+    segment count differ), the old parts are deleted. Then the sidecar is
+    written for this download.
+    """
+    state_path = f"{path}.part.json"
+    state = {"size": size, "validator": validator, "segments": count}
+    try:
+        with open(state_path, 'r', encoding='utf-8') as f:
+            previous = json.load(f)
+    except (OSError, ValueError):
+        previous = None
+    if previous != state:
+        directory = os.path.dirname(path) or "."
+        prefix = os.path.basename(path) + ".part"
+        stale = [name for name in os.listdir(directory) if name.startswith(prefix) and name != prefix + ".json"]
+        if stale:
+            print(f"Discarding {len(stale)} partial files of {os.path.basename(path)}: the resource changed")
+            for name in stale:
+                os.remove(os.path.join(directory, name))
+        with open(state_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+    return state_path
+
+
+def download_file(url, path, segments=DOWNLOAD_SEGMENTS, timeout=DOWNLOAD_TIMEOUT):
+    """
+    Download url to path with up to `segments` parallel range requests.
+
+    Each segment is written to its own <path>.part<i>of<n> file, so a run
+    that was interrupted resumes where each segment stopped; the parts are
+    joined into path at the end and deleted. The resource's size and ETag
+    (or Last-Modified) are kept in <path>.part.json, and parts left by a
+    different version of the resource are discarded instead of resumed.
+    Servers without range support get one plain request. Returns path.
+    """
+    began = time.time()
+    size, ranged, validator = probe(url, timeout)
+    if not ranged or not size:
+        part_path = f"{path}.part"
+        with _open(url, timeout=timeout) as response, open(part_path, 'wb') as f:
+            shutil.copyfileobj(response, f, DOWNLOAD_CHUNK_BYTES)
+        os.replace(part_path, path)
+        size, count = os.path.getsize(path), 1
+    else:
+        bounds = segment_bounds(size, segments)
+        count = len(bounds)
+        parts = [f"{path}.part{i}of{count}" for i in range(count)]
+        state_path = _resume_state(path, size, validator, count)
+        resumed = sum(os.path.getsize(p) for p in parts if os.path.exists(p))
+        if resumed:
+            print(f"Resuming {os.path.basename(path)}: {resumed / (1024 * 1024):.1f} MB already downloaded")
+        with ThreadPoolExecutor(max_workers=count) as pool:
+            futures = [pool.submit(fetch_range, url, part, start, end, timeout, DOWNLOAD_RETRIES, validator)
+                       for part, (start, end) in zip(parts, bounds)]
+            for future in futures:
+                future.result()
+        with open(f"{path}.part", 'wb') as f:
+            for part in parts:
+                with open(part, 'rb') as src:
+                    shutil.copyfileobj(src, f, DOWNLOAD_CHUNK_BYTES)
+        os.replace(f"{path}.part", path)
+        for part in parts:
+            os.remove(part)
+        os.remove(state_path)
+
+    elapsed = max(time.time() - began, 1e-6)
+    print(f"✓ Downloaded {os.path.basename(path)}: {size / (1024 * 1024):.1f} MB in {elapsed:.1f}s "
+          f"({size / (1024 * 1024) / elapsed:.1f} MB/s, {count} segments)")
+    return path
+
+
+if __name__ == "__main__":
+    import sys
+    download_file(sys.argv[1], sys.argv[2])
@@ -0,0 +1,154 @@
+import os
+import numpy as np
+import ffmpeg
+from Components.Cache import DiskCache, hash_file_stat, make_key
+
+# Shot indexes are small, so they're kept next to the transcripts
+SHOT_CACHE_DIR = os.getenv("SHOT_CACHE_DIR", os.path.join(".cache", "shots"))
+shot_cache = DiskCache(SHOT_CACHE_DIR, 20 * 1024 * 1024)
+
+# Detection parameters: frames per second analysed, analysis frame size,
+# histogram distance that counts as a cut, and the shortest allowed shot
+SHOT_SAMPLE_FPS = 10
+SHOT_FRAME_SIZE = (160, 90)
+SHOT_THRESHOLD = 0.35
+SHOT_MIN_LENGTH = 0.5
+
+
+class ShotIndex:
+    """
+    Sorted cut timestamps (seconds) for one source video, with O(log n)
+    lookups for the stages that care about shot boundaries: face tracking
+    (cut_frames), crop smoothing and highlight snapping (snap).
+    """
+
+    def __init__(self, cuts, duration):
+        self.cuts = np.asarray(sorted(cuts), dtype=np.float64)
+        self.duration = duration
+
+    def cuts_between(self, start, end):
+        """Cut times t with start < t < end"""
+        lo = np.searchsorted(self.cuts, start, side='right')
+        hi = np.searchsorted(self.cuts, end, side='left')
+        return self.cuts[lo:hi].tolist()
+
+    def cut_frames(self, start, end, fps):
+        """Cuts inside [start, end] as frame indices relative to start"""
+        return [int(round((t - start) * fps)) for t in self.cuts_between(start, end)]
+
+    def shot_at(self, t):
+        """(shot_start, shot_end) of the shot containing time t"""
+        i = np.searchsorted(self.cuts, t, side='right')
+        shot_start = self.cuts[i - 1] if i > 0 else 0.0
+        shot_end = self.cuts[i] if i < len(self.cuts) else self.duration
+        return float(shot_start), float(shot_end)
+
+    def snap(self, t, max_shift=1.5):
+        """The cut nearest to t if it is within max_shift seconds, else t"""
+        if len(self.cuts) == 0:
+            return t
+        i = np.searchsorted(self.cuts, t)
+        nearby = self.cuts[max(0, i - 1):i + 1]
+        nearest = nearby[np.argmin(np.abs(nearby - t))]
+        return float(nearest) if abs(nearest - t) <= max_shift else t
+
+    def to_dict(self):
+        return {'cuts': self.cuts.tolist(), 'duration': self.duration}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['cuts'], data['duration'])
+
+
+def _frame_histograms(frames, bins_per_channel=4):
+    """Normalized joint BGR histograms for a (N, H, W, 3) uint8 batch, shape (N, bins^3)"""
+    shift = 8 - int(np.log2(bins_per_channel))
+    q = frames >> shift
+    idx = (q[..., 0].astype(np.int32) * bins_per_channel + q[..., 1]) * bins_per_channel + q[..., 2]
+    n_bins = bins_per_channel ** 3
+    idx = idx.reshape(len(frames), -1) + (np.arange(len(frames)) * n_bins)[:, None]
+    counts = np.bincount(idx.ravel(), minlength=len(frames) * n_bins).reshape(len(frames), n_bins)
+    return counts / idx.shape[1]
+
+
+def detect_shot_boundaries(video_path, sample_fps=SHOT_SAMPLE_FPS, threshold=SHOT_THRESHOLD,
+                           min_shot_length=SHOT_MIN_LENGTH, batch_size=256):
+    """
+    Find hard cuts by color-histogram difference between consecutive frames.
+
+    ffmpeg decodes the video skipping non-reference frames, drops it to
+    sample_fps and scales it to a tiny frame, so the pass runs well under
+    real time on CPU. Returns a ShotIndex.
+    """
+    width, height = SHOT_FRAME_SIZE
+    process = (
+        ffmpeg
+        .input(video_path, skip_frame='noref')
+        .video
+        .filter('fps', fps=sample_fps)
+        .filter('scale', width, height)
+        .output('pipe:', format='rawvideo', pix_fmt='bgr24')
+        .global_args('-loglevel', 'error')
+        .run_async(pipe_stdout=True)
+    )
+
+    frame_size = width * height * 3
+    min_gap = max(1, int(round(min_shot_length * sample_fps)))
+    cuts = []
+    previous = None
+    frame_index = 0
+    last_cut = -min_gap
+    try:
+        while True:
+            raw = process.stdout.read(frame_size * batch_size)
+            n = len(raw) // frame_size
+            if n == 0:
+                break
+            frames = np.frombuffer(raw[:n * frame_size], np.uint8).reshape(n, height, width, 3)
+            hists = _frame_histograms(frames)
+            if previous is not None:
+                hists = np.vstack([previous, hists])
+            # Half L1 distance: 0 = identical color distribution, 1 = disjoint
+            diffs = 0.5 * np.abs(np.diff(hists, axis=0)).sum(axis=1)
+            offset = frame_index + (0 if previous is not None else 1)
+            for i in np.flatnonzero(diffs > threshold):
+                cut_frame = offset + int(i)
+                if cut_frame - last_cut >= min_gap:
+                    cuts.append(cut_frame / sample_fps)
+                    last_cut = cut_frame
+            previous = hists[-1:]
+            frame_index += n
+    finally:
+        process.stdout.close()
+        returncode = process.wait()
+
+    if returncode != 0 and frame_index == 0:
+        raise RuntimeError(f"ffmpeg could not decode {video_path}")
+    duration = frame_index / sample_fps
+    print(f"✓ Shot detection: {len(cuts)} cuts in {duration:.0f}s of video")
+    return ShotIndex(cuts, duration)
+
+
+def get_shot_index(video_path, sample_fps=SHOT_SAMPLE_FPS, threshold=SHOT_THRESHOLD, use_cache=True):
+    """
+    ShotIndex for video_path, detected once per source and persisted in the
+    shot cache (keyed by the file's path, size and mtime).
+    """
+    key = make_key("shots", hash_file_stat(video_path), sample_fps, threshold)
+    if use_cache:
+        cached = shot_cache.get(key)
+        if cached is not None:
+            return ShotIndex.from_dict(cached)
+
+    index = detect_shot_boundaries(video_path, sample_fps, threshold)
+    if use_cache:
+        try:
+            shot_cache.set(key, index.to_dict())
+        except OSError as e:
+            print(f"Warning: Could not write shot cache: {e}")
+    return index
+
+
+if __name__ == "__main__":
+    index = get_shot_index("Example.mp4")
+    print(index.cuts.tolist())
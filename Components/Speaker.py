@@ -1,140 +1,338 @@
 import cv2
 import numpy as np
-import webrtcvad
-import wave
-import contextlib
-from pydub import AudioSegment
 import os
+from Components.Edit import extractAudio
+from Components.Models import get_face_dnn, get_vad, FACE_DNN_PROTOTXT, FACE_DNN_MODEL
+from Components.VoiceActivity import get_vad_track
 
-# Update paths to the model files
-prototxt_path = "models/deploy.prototxt"
-model_path = "models/res10_300x300_ssd_iter_140000_fp16.caffemodel"
+# The face DNN (models/*.caffemodel) and the VAD are loaded on first use by
+# Components/Models.py, so importing this module costs nothing
 temp_audio_path = "temp_audio.wav"
 
-# Load DNN model
-net = cv2.dnn.readNetFromCaffe(prototxt_path, model_path)
+# Speaker analysis: every SPEAKER_STRIDE-th frame goes through the res10 SSD
+# face detector, SPEAKER_BATCH_SIZE frames per forward pass
+SPEAKER_STRIDE = 5
+SPEAKER_BATCH_SIZE = 16
+SPEAKER_CONFIDENCE = 0.3
+SPEAKER_INPUT_SIZE = 300
+SPEAKER_MEAN = (104.0, 177.0, 123.0)
+
+# Active speaker: while there is voice activity, the face whose mouth (lower
+# third of the box, compared at SPEAKER_MOUTH_SIZE) changed most since the
+# previous analyzed frame. Faces are matched between frames by center, within
+# SPEAKER_MATCH_DISTANCE of the frame width; switching away from the current
+# speaker takes SPEAKER_SWITCH_MARGIN times their lip motion.
+SPEAKER_MOUTH_SIZE = (24, 12)
+SPEAKER_MATCH_DISTANCE = 0.15
+SPEAKER_SWITCH_MARGIN = 1.5
+
+
+def speaker_model_available():
+    """True if the res10 SSD model files are present (they aren't shipped with the repo)"""
+    return os.path.isfile(FACE_DNN_PROTOTXT) and os.path.isfile(FACE_DNN_MODEL)
 
-# Initialize VAD
-vad = webrtcvad.Vad(2)  # Aggressiveness mode from 0 to 3
 
 def voice_activity_detection(audio_frame, sample_rate=16000):
-    return vad.is_speech(audio_frame, sample_rate)
+    return get_vad().is_speech(audio_frame, sample_rate)
 
 def extract_audio_from_video(video_path, audio_path):
-    audio = AudioSegment.from_file(video_path)
-    audio = audio.set_frame_rate(16000).set_channels(1)
-    audio.export(audio_path, format="wav")
-
-def process_audio_frame(audio_data, sample_rate=16000, frame_duration_ms=30):
-    n = int(sample_rate * frame_duration_ms / 1000) * 2  # 2 bytes per sample
-    offset = 0
-    while offset + n <= len(audio_data):
-        frame = audio_data[offset:offset + n]
-        offset += n
-        yield frame
+    return extractAudio(video_path, audio_path)
 
-global Frames
-Frames = [] # [x,y,w,h]
 
-def detect_faces_and_speakers(input_video_path, output_video_path):
-    # Return Frams:
-    global Frames
-    # Extract audio from the video
-    extract_audio_from_video(input_video_path, temp_audio_path)
+def detect_faces_batch(net, images, confidence=SPEAKER_CONFIDENCE):
+    """
+    Run the SSD face detector on a batch of SPEAKER_INPUT_SIZE square images
+    in one forward pass.
+
+    Returns (image_ids, boxes, scores) for the detections above confidence:
+    image_ids index into images, boxes are (x0, y0, x1, y1) as fractions of
+    the frame size.
+    """
+    blob = cv2.dnn.blobFromImages(images, 1.0, (SPEAKER_INPUT_SIZE, SPEAKER_INPUT_SIZE), SPEAKER_MEAN)
+    net.setInput(blob)
+    detections = net.forward().reshape(-1, 7)  # [image_id, label, score, x0, y0, x1, y1]
+    boxes = np.clip(detections[:, 3:7], 0.0, 1.0)
+    keep = ((detections[:, 2] > confidence)
+            & (boxes[:, 2] > boxes[:, 0])
+            & (boxes[:, 3] > boxes[:, 1]))
+    return detections[keep, 0].astype(np.int32), boxes[keep], detections[keep, 2]
+
+
+def pick_speakers(image_ids, boxes, count):
+    """
+    Index of the tallest face's detection for each of count images (-1 if
+    none), without Python loops: the speaker guess when there is no audio
+    (the old lip-distance heuristic, a third of the face height, amounted to
+    the same) and the starting point for follow_speaker.
+    """
+    best = np.full(count, -1, dtype=np.int64)
+    if len(image_ids) == 0:
+        return best
+    heights = boxes[:, 3] - boxes[:, 1]
+    order = np.lexsort((heights, image_ids))  # by image, then height ascending
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = image_ids[order][1:] != image_ids[order][:-1]
+    best[image_ids[order][last]] = order[last]
+    return best
+
+
+def mouth_patches(image, boxes):
+    """
+    Gray patches of the lower third of each box (x0, y0, x1, y1 as fractions)
+    in a detector input image, resized to SPEAKER_MOUTH_SIZE with their mean
+    removed (so lighting changes don't count as motion).
+    """
+    height, width = image.shape[:2]
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    patches = np.zeros((len(boxes), SPEAKER_MOUTH_SIZE[1], SPEAKER_MOUTH_SIZE[0]), np.float32)
+    for k, (x0, y0, x1, y1) in enumerate(boxes):
+        left, right = int(x0 * width), int(np.ceil(x1 * width))
+        top, bottom = int((y0 + (y1 - y0) * 2 / 3) * height), int(np.ceil(y1 * height))
+        patch = gray[top:max(bottom, top + 1), left:max(right, left + 1)]
+        if patch.size:
+            patch = cv2.resize(patch, SPEAKER_MOUTH_SIZE, interpolation=cv2.INTER_AREA).astype(np.float32)
+            patches[k] = patch - patch.mean()
+    return patches
+
+
+def match_faces(boxes, previous_boxes, max_distance=SPEAKER_MATCH_DISTANCE):
+    """For each box, the index of the previous box with the nearest center (within max_distance), or -1"""
+    if not len(boxes) or not len(previous_boxes):
+        return np.full(len(boxes), -1, dtype=np.int64)
+    centers = (boxes[:, 0] + boxes[:, 2]) / 2
+    previous = (previous_boxes[:, 0] + previous_boxes[:, 2]) / 2
+    distance = np.abs(centers[:, None] - previous[None, :])
+    nearest = distance.argmin(axis=1)
+    return np.where(distance[np.arange(len(boxes)), nearest] <= max_distance, nearest, -1)
+
+
+def follow_speaker(state, image, detections, boxes, tallest, speaking):
+    """
+    Active speaker of one analyzed frame, as an index into boxes (-1 if no
+    face). detections are the indices of this frame's boxes, tallest the
+    pick_speakers choice and speaking its voice activity. While someone is
+    speaking, the face with the most lip motion since the previous analyzed
+    frame wins (see SPEAKER_SWITCH_MARGIN); otherwise whoever spoke last
+    stays selected, or the tallest face if nobody has yet. state is a dict
+    carried from frame to frame (start with {}).
+    """
+    face_boxes = boxes[detections]
+    patches = mouth_patches(image, face_boxes)
+    previous_patches = state.get('patches')
+    matches = match_faces(face_boxes, state.get('boxes', face_boxes[:0]))
+    motion = np.array([np.abs(patches[k] - previous_patches[m]).mean() if m >= 0 else 0.0
+                       for k, m in enumerate(matches)], dtype=np.float32)
+    speaker = state.get('speaker')
+    current = int(match_faces(speaker, face_boxes)[0]) if speaker is not None else -1
+    state['boxes'], state['patches'] = face_boxes, patches
+    if not len(detections):
+        return -1
+
+    if speaking and motion.max() > 0:
+        loudest = int(np.argmax(motion))
+        if current < 0 or motion[loudest] > SPEAKER_SWITCH_MARGIN * motion[current]:
+            current = loudest
+    if current < 0:
+        current = int(np.flatnonzero(detections == tallest)[0]) if tallest >= 0 else 0
+    state['speaker'] = face_boxes[current:current + 1]
+    return int(detections[current])
+
+
+class SpeakerTrack:
+    """
+    Result of analyze_speakers as flat arrays over the analyzed frames
+    (every `stride`-th frame of the section, starting with its first):
+        frames:   int32 frame index relative to the section start
+        boxes:    int32 (n, 4) x0, y0, x1, y1 of the likely speaker, -1 if no face
+        faces:    int16 number of faces detected
+        speaking: bool voice activity at the frame's time (all False without audio)
+    """
+
+    __slots__ = ('width', 'height', 'fps', 'frame_count', 'stride', 'frames', 'boxes', 'faces', 'speaking')
+
+    def __init__(self, width, height, fps, frame_count, stride, frames, boxes, faces, speaking):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.frame_count = frame_count
+        self.stride = stride
+        self.frames = np.asarray(frames, np.int32)
+        self.boxes = np.asarray(boxes, np.int32).reshape(-1, 4)
+        self.faces = np.asarray(faces, np.int16)
+        self.speaking = np.asarray(speaking, bool)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def index_at(self, frame):
+        """Analyzed sample covering a section frame (O(1): samples are evenly spaced)"""
+        return min(len(self.frames) - 1, max(0, frame // self.stride))
 
-    # Read the extracted audio
-    with contextlib.closing(wave.open(temp_audio_path, 'rb')) as wf:
-        sample_rate = wf.getframerate()
-        audio_data = wf.readframes(wf.getnframes())
+    def box_at(self, frame):
+        """Speaker box (x0, y0, x1, y1) at a section frame, or None"""
+        box = self.boxes[self.index_at(frame)]
+        return None if box[0] < 0 else tuple(int(v) for v in box)
 
-    cap = cv2.VideoCapture(input_video_path)
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(output_video_path, fourcc, 30.0, (int(cap.get(3)), int(cap.get(4))))
+    def centers(self):
+        """Speaker center x per analyzed frame, NaN where no face was found"""
+        centers = (self.boxes[:, 0] + self.boxes[:, 2]) / 2.0
+        centers[self.boxes[:, 0] < 0] = np.nan
+        return centers
 
-    frame_duration_ms = 30  # 30ms frames
-    audio_generator = process_audio_frame(audio_data, sample_rate, frame_duration_ms)
+    def frame_centers(self):
+        """Speaker center x for every section frame, interpolated between samples (None if no face at all)"""
+        centers = self.centers()
+        found = ~np.isnan(centers)
+        if not np.any(found):
+            return None
+        return np.interp(np.arange(self.frame_count), self.frames[found], centers[found])
 
-    while cap.isOpened():
+
+def analyze_speakers(input_video_path, start_time=0, end_time=None, audio_path=None, stride=SPEAKER_STRIDE,
+                     batch_size=SPEAKER_BATCH_SIZE, confidence=SPEAKER_CONFIDENCE, debug_output=None,
+                     vad_track=None):
+    """
+    Find the likely active speaker on every `stride`-th frame of a video section.
+
+    Frames in between are skipped with grab(); analyzed frames are shrunk to
+    the detector's input size right away and run through the res10 SSD net
+    batch_size at a time (blobFromImages), and detections are filtered with
+    NumPy. Each analyzed frame gets the voice activity at its timestamp from
+    vad_track (a VoiceActivity.VadTrack of this video's audio; see
+    VadTrack.section for a clip cut from a longer source), or from the track
+    of audio_path (16 kHz mono, computed once and shared), and the speaker
+    is the face moving its lips while there is speech (follow_speaker).
+    Without audio it is just the tallest face.
+    debug_output optionally writes the analyzed frames with boxes drawn (at
+    fps / stride).
+
+    Returns a SpeakerTrack, or None if the video can't be opened.
+    """
+    net = get_face_dnn()
+    cap = cv2.VideoCapture(input_video_path, cv2.CAP_FFMPEG)
+    if not cap.isOpened():
+        print("Error: Could not open video.")
+        return None
+
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    first_frame = int(round(start_time * fps)) if start_time else 0
+    last_frame = total_frames if end_time is None else min(total_frames, int(round(end_time * fps)))
+    section_frames = max(0, last_frame - first_frame)
+    stride = max(1, int(stride))
+
+    writer = None
+    if debug_output:
+        writer = cv2.VideoWriter(debug_output, cv2.VideoWriter_fourcc(*'mp4v'), fps / stride, (width, height))
+
+    if vad_track is None and audio_path:
+        vad_track = get_vad_track(audio_path)
+
+    frames, boxes, faces = [], [], []
+    batch, batch_frames, debug_frames = [], [], []
+    state = {}
+
+    def flush():
+        image_ids, found, _ = detect_faces_batch(net, batch, confidence)
+        best = pick_speakers(image_ids, found, len(batch))
+        if vad_track is not None:
+            speaking = vad_track.at_frames(batch_frames, fps, start_time)
+            for i, image in enumerate(batch):
+                best[i] = follow_speaker(state, image, np.flatnonzero(image_ids == i), found, best[i], speaking[i])
+        scaled = np.round(found * np.array([width, height, width, height])).astype(np.int32)
+        batch_boxes = np.full((len(batch), 4), -1, dtype=np.int32)
+        batch_boxes[best >= 0] = scaled[best[best >= 0]]
+        frames.extend(batch_frames)
+        boxes.append(batch_boxes)
+        faces.append(np.bincount(image_ids, minlength=len(batch)))
+        if writer is not None:
+            for i, (frame, speaker_box) in enumerate(zip(debug_frames, batch_boxes)):
+                for x0, y0, x1, y1 in scaled[image_ids == i]:
+                    cv2.rectangle(frame, (x0, y0), (x1, y1), (0, 255, 0), 2)
+                if speaker_box[0] >= 0:
+                    cv2.putText(frame, "Active Speaker", (speaker_box[0], max(0, speaker_box[1] - 10)),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
+                writer.write(frame)
+        batch.clear()
+        batch_frames.clear()
+        debug_frames.clear()
+
+    cap.set(cv2.CAP_PROP_POS_FRAMES, first_frame)
+    for index in range(section_frames):
+        if index % stride:
+            if not cap.grab():
+                break
+            continue
         ret, frame = cap.read()
         if not ret:
             break
+        batch.append(cv2.resize(frame, (SPEAKER_INPUT_SIZE, SPEAKER_INPUT_SIZE), interpolation=cv2.INTER_AREA))
+        batch_frames.append(index)
+        if writer is not None:
+            debug_frames.append(frame)
+        if len(batch) == batch_size:
+            flush()
+    if batch:
+        flush()
+    cap.release()
+    if writer is not None:
+        writer.release()
 
-        h, w = frame.shape[:2]
-        blob = cv2.dnn.blobFromImage(cv2.resize(frame, (300, 300)), 1.0, (300, 300), (104.0, 177.0, 123.0))
-        net.setInput(blob)
-        detections = net.forward()
+    frames = np.asarray(frames, np.int32)
+    boxes = np.concatenate(boxes) if boxes else np.zeros((0, 4), np.int32)
+    faces = np.concatenate(faces) if faces else np.zeros(0, np.int16)
 
-        audio_frame = next(audio_generator, None)
-        if audio_frame is None:
-            break
-        is_speaking_audio = voice_activity_detection(audio_frame, sample_rate)
-        MaxDif = 0
-        Add = []
-        face_found = False
-        x, y, x1, y1 = 0, 0, 0, 0  # Initialize to prevent UnboundLocalError
-        for i in range(detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence > 0.3:  # Confidence threshold
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (x, y, x1, y1) = box.astype("int")
-                face_width = x1 - x
-                face_height = y1 - y
-
-                # Draw bounding box
-                cv2.rectangle(frame, (x, y), (x1, y1), (0, 255, 0), 2)
-
-                # Assuming lips are approximately at the bottom third of the face
-                lip_distance = abs((y + 2 * face_height // 3) - (y1))
-                Add.append([[x, y, x1, y1], lip_distance])
-
-                MaxDif = max(lip_distance, MaxDif)
-                face_found = True
-        for i in range(detections.shape[2]):
-            confidence = detections[0, 0, i, 2]
-            if confidence > 0.3:  # Confidence threshold
-                box = detections[0, 0, i, 3:7] * np.array([w, h, w, h])
-                (x, y, x1, y1) = box.astype("int")
-                face_width = x1 - x
-                face_height = y1 - y
-
-                # Draw bounding box
-                cv2.rectangle(frame, (x, y), (x1, y1), (0, 255, 0), 2)
-
-                # Assuming lips are approximately at the bottom third of the face
-                lip_distance = abs((y + 2 * face_height // 3) - (y1))
-                print(lip_distance)
-
-                # Combine visual and audio cues
-                if lip_distance >= MaxDif and is_speaking_audio:  # Adjust the threshold as needed
-                    cv2.putText(frame, "Active Speaker", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 0), 2)
-                if lip_distance >= MaxDif:
-                    break
-
-        if face_found and Add:
-            # Use the face with maximum lip movement (most likely speaker)
-            best_face = max(Add, key=lambda f: f[1])
-            Frames.append(best_face[0])  # Append [x, y, x1, y1]
-        else:
-            # If no face detected, append previous frame's values or None
-            if len(Frames) > 0:
-                Frames.append(Frames[-1])
-            else:
-                Frames.append(None)
+    if vad_track is not None:
+        speaking = vad_track.at_frames(frames, fps, start_time)
+    else:
+        speaking = np.zeros(len(frames), dtype=bool)
 
-        out.write(frame)
-        # cv2.imshow('Frame', frame)
-        # if cv2.waitKey(1) & 0xFF == ord('q'):
-        #     break
+    with_face = int(np.count_nonzero(boxes[:, 0] >= 0))
+    print(f"Speaker analysis: {with_face}/{len(frames)} analyzed frames with a face "
+          f"(every {stride} frames, batches of {batch_size})")
+    return SpeakerTrack(width, height, fps, section_frames, stride, frames, boxes, faces, speaking)
 
-    cap.release()
-    out.release()
-    cv2.destroyAllWindows()
-    os.remove(temp_audio_path)
+
+global Frames
+Frames = [] # [x,y,x1,y1] per frame, kept for detect_faces_and_speakers callers
+
+def detect_faces_and_speakers(input_video_path, output_video_path=None, audio_path=None, stride=1):
+    """
+    Compatibility wrapper around analyze_speakers: fills the global Frames
+    list with the speaker box of every frame (holding the previous one when
+    no face is found) and returns the SpeakerTrack. output_video_path, if
+    given, gets the annotated debug video.
+    """
+    global Frames
+    # Reuse the pipeline's 16 kHz mono audio if given, otherwise extract it
+    own_audio = audio_path is None
+    if own_audio:
+        audio_path = extract_audio_from_video(input_video_path, temp_audio_path)
+
+    try:
+        track = analyze_speakers(input_video_path, audio_path=audio_path, stride=stride,
+                                 debug_output=output_video_path)
+    finally:
+        if own_audio and audio_path and os.path.exists(audio_path):
+            os.remove(audio_path)
+    if track is None:
+        return None
+
+    Frames.clear()
+    for frame in range(track.frame_count):
+        box = track.box_at(frame) if len(track) else None
+        if box is None:
+            Frames.append(Frames[-1] if Frames else None)
+        else:
+            Frames.append(list(box))
+    return track
 
 
 
 if __name__ == "__main__":
-    detect_faces_and_speakers()
+    detect_faces_and_speakers("Out.mp4", "DecOut.mp4")
     print(Frames)
     print(len(Frames))
     print(Frames[1:5])
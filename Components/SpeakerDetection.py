@@ -1,8 +1,9 @@
 import cv2
 import numpy as np
+from Components.Models import get_face_cascade
 #Face Detection function
 def detect_faces(video_file):
-    face_cascade = cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+    face_cascade = get_face_cascade()
 
     # Load the video
     cap = cv2.VideoCapture(video_file)
@@ -1,7 +1,14 @@
-from moviepy.editor import VideoFileClip, TextClip, CompositeVideoClip
+from moviepy.editor import VideoFileClip
+import os
 import re
+from Components.Captions import SubtitleRenderer, KaraokeRenderer
 
-def add_subtitles_to_video(input_video, output_video, transcriptions, video_start_time=0):
+
+class RenderCancelled(Exception):
+    """Raised from a frame callback to stop a moviepy write once the render is cancelled"""
+
+
+def add_subtitles_to_video(input_video, output_video, transcriptions, video_start_time=0, words=None, cancel=None):
     """
     Add subtitles to video based on transcription segments.
     
@@ -10,75 +17,54 @@ def add_subtitles_to_video(input_video, output_video, transcriptions, video_star
         output_video: Path to output video file
         transcriptions: List of [text, start, end] from transcribeAudio
         video_start_time: Start time offset if video was cropped
+        words: Optional WordTimings for karaoke-style captions
+        cancel: Optional threading.Event; once set, writing stops at the
+            next frame (output_video is left incomplete)
     """
     video = VideoFileClip(input_video)
-    video_duration = video.duration
-    
-    # Filter transcriptions to only those within the video timeframe
-    relevant_transcriptions = []
-    for text, start, end in transcriptions:
-        # Adjust times relative to video start
-        adjusted_start = start - video_start_time
-        adjusted_end = end - video_start_time
-        
-        # Only include if within video duration
-        if adjusted_end > 0 and adjusted_start < video_duration:
-            adjusted_start = max(0, adjusted_start)
-            adjusted_end = min(video_duration, adjusted_end)
-            relevant_transcriptions.append([text.strip(), adjusted_start, adjusted_end])
-    
-    if not relevant_transcriptions:
-        print("No transcriptions found for this video segment")
-        video.write_videofile(output_video, codec='libx264', audio_codec='aac')
-        video.close()
-        return
-    
-    # Create text clips for each transcription segment
-    text_clips = []
-    
-    # Scale font size proportionally to video height (~6.5% of height)
-    # 1080p → 70px, 720p → 47px
-    dynamic_fontsize = int(video.h * 0.065)
     
-    for text, start, end in relevant_transcriptions:
-        # Clean up text
-        text = text.strip()
-        if not text:
-            continue
-            
-        # Create text clip with styling
-        txt_clip = TextClip(
-            text,
-            fontsize=dynamic_fontsize,
-            color='#2699ff',
-            stroke_color='black',
-            stroke_width=2,
-            font='Franklin-Gothic',
-            method='caption',
-            size=(video.w - 100, None)  # Leave 50px margin on each side
+    # Captions are rasterized once each and blended into the frames that show them
+    if words is not None and len(words):
+        renderer = KaraokeRenderer(transcriptions, words, video.w, video.h, video_start_time=video_start_time,
+                                   video_duration=video.duration, bgr=False)
+    else:
+        renderer = SubtitleRenderer(transcriptions, video.w, video.h, video_start_time=video_start_time,
+                                    video_duration=video.duration, bgr=False)
+
+    def draw(get_frame, t):
+        if cancel is not None and cancel.is_set():
+            raise RenderCancelled(output_video)
+        return renderer.overlay(get_frame(t), t)
+
+    final_video = None
+    temp_audio = f"{os.path.splitext(output_video)[0]}_audio.m4a"
+    try:
+        # fl() already draws the first frame
+        final_video = video.fl(draw)
+        if not len(renderer):
+            print("No transcriptions found for this video segment")
+            final_video.write_videofile(output_video, codec='libx264', audio_codec='aac',
+                                        temp_audiofile=temp_audio)
+            return
+
+        print(f"Adding {len(renderer)} subtitle segments to video...")
+        # Write output
+        final_video.write_videofile(
+            output_video,
+            codec='libx264',
+            audio_codec='aac',
+            fps=video.fps,
+            preset='medium',
+            bitrate='3000k',
+            temp_audiofile=temp_audio
         )
-        
-        # Position at bottom center
-        txt_clip = txt_clip.set_position(('center', video.h - txt_clip.h - 100))
-        txt_clip = txt_clip.set_start(start)
-        txt_clip = txt_clip.set_duration(end - start)
-        
-        text_clips.append(txt_clip)
-    
-    # Composite video with subtitles
-    print(f"Adding {len(text_clips)} subtitle segments to video...")
-    final_video = CompositeVideoClip([video] + text_clips)
-    
-    # Write output
-    final_video.write_videofile(
-        output_video,
-        codec='libx264',
-        audio_codec='aac',
-        fps=video.fps,
-        preset='medium',
-        bitrate='3000k'
-    )
-    
-    video.close()
-    final_video.close()
+    except RenderCancelled:
+        print(f"Subtitles for {output_video} cancelled")
+        return
+    finally:
+        video.close()
+        if final_video is not None:
+            final_video.close()
+        if os.path.exists(temp_audio):
+            os.remove(temp_audio)
     print(f"✓ Subtitles added successfully -> {output_video}")
@@ -1,5 +1,5 @@
 from moviepy.editor import *
-from Transcription import transcribeAudio
+from Components.Captions import KaraokeRenderer
 import re
 import math
 
@@ -173,6 +173,37 @@ class EnhancedTextOverlay:
         final_video.close()
         self.video.close()
 
+    def create_karaoke_video(self, transcriptions, words, fps=30):
+        """
+        Create the video with captions that highlight each word as it is spoken.
+
+        words is a WordTimings (see transcribeAudio(words=...)). Captions are
+        drawn from cached line/word sprites by KaraokeRenderer instead of one
+        TextClip per word, so long clips stay fast.
+        """
+        if not transcriptions or words is None or not len(words):
+            print("No word timings found. Use create_enhanced_video for segment captions.")
+            return
+
+        renderer = KaraokeRenderer(transcriptions, words, self.video.w, self.video.h,
+                                   video_duration=self.video.duration, bgr=False)
+        print(f"Highlighting {len(words)} words across {len(renderer)} captions...")
+        final_video = self.video.fl(lambda get_frame, t: renderer.overlay(get_frame(t), t))
+
+        print(f"Writing final video to {self.output_path}...")
+        final_video.write_videofile(
+            self.output_path,
+            fps=fps,
+            codec='libx264',
+            audio_codec='aac',
+            temp_audiofile='temp-audio.m4a',
+            remove_temp=True
+        )
+
+        print("Karaoke video creation completed!")
+        final_video.close()
+        self.video.close()
+
 def main():
     """Main function to run the enhanced text overlay"""
     # Sample transcription data (replace with actual data)
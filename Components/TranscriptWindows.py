@@ -0,0 +1,82 @@
+def format_compact(segments):
+    """Render segments as "start - end: text" lines with timestamps rounded to 0.1s ("12.3 - 15.2: text")"""
+    return "".join(f"{start:.1f} - {end:.1f}: {text.strip()}\n" for text, start, end in segments)
+
+
+SENTENCE_END = ('.', '!', '?')
+
+
+def iter_sentences(segments, max_seconds=20):
+    """
+    Merge consecutive Whisper segments into whole sentences (at most
+    max_seconds long), so the LLM sees fewer, complete lines and every
+    timestamp it can return is a sentence boundary. Works on the live stream
+    from stream_transcription: each sentence is yielded as soon as its last
+    segment arrives.
+    """
+    current = None
+    for text, start, end in segments:
+        text = text.strip()
+        if not text:
+            continue
+        if current is None:
+            current = [text, start, end]
+        else:
+            current = [f"{current[0]} {text}", current[1], end]
+        if text.endswith(SENTENCE_END) or current[2] - current[1] >= max_seconds:
+            yield current
+            current = None
+    if current is not None:
+        yield current
+
+
+_encoding = None
+
+
+def estimate_tokens(text):
+    """
+    Token count of text for the OpenAI models: exact with tiktoken when its
+    encoding is available, otherwise ~4 characters per token.
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False  # not installed, or the encoding can't be downloaded
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def iter_token_windows(segments, max_tokens=4000, overlap_tokens=400):
+    """
+    Split segments into consecutive windows whose compact transcript fits in
+    max_tokens, each starting with about overlap_tokens worth of the previous
+    window's tail so a highlight spanning a seam is visible in one window.
+    Yields lists of [text, start, end]; on a live stream each window is
+    yielded as soon as the segment that overflows it arrives.
+    """
+    window, window_tokens = [], []
+    for segment in segments:
+        tokens = estimate_tokens(format_compact([segment]))
+        if window and sum(window_tokens) + tokens > max_tokens:
+            yield window
+            # Carry the tail of this window into the next one
+            keep = 0
+            carried = 0
+            while keep < len(window) - 1 and carried + window_tokens[-1 - keep] <= overlap_tokens:
+                carried += window_tokens[-1 - keep]
+                keep += 1
+            window, window_tokens = (window[-keep:], window_tokens[-keep:]) if keep else ([], [])
+        window.append(segment)
+        window_tokens.append(tokens)
+    if window:
+        yield window
+
+
+if __name__ == "__main__":
+    sample = [[f" Sentence {i}.", i * 10.0, i * 10.0 + 9.5] for i in range(30)]
+    for window in iter_token_windows(iter_sentences(sample), max_tokens=60, overlap_tokens=20):
+        print(f"{window[0][1]}s - {window[-1][2]}s: {len(window)} sentences")
@@ -1,29 +1,303 @@
-from faster_whisper import WhisperModel
-import torch
+import os
+import queue
+import tempfile
+import threading
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from Components.Models import get_whisper_model, get_whisper_device, default_compute_type
+from Components.Cache import DiskCache, hash_file, hash_file_stat, make_key
+from Components.Edit import load_audio, pcm_to_float, AUDIO_SAMPLE_RATE
+from Components.WordTimings import WordTimings
 
-def transcribeAudio(audio_path):
-    try:
+# On-disk cache of [text, start, end] segment lists, so re-running the same
+# video (regenerate, different clip length, ...) skips transcription entirely
+TRANSCRIPT_CACHE_DIR = os.getenv("TRANSCRIPT_CACHE_DIR", os.path.join(".cache", "transcripts"))
+TRANSCRIPT_CACHE_MAX_MB = int(os.getenv("TRANSCRIPT_CACHE_MAX_MB", "200"))
+transcript_cache = DiskCache(TRANSCRIPT_CACHE_DIR, TRANSCRIPT_CACHE_MAX_MB * 1024 * 1024)
+
+
+def transcript_cache_keys(audio_path=None, source_path=None, model_size="base.en", beam_size=5, language="en",
+                          word_timestamps=False, device=None, compute_type=None, workers=1):
+    """
+    Cache keys for a transcription: one from the decoded audio's content and/or
+    one from the source video's path, size and mtime (cheap, no audio needed).
+    Transcriptions with word timestamps are cached separately (Whisper segments
+    them slightly differently), and so are those from another device, compute
+    type or worker count, whose segments differ too. device and compute_type
+    are resolved the way the model is loaded (parallel workers run on CPU).
+    """
+    device = "cpu" if workers > 1 else (device or get_whisper_device())
+    compute_type = compute_type or default_compute_type(device)
+    extra = ("words",) if word_timestamps else ()
+    settings = (model_size, beam_size, language, device, compute_type, workers, *extra)
+    keys = []
+    if source_path and os.path.isfile(source_path):
+        keys.append(make_key("source", hash_file_stat(source_path), *settings))
+    if audio_path and os.path.isfile(audio_path):
+        keys.append(make_key("audio", hash_file(audio_path), *settings))
+    return keys
+
+
+def _words_key(key):
+    return make_key(key, "word-timings")
+
+
+def get_cached_transcription(audio_path=None, source_path=None, model_size="base.en", beam_size=5, language="en",
+                             word_timestamps=False, device=None, compute_type=None, workers=1):
+    """Return cached [text, start, end] segments for this audio/source, or None"""
+    for key in transcript_cache_keys(audio_path, source_path, model_size, beam_size, language, word_timestamps,
+                                     device, compute_type, workers):
+        cached = transcript_cache.get(key)
+        if cached is not None:
+            return cached
+    return None
+
+
+def get_cached_words(audio_path=None, source_path=None, model_size="base.en", beam_size=5, language="en",
+                     device=None, compute_type=None, workers=1):
+    """Return the cached WordTimings for this audio/source, or None"""
+    for key in transcript_cache_keys(audio_path, source_path, model_size, beam_size, language, True,
+                                     device, compute_type, workers):
+        cached = transcript_cache.get(_words_key(key))
+        if cached is not None:
+            return WordTimings.from_dict(cached)
+    return None
+
+
+def stream_transcription(audio_path, model_size="base.en", device=None, compute_type=None,
+                         beam_size=5, language="en", source_path=None, use_cache=True, workers=1, words=None):
+    """
+    Yield [text, start, end] segments as Whisper produces them.
+
+    Decoding runs in a background thread and hands segments over through a
+    queue, so whatever the caller does with each segment (windowing, scoring,
+    printing progress) overlaps with decoding of the next ones instead of
+    pausing it. The full list is written to the transcript cache once the
+    stream completes; a cache hit yields the cached segments straight away.
+
+    With workers > 1 the audio is split at silences and transcribed on CPU by
+    a process pool (see iter_parallel_transcription).
+
+    words: optional list; if given, Whisper's word timestamps are enabled and
+    every word is appended to it as [word, start, end] (see
+    WordTimings.from_words) by the time the stream ends.
+    """
+    word_timestamps = words is not None
+    keys = transcript_cache_keys(audio_path, source_path, model_size, beam_size, language,
+                                 word_timestamps, device, compute_type, workers) if use_cache else []
+    for key in keys:
+        cached = transcript_cache.get(key)
+        cached_words = transcript_cache.get(_words_key(key)) if word_timestamps else None
+        if cached is not None and (cached_words is not None or not word_timestamps):
+            print(f"✓ Using cached transcription: {len(cached)} segments")
+            if word_timestamps:
+                words.extend(WordTimings.from_dict(cached_words))
+            yield from cached
+            return
+
+    if workers > 1:
+        print(f"Transcribing audio in parallel ({workers} workers)...")
+        segments = iter_parallel_transcription(audio_path, workers, model_size, compute_type, beam_size, language,
+                                               word_timestamps)
+    else:
         print("Transcribing audio...")
-        Device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(Device)
-        model = WhisperModel("base.en", device="cuda" if torch.cuda.is_available() else "cpu")
-        print("Model loaded")
-        segments, info = model.transcribe(audio=audio_path, beam_size=5, language="en", max_new_tokens=128, condition_on_previous_text=False)
-        segments = list(segments)
-        # print(segments)
-        extracted_texts = [[segment.text, segment.start, segment.end] for segment in segments]
-        print(f"✓ Transcription complete: {len(extracted_texts)} segments extracted")
-        return extracted_texts
+        model = get_whisper_model(model_size, device=device, compute_type=compute_type)
+        segments, info = model.transcribe(audio=audio_path, beam_size=beam_size, language=language, max_new_tokens=128,
+                                          condition_on_previous_text=False, word_timestamps=word_timestamps)
+
+    segment_queue = queue.Queue()
+    stop = threading.Event()
+    done = object()
+
+    def produce():
+        try:
+            for segment in segments:
+                if stop.is_set():
+                    break
+                if isinstance(segment, list):
+                    # Parallel chunks carry their (already offset) words as a 4th item
+                    segment_words = segment[3] if len(segment) > 3 else None
+                    segment = segment[:3]
+                else:
+                    segment_words = [[w.word, w.start, w.end] for w in segment.words or []] if word_timestamps else None
+                    segment = [segment.text, segment.start, segment.end]
+                if word_timestamps and segment_words:
+                    words.extend(segment_words)
+                segment_queue.put(segment)
+        except Exception as e:
+            segment_queue.put(e)
+        finally:
+            segment_queue.put(done)
+
+    threading.Thread(target=produce, name="whisper-decode", daemon=True).start()
+
+    extracted_texts = []
+    try:
+        while True:
+            item = segment_queue.get()
+            if item is done:
+                break
+            if isinstance(item, Exception):
+                raise item
+            extracted_texts.append(item)
+            yield item
+    finally:
+        # Stops the decoder thread if the consumer abandons the stream early
+        stop.set()
+
+    print(f"✓ Transcription complete: {len(extracted_texts)} segments extracted")
+    if keys and extracted_texts:
+        try:
+            for key in keys:
+                if word_timestamps:
+                    transcript_cache.set(_words_key(key), WordTimings.from_words(words).to_dict())
+                transcript_cache.set(key, extracted_texts)
+        except OSError as e:
+            print(f"Warning: Could not write transcript cache: {e}")
+
+
+def transcribeAudio(audio_path, model_size="base.en", device=None, compute_type=None,
+                    beam_size=5, language="en", source_path=None, use_cache=True, workers=1, words=None):
+    try:
+        return list(stream_transcription(audio_path, model_size, device, compute_type,
+                                         beam_size, language, source_path, use_cache, workers, words))
     except Exception as e:
         print("Transcription Error:", e)
         return []
 
+
+SAMPLE_RATE = AUDIO_SAMPLE_RATE
+
+
+def find_split_points(audio, n_chunks, sample_rate=SAMPLE_RATE, search_seconds=10.0, frame_ms=30):
+    """
+    Choose n_chunks - 1 split points (in samples) near equal-length boundaries,
+    each moved to the quietest spot within +/- search_seconds (at most a
+    quarter of a chunk), so no word is cut in half at a chunk seam. Every
+    chunk stays at least half the equal length.
+    """
+    frame = int(sample_rate * frame_ms / 1000)
+    n_frames = len(audio) // frame
+    if n_chunks <= 1 or n_frames == 0:
+        return []
+
+    # Frame energy, smoothed over ~300 ms so a short gap between syllables
+    # doesn't win over a real pause; edge padding keeps the ends from
+    # looking quieter than they are
+    energy = np.square(audio[:n_frames * frame].reshape(n_frames, frame), dtype=np.float32).mean(axis=1)
+    smooth = max(1, 300 // frame_ms)
+    padded = np.pad(energy, (smooth // 2, smooth - 1 - smooth // 2), mode='edge')
+    energy = np.convolve(padded, np.ones(smooth, dtype=np.float32) / smooth, mode='valid')
+
+    chunk = n_frames // n_chunks
+    search = min(int(search_seconds * 1000 / frame_ms), chunk // 4)
+    min_chunk = max(1, chunk // 2)
+    splits = []
+    for i in range(1, n_chunks):
+        target = n_frames * i // n_chunks
+        lo = max(target - search, splits[-1] // frame + min_chunk if splits else min_chunk)
+        hi = min(target + search + 1, n_frames - min_chunk)
+        if lo >= hi:
+            continue
+        quietest = lo + int(np.argmin(energy[lo:hi]))
+        splits.append(quietest * frame + frame // 2)
+    return splits
+
+
+def _transcribe_chunk(npy_path, start_sample, end_sample, model_size, compute_type, cpu_threads, beam_size, language,
+                      word_timestamps=False):
+    # Runs in a pool process: each process holds its own CPU model in the registry
+    audio = pcm_to_float(np.load(npy_path, mmap_mode='r')[start_sample:end_sample])
+    model = get_whisper_model(model_size, device="cpu", compute_type=compute_type, cpu_threads=cpu_threads)
+    segments, info = model.transcribe(audio=audio, beam_size=beam_size, language=language, max_new_tokens=128,
+                                      condition_on_previous_text=False, word_timestamps=word_timestamps)
+
+    offset = start_sample / SAMPLE_RATE
+    chunk_end = end_sample / SAMPLE_RATE
+    results = []
+    for segment in segments:
+        start = min(segment.start + offset, chunk_end)
+        end = min(segment.end + offset, chunk_end)
+        if word_timestamps:
+            segment_words = [[w.word, min(w.start + offset, chunk_end), min(w.end + offset, chunk_end)]
+                             for w in segment.words or []]
+            results.append([segment.text, start, end, segment_words])
+        else:
+            results.append([segment.text, start, end])
+    return results
+
+
+def iter_parallel_transcription(audio_path, workers, model_size="base.en", compute_type=None,
+                                beam_size=5, language="en", word_timestamps=False):
+    """
+    Transcribe audio_path on CPU with a pool of `workers` processes.
+
+    The audio is loaded once as 16 kHz mono PCM, split at the quietest point near
+    each equal-length boundary, and written to a temporary .npy file that the
+    workers memory-map. Each worker loads its own model with
+    cpu_count // workers threads. Chunk results are offset back to source time
+    and yielded in order, as soon as each chunk (and all before it) finishes.
+    With word_timestamps, each segment has a 4th item: its [word, start, end] list.
+    """
+    audio = load_audio(audio_path, SAMPLE_RATE)
+    splits = find_split_points(audio, workers)
+    bounds = list(zip([0] + splits, splits + [len(audio)]))
+    cpu_threads = max(1, (os.cpu_count() or 1) // workers)
+
+    fd, npy_path = tempfile.mkstemp(suffix='.npy')
+    os.close(fd)
+    try:
+        np.save(npy_path, audio)
+        del audio
+        # spawn: never fork a process that may hold a loaded (or loading) model
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = [
+                pool.submit(_transcribe_chunk, npy_path, start, end, model_size, compute_type,
+                            cpu_threads, beam_size, language, word_timestamps)
+                for start, end in bounds
+            ]
+            for i, future in enumerate(futures):
+                chunk_segments = future.result()
+                print(f"  chunk {i + 1}/{len(futures)} done ({len(chunk_segments)} segments)")
+                yield from chunk_segments
+    finally:
+        if os.path.exists(npy_path):
+            os.remove(npy_path)
+
+
+def benchmark_transcription(audio_path, workers, model_size="base.en", compute_type=None):
+    """Transcribe the same file single-process and with `workers` processes and report the speedup"""
+    timings = {}
+    results = {}
+    for label, n in (("single-process", 1), (f"{workers} workers", workers)):
+        start = time.time()
+        results[label] = transcribeAudio(audio_path, model_size, device="cpu", compute_type=compute_type,
+                                         use_cache=False, workers=n)
+        timings[label] = time.time() - start
+
+    single, parallel = timings.values()
+    print(f"\n{'='*60}")
+    for label, elapsed in timings.items():
+        print(f"{label}: {elapsed:.1f}s, {len(results[label])} segments")
+    print(f"Speedup: {single / parallel:.2f}x")
+    print(f"{'='*60}\n")
+    return single / parallel
+
+
 if __name__ == "__main__":
+    import sys
     audio_path = "audio.wav"
+    # python -m Components.Transcription --benchmark 4
+    if "--benchmark" in sys.argv:
+        benchmark_transcription(audio_path, int(sys.argv[sys.argv.index("--benchmark") + 1]))
+        sys.exit(0)
     transcriptions = transcribeAudio(audio_path)
     # print("Done")
     TransText = ""
 
     for text, start, end in transcriptions:
         TransText += (f"{start} - {end}: {text}")
-    print(TransText)
\ No newline at end of file
+    print(TransText)
@@ -0,0 +1,140 @@
+import os
+import threading
+import numpy as np
+from Components.Edit import load_audio, AUDIO_SAMPLE_RATE
+from Components.Models import get_vad, VAD_AGGRESSIVENESS
+
+# webrtcvad accepts 10, 20 or 30 ms frames; the track has one flag per frame
+VAD_FRAME_MS = 30
+
+
+class VadTrack:
+    """
+    Voice activity of a whole audio file as one boolean NumPy array, one flag
+    per VAD_FRAME_MS of audio from t=0. Any time (or a whole array of video
+    frame times) maps to a flag by integer division, and the fraction of
+    speech in any time range comes from a prefix sum, so every lookup is O(1).
+    """
+
+    __slots__ = ('speech', 'frame_seconds', '_cumulative')
+
+    def __init__(self, speech, frame_seconds=VAD_FRAME_MS / 1000):
+        self.speech = np.asarray(speech, dtype=bool)
+        self.frame_seconds = frame_seconds
+        self._cumulative = None
+
+    def __len__(self):
+        return len(self.speech)
+
+    @property
+    def duration(self):
+        return len(self.speech) * self.frame_seconds
+
+    def index(self, t):
+        """Frame index (or array of indices) for time(s) t in seconds, clipped to the track"""
+        index = np.floor_divide(np.asarray(t, dtype=np.float64), self.frame_seconds).astype(np.int64)
+        return np.clip(index, 0, max(0, len(self.speech) - 1))
+
+    def is_speech(self, t):
+        """Speech flag at time t (seconds), or a bool array for an array of times"""
+        if not len(self.speech):
+            return np.zeros(np.shape(t), dtype=bool) if np.ndim(t) else False
+        flags = self.speech[self.index(t)]
+        return flags if np.ndim(t) else bool(flags)
+
+    def at_frames(self, frame_indices, fps, start_time=0):
+        """Speech flag for video frames (indices relative to start_time) at fps"""
+        return self.is_speech(start_time + np.asarray(frame_indices, dtype=np.float64) / fps)
+
+    def section(self, start, end=None):
+        """VadTrack of [start, end) seconds with t=0 at start (e.g. for a clip cut out of the source)"""
+        lo = int(np.floor(start / self.frame_seconds))
+        hi = None if end is None else int(np.ceil(end / self.frame_seconds))
+        return VadTrack(self.speech[max(0, lo):hi], self.frame_seconds)
+
+    def speech_ratio(self, start, end):
+        """Fraction of [start, end) that is speech; start/end may be arrays of ranges"""
+        if self._cumulative is None:
+            self._cumulative = np.concatenate([[0], np.cumsum(self.speech, dtype=np.int64)])
+        n = len(self.speech)
+        lo = np.clip(np.floor_divide(np.asarray(start, dtype=np.float64), self.frame_seconds), 0, n).astype(np.int64)
+        hi = np.clip(np.ceil(np.asarray(end, dtype=np.float64) / self.frame_seconds), 0, n).astype(np.int64)
+        hi = np.maximum(hi, lo)
+        ratio = (self._cumulative[hi] - self._cumulative[lo]) / np.maximum(hi - lo, 1)
+        return ratio if np.ndim(ratio) else float(ratio)
+
+    def speech_ranges(self, start=0.0, end=None, min_silence=0.0):
+        """
+        (start, end) speech ranges in seconds within [start, end), merging
+        ranges separated by less than min_silence seconds of non-speech.
+        """
+        end = self.duration if end is None else min(end, self.duration)
+        lo, hi = int(self.index(start)), int(np.ceil(end / self.frame_seconds))
+        flags = self.speech[lo:hi]
+        if not len(flags):
+            return []
+        # Rising / falling edges of the speech flags
+        edges = np.flatnonzero(np.diff(np.concatenate([[False], flags, [False]]).astype(np.int8)))
+        starts = np.round((edges[0::2] + lo) * self.frame_seconds, 3)
+        ends = np.round((edges[1::2] + lo) * self.frame_seconds, 3)
+        ranges = []
+        for s, e in zip(starts, ends):
+            s, e = max(float(s), start), min(float(e), end)
+            if ranges and s - ranges[-1][1] < min_silence:
+                ranges[-1] = (ranges[-1][0], e)
+            elif e > s:
+                ranges.append((s, e))
+        return ranges
+
+
+def compute_vad_track(audio, sample_rate=AUDIO_SAMPLE_RATE, aggressiveness=VAD_AGGRESSIVENESS,
+                      frame_ms=VAD_FRAME_MS):
+    """
+    Run webrtcvad over a whole recording in one pass.
+
+    audio is a path (anything load_audio reads) or a mono int16 array at
+    sample_rate. Frames are zero-copy views of one PCM buffer, so an hour of
+    audio takes well under a second.
+    """
+    samples = load_audio(audio, sample_rate) if isinstance(audio, (str, os.PathLike)) else audio
+    window = sample_rate * frame_ms // 1000
+    n = len(samples) // window
+    buffer = memoryview(np.ascontiguousarray(samples[:n * window], dtype=np.int16).tobytes())
+    step = window * 2  # bytes per frame
+    vad = get_vad(aggressiveness)
+    speech = np.fromiter((vad.is_speech(buffer[i * step:(i + 1) * step], sample_rate) for i in range(n)),
+                         dtype=bool, count=n)
+    return VadTrack(speech, frame_ms / 1000)
+
+
+# Tracks kept in memory (a worker process sees a new audio file per job)
+VAD_TRACK_CACHE_SIZE = 8
+
+_tracks = {}
+_tracks_lock = threading.Lock()
+
+
+def get_vad_track(audio_path, aggressiveness=VAD_AGGRESSIVENESS):
+    """
+    VadTrack for an audio file, computed once per process and file version
+    (path, size, mtime), so crop tracking, silence trimming and highlight
+    scoring share one VAD pass.
+    """
+    stat = os.stat(audio_path)
+    key = (os.path.abspath(audio_path), stat.st_size, stat.st_mtime_ns, aggressiveness)
+    with _tracks_lock:
+        track = _tracks.get(key)
+    if track is None:
+        track = compute_vad_track(audio_path, aggressiveness=aggressiveness)
+        speech_seconds = float(track.speech.sum()) * track.frame_seconds
+        print(f"✓ Voice activity: {speech_seconds:.1f}s of speech in {track.duration:.1f}s")
+        with _tracks_lock:
+            _tracks[key] = track
+            while len(_tracks) > VAD_TRACK_CACHE_SIZE:
+                _tracks.pop(next(iter(_tracks)))
+    return track
+
+
+if __name__ == "__main__":
+    track = get_vad_track("audio.wav")
+    print(track.speech_ranges(min_silence=0.3)[:10])
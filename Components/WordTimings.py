@@ -0,0 +1,70 @@
+import numpy as np
+
+
+class WordTimings:
+    """
+    Word-level timestamps for a transcript in a few flat arrays instead of one
+    Python object per word:
+        text:    all words concatenated
+        offsets: int32, word i is text[offsets[i]:offsets[i + 1]]
+        starts, ends: float64 start/end time of each word (seconds)
+
+    Words are kept in time order, so time lookups are binary searches.
+    """
+
+    __slots__ = ('text', 'offsets', 'starts', 'ends')
+
+    def __init__(self, text="", offsets=None, starts=None, ends=None):
+        self.text = text
+        self.offsets = np.zeros(1, np.int32) if offsets is None else np.asarray(offsets, np.int32)
+        self.starts = np.zeros(0) if starts is None else np.asarray(starts, np.float64)
+        self.ends = np.zeros(0) if ends is None else np.asarray(ends, np.float64)
+
+    @classmethod
+    def from_words(cls, words):
+        """Build from an iterable of [word, start, end] (surrounding whitespace is stripped)"""
+        texts, starts, ends = [], [], []
+        for word, start, end in words:
+            word = word.strip()
+            if word:
+                texts.append(word)
+                starts.append(start)
+                ends.append(end)
+        offsets = np.zeros(len(texts) + 1, np.int32)
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+        return cls("".join(texts), offsets, starts, ends)
+
+    def __len__(self):
+        return len(self.starts)
+
+    def word(self, i):
+        return self.text[self.offsets[i]:self.offsets[i + 1]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.word(i), float(self.starts[i]), float(self.ends[i])
+
+    def index_range(self, start, end):
+        """(lo, hi) such that words lo..hi-1 start within [start, end)"""
+        lo = int(np.searchsorted(self.starts, start, side='left'))
+        hi = int(np.searchsorted(self.starts, end, side='left'))
+        return lo, hi
+
+    def words_between(self, start, end):
+        """[word, start, end] for the words that start within [start, end)"""
+        lo, hi = self.index_range(start, end)
+        return [[self.word(i), float(self.starts[i]), float(self.ends[i])] for i in range(lo, hi)]
+
+    def to_dict(self):
+        return {'text': self.text, 'offsets': self.offsets.tolist(),
+                'starts': self.starts.tolist(), 'ends': self.ends.tolist()}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['text'], data['offsets'], data['starts'], data['ends'])
+
+
+if __name__ == "__main__":
+    words = WordTimings.from_words([[" Hello", 0.0, 0.4], [" there,", 0.4, 0.9], [" world.", 1.1, 1.6]])
+    print(len(words), list(words))
+    print(words.words_between(0.3, 1.2))
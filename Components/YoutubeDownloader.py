@@ -1,98 +1,514 @@
 import os
+import json
+import uuid
+import contextlib
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from filelock import FileLock
 from pytubefix import YouTube
+from pytubefix.extract import video_id as extract_video_id
 import ffmpeg
+from Components.SegmentedDownload import download_file
+
+# Downloaded sources are kept here, one directory per video and format, and
+# reused by later runs; least recently used entries are deleted once the
+# total passes MEDIA_CACHE_MAX_BYTES
+MEDIA_CACHE_DIR = os.getenv("MEDIA_CACHE_DIR", "videos")
+MEDIA_CACHE_MAX_BYTES = int(float(os.getenv("MEDIA_CACHE_MAX_GB", "20")) * 1024 ** 3)
+
+# Format policy: the highest resolution up to DOWNLOAD_MAX_HEIGHT, preferring
+# DOWNLOAD_PREFER_CODEC (avc1 = H.264) at equal resolution. Shorts are cropped
+# to ~608 px wide, so anything above 1080p is wasted bandwidth.
+DOWNLOAD_MAX_HEIGHT = int(os.getenv("DOWNLOAD_MAX_HEIGHT", "1080"))
+DOWNLOAD_PREFER_CODEC = os.getenv("DOWNLOAD_PREFER_CODEC", "avc1")
+
+# A directory of fixture files to serve instead of YouTube (see LocalYouTube)
+YOUTUBE_FIXTURE_DIR = os.getenv("YOUTUBE_FIXTURE_DIR")
+
+
+class MediaCache:
+    """
+    Downloaded source videos on disk, keyed by video ID and format.
+
+    index.json in the cache directory records each entry's file, title, size
+    and last use. Files live in <video_id>/<format>/<title>.mp4, so the
+    pipeline still takes the video title from the file name. get() refreshes
+    an entry's last use and add() evicts the least recently used entries
+    until the total fits in max_bytes.
+
+    Several jobs (threads of a worker, or worker processes) can share the
+    cache: the index is only changed under a lock file, entry_lock()
+    serializes downloads of the same entry, and a pinned entry (pin=True on
+    get/add, until unpin) is never evicted. Pins are files named after the
+    process, so the pins of a process that died are ignored.
+    """
+
+    INDEX_NAME = "index.json"
+    PIN_PREFIX = ".pin-"
+
+    def __init__(self, directory=MEDIA_CACHE_DIR, max_bytes=MEDIA_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._thread_locks = {}
+        self._thread_locks_lock = threading.Lock()
+        self._pins = {}  # cached path -> pin files held by this process
+
+    @staticmethod
+    def key(video_id, format_id):
+        return f"{video_id}/{format_id}"
+
+    def entry_dir(self, video_id, format_id):
+        return os.path.join(self.directory, video_id, format_id)
+
+    @contextlib.contextmanager
+    def _locked(self, name):
+        """A lock shared by the threads of this process (threading) and other processes (lock file)"""
+        with self._thread_locks_lock:
+            thread_lock = self._thread_locks.setdefault(name, threading.Lock())
+        lock_dir = os.path.join(self.directory, ".locks")
+        os.makedirs(lock_dir, exist_ok=True)
+        with thread_lock, FileLock(os.path.join(lock_dir, f"{name}.lock")):
+            yield
+
+    def entry_lock(self, video_id, format_id):
+        """Held while an entry is downloaded, so the same video and format are fetched once"""
+        return self._locked(f"{video_id}+{format_id}")
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, self.INDEX_NAME), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self, index):
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp_path, os.path.join(self.directory, self.INDEX_NAME))
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def entries(self):
+        """{key: entry} of everything in the index"""
+        with self._locked("index"):
+            return self._load()
+
+    def total_bytes(self):
+        return sum(entry.get("size", 0) for entry in self.entries().values())
+
+    def _pin(self, path):
+        pin_path = os.path.join(os.path.dirname(path), f"{self.PIN_PREFIX}{os.getpid()}-{uuid.uuid4().hex[:8]}")
+        open(pin_path, 'w').close()
+        self._pins.setdefault(path, []).append(pin_path)
+
+    def unpin(self, path):
+        """Release one pin this process holds on a cached path (no-op for other paths)"""
+        pins = self._pins.get(path)
+        if not pins:
+            return
+        pin_path = pins.pop()
+        if not pins:
+            del self._pins[path]
+        try:
+            os.remove(pin_path)
+        except OSError:
+            pass
+
+    def _pinned(self, directory):
+        """True if a live process holds a pin on the entry in directory; stale pins are removed"""
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return False
+        pinned = False
+        for name in names:
+            if not name.startswith(self.PIN_PREFIX):
+                continue
+            try:
+                pid = int(name[len(self.PIN_PREFIX):].split("-")[0])
+            except ValueError:
+                continue
+            if _process_alive(pid):
+                pinned = True
+            else:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except OSError:
+                    pass
+        return pinned
+
+    def get(self, video_id, format_id, pin=False):
+        """Path of the cached file for a video and format, or None; pin=True keeps it from eviction"""
+        key = self.key(video_id, format_id)
+        with self._locked("index"):
+            index = self._load()
+            entry = index.get(key)
+            if entry is None:
+                return None
+            path = os.path.join(self.directory, entry["path"])
+            if not os.path.isfile(path):
+                # Deleted by hand: forget it
+                del index[key]
+                self._save(index)
+                return None
+            entry["last_used"] = time.time()
+            self._save(index)
+            if pin:
+                self._pin(path)
+        return path
+
+    def add(self, video_id, format_id, path, title=None, pin=False):
+        """Move a finished download into the cache and return its new path"""
+        key = self.key(video_id, format_id)
+        target_dir = self.entry_dir(video_id, format_id)
+        os.makedirs(target_dir, exist_ok=True)
+        cached_path = os.path.join(target_dir, os.path.basename(path))
+        if os.path.abspath(path) != os.path.abspath(cached_path):
+            shutil.move(path, cached_path)
+        with self._locked("index"):
+            index = self._load()
+            index[key] = {
+                "path": os.path.relpath(cached_path, self.directory),
+                "title": title,
+                "size": os.path.getsize(cached_path),
+                "last_used": time.time(),
+            }
+            if pin:
+                self._pin(cached_path)
+            self._evict(index, keep=key)
+            self._save(index)
+        return cached_path
+
+    def _evict(self, index, keep=None):
+        total = sum(entry.get("size", 0) for entry in index.values())
+        for key, entry in sorted(index.items(), key=lambda item: item[1].get("last_used", 0)):
+            if total <= self.max_bytes:
+                break
+            path = os.path.join(self.directory, entry["path"])
+            if key == keep or self._pinned(os.path.dirname(path)):
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            # Drop the now empty <format> and <video_id> directories
+            for directory in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+            total -= entry.get("size", 0)
+            del index[key]
+            print(f"Media cache: evicted {key} ({entry.get('size', 0) / (1024 * 1024):.1f} MB)")
+
+
+def _process_alive(pid):
+    if pid == os.getpid():
+        return True
+    if os.name == 'nt':
+        # os.kill(pid, 0) would terminate the process on Windows; keep the pin
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass
+    return True
+
+
+media_cache = MediaCache()
+
+
+class LocalStream:
+    """Stand-in for a pytubefix Stream that serves a local file"""
+
+    __slots__ = ('itag', 'type', 'subtype', 'resolution', 'abr', 'video_codec', 'is_progressive', 'path', 'url')
+
+    def __init__(self, itag, type, path=None, resolution=None, abr=None, subtype="mp4", video_codec=None,
+                 progressive=False, url=None):
+        self.itag = int(itag)
+        self.type = type
+        self.subtype = subtype
+        self.resolution = resolution
+        self.abr = abr
+        self.video_codec = video_codec
+        self.is_progressive = progressive
+        self.path = path
+        self.url = url
+
+    @property
+    def filesize(self):
+        return os.path.getsize(self.path) if self.path else 0
+
+    def download(self, output_path=None, filename=None, filename_prefix=None):
+        filename = (filename_prefix or "") + (filename or os.path.basename(self.path))
+        target = os.path.join(output_path or ".", filename)
+        shutil.copyfile(self.path, target)
+        return target
+
+
+class LocalYouTube:
+    """
+    Stand-in for pytubefix.YouTube that serves fixture files, for running the
+    downloader (and the whole pipeline) without network access. fixture_dir
+    holds one <video_id>.json per video, with files relative to fixture_dir;
+    a stream with a "url" instead is fetched over HTTP like a real one (e.g.
+    from a local test server):
+
+        {"title": "Some talk",
+         "streams": [{"itag": 137, "type": "video", "resolution": "1080p", "codec": "avc1.640028",
+                      "file": "v1080.mp4"},
+                     {"itag": 248, "type": "video", "resolution": "1080p", "subtype": "webm", "codec": "vp9",
+                      "url": "http://127.0.0.1:8000/v1080.webm"},
+                     {"itag": 140, "type": "audio", "abr": "128kbps", "file": "a128.m4a"},
+                     {"itag": 18, "type": "video", "resolution": "360p", "file": "p360.mp4",
+                      "progressive": true}]}
+    """
+
+    def __init__(self, url, fixture_dir=YOUTUBE_FIXTURE_DIR):
+        self.video_id = extract_video_id(url)
+        with open(os.path.join(fixture_dir, f"{self.video_id}.json"), 'r', encoding='utf-8') as f:
+            fixture = json.load(f)
+        self.title = fixture["title"]
+        self.streams = [
+            LocalStream(s["itag"], s["type"], os.path.join(fixture_dir, s["file"]) if "file" in s else None,
+                        s.get("resolution"), s.get("abr"), s.get("subtype", "mp4"), s.get("codec"),
+                        s.get("progressive", False), s.get("url"))
+            for s in fixture["streams"]
+        ]
+
+
+def default_client(url):
+    """YouTube, or LocalYouTube when YOUTUBE_FIXTURE_DIR is set"""
+    if YOUTUBE_FIXTURE_DIR:
+        return LocalYouTube(url)
+    return YouTube(url)
+
 
 def get_video_size(stream):
 
     return stream.filesize / (1024 * 1024)
 
-def download_youtube_video(url):
+
+def _height(stream):
     try:
-        yt = YouTube(url)
-
-        video_streams = yt.streams.filter(type="video").order_by('resolution').desc()
-        audio_stream = yt.streams.filter(only_audio=True).first()
-
-        # Show available streams
-        print("\nAvailable video streams:")
-        for i, stream in enumerate(video_streams[:5]):  # Show top 5 options
-            size = get_video_size(stream)
-            stream_type = "Progressive" if stream.is_progressive else "Adaptive"
-            print(f"  {i}. Resolution: {stream.resolution}, Size: {size:.2f} MB, Type: {stream_type}")
-        
-        # Interactive selection with timeout
-        import select
-        import sys
-        
-        print("\nSelect resolution number (0-4) or wait 5s for auto-select...")
-        print("Auto-selecting highest quality in 5 seconds...")
-        
-        selected_stream = None
+        return int((stream.resolution or "0p").rstrip("p"))
+    except ValueError:
+        return 0
+
+
+def _kbps(stream):
+    try:
+        return int((stream.abr or "0kbps").rstrip("kbps"))
+    except ValueError:
+        return 0
+
+
+def list_streams(yt):
+    """
+    (video streams, highest resolution first; best audio stream or None).
+    AAC audio (mp4) is preferred so the merge can copy it into the mp4.
+    """
+    streams = list(yt.streams)
+    video_streams = sorted((s for s in streams if s.type == "video"), key=_height, reverse=True)
+    audio_streams = [s for s in streams if s.type == "audio"]
+    audio_stream = max(audio_streams, key=lambda s: (s.subtype == "mp4", _kbps(s)), default=None)
+    return video_streams, audio_stream
+
+
+def pick_video_stream(video_streams, max_height=DOWNLOAD_MAX_HEIGHT, prefer_codec=DOWNLOAD_PREFER_CODEC):
+    """
+    The format policy: the highest resolution up to max_height (the lowest
+    available if all are taller), preferring prefer_codec and then adaptive
+    streams at equal resolution.
+    """
+    fitting = [s for s in video_streams if _height(s) <= max_height]
+    if not fitting:
+        lowest = min(_height(s) for s in video_streams)
+        fitting = [s for s in video_streams if _height(s) == lowest]
+    return max(fitting, key=lambda s: (_height(s), (getattr(s, 'video_codec', None) or "").startswith(prefer_codec),
+                                       not s.is_progressive))
+
+
+def format_id(video_stream, audio_stream=None):
+    """Cache key part for the chosen streams: itag, or video+audio itags for adaptive streams"""
+    if video_stream.is_progressive or audio_stream is None:
+        return str(video_stream.itag)
+    return f"{video_stream.itag}+{audio_stream.itag}"
+
+
+def safe_filename(title):
+    # Sanitize title for use in filename (remove invalid characters)
+    return title.replace("|", "-").replace(":", "-").replace("?", "").replace("*", "").replace("<", "").replace(">", "").replace('"', "").replace("/", "-").replace("\\", "-")
+
+
+def merge_streams(video_file, audio_file, output_file):
+    """
+    Mux adaptive video and audio into one mp4 without re-encoding. Audio the
+    mp4 container can't take as is gets converted to AAC; only if the video
+    can't be copied either is it re-encoded with libx264.
+    """
+    video = ffmpeg.input(video_file).video
+    audio = ffmpeg.input(audio_file).audio
+    attempts = [
+        ("stream copy", dict(c='copy')),
+        ("video copy, AAC audio", dict(vcodec='copy', acodec='aac')),
+        ("libx264 transcode", dict(vcodec='libx264', acodec='aac')),
+    ]
+    for i, (label, codecs) in enumerate(attempts):
         try:
-            ready, _, _ = select.select([sys.stdin], [], [], 5)
-            if ready:
-                user_input = sys.stdin.readline().strip()
-                if user_input.isdigit():
-                    choice = int(user_input)
-                    if 0 <= choice < len(video_streams):
-                        selected_stream = video_streams[choice]
-                        print(f"✓ User selected: {selected_stream.resolution}")
-                    else:
-                        print("Invalid choice, using highest quality")
-                        selected_stream = video_streams[0]
+            ffmpeg.output(video, audio, output_file, movflags='+faststart', **codecs).run(
+                overwrite_output=True, quiet=True)
+            print(f"✓ Merged video and audio ({label})")
+            return output_file
+        except ffmpeg.Error as e:
+            if i == len(attempts) - 1:
+                raise
+            print(f"Merge with {label} failed, retrying: {e.stderr.decode(errors='ignore').strip().splitlines()[-1:]}")
+
+
+def choose_stream(video_streams, default):
+    """Interactive resolution choice with a 5 s timeout (default if nothing is entered)"""
+    # Show available streams
+    print("\nAvailable video streams:")
+    for i, stream in enumerate(video_streams[:5]):  # Show top 5 options
+        size = get_video_size(stream)
+        stream_type = "Progressive" if stream.is_progressive else "Adaptive"
+        print(f"  {i}. Resolution: {stream.resolution}, Size: {size:.2f} MB, Type: {stream_type}")
+
+    # Interactive selection with timeout
+    import select
+    import sys
+
+    print("\nSelect resolution number (0-4) or wait 5s for auto-select...")
+    print(f"Auto-selecting {default.resolution} in 5 seconds...")
+
+    selected_stream = None
+    try:
+        ready, _, _ = select.select([sys.stdin], [], [], 5)
+        if ready:
+            user_input = sys.stdin.readline().strip()
+            if user_input.isdigit():
+                choice = int(user_input)
+                if 0 <= choice < len(video_streams):
+                    selected_stream = video_streams[choice]
+                    print(f"✓ User selected: {selected_stream.resolution}")
                 else:
-                    print("Invalid input, using highest quality")
-                    selected_stream = video_streams[0]
+                    print("Invalid choice, using default")
+                    selected_stream = default
             else:
-                print("\nTimeout - auto-selecting highest quality")
-                selected_stream = video_streams[0]
-        except:
-            print("\nAuto-selecting highest quality (timeout not available on this platform)")
-            selected_stream = video_streams[0]
-        
-        # Confirm selection
-        if selected_stream is None:
-            selected_stream = video_streams[0]
-        
-        size = get_video_size(selected_stream)
-        stream_type = "Progressive" if selected_stream.is_progressive else "Adaptive"
-        print(f"\nFinal selection: {selected_stream.resolution}, Size: {size:.2f} MB, Type: {stream_type}")
-
-        if not os.path.exists('videos'):
-            os.makedirs('videos')
-
-        # Sanitize title for use in filename (remove invalid characters)
-        safe_title = yt.title.replace("|", "-").replace(":", "-").replace("?", "").replace("*", "").replace("<", "").replace(">", "").replace('"', "").replace("/", "-").replace("\\", "-")
-
-        print(f"Downloading video: {yt.title}")
-        video_file = selected_stream.download(output_path='videos', filename_prefix="video_")
-
-        if not selected_stream.is_progressive:
-            print("Downloading audio...")
-            audio_file = audio_stream.download(output_path='videos', filename_prefix="audio_")
-
-            print("Merging video and audio...")
-            output_file = os.path.join('videos', f"{safe_title}.mp4")
-            stream = ffmpeg.input(video_file)
-            audio = ffmpeg.input(audio_file)
-            stream = ffmpeg.output(stream, audio, output_file, vcodec='libx264', acodec='aac', strict='experimental')
-            ffmpeg.run(stream, overwrite_output=True)
-
-            os.remove(video_file)
-            os.remove(audio_file)
+                print("Invalid input, using default")
+                selected_stream = default
         else:
-            output_file = video_file
+            print("\nTimeout - auto-selecting default")
+            selected_stream = default
+    except:
+        print("\nAuto-selecting default (timeout not available on this platform)")
+        selected_stream = default
+
+    # Confirm selection
+    if selected_stream is None:
+        selected_stream = default
+    return selected_stream
+
+
+def download_stream(stream, output_path, prefix):
+    """
+    Fetch one stream into output_path: with parallel, resumable range
+    requests (SegmentedDownload) when it has an HTTP URL, otherwise, or if
+    that fails, with the stream's own download().
+    """
+    url = getattr(stream, 'url', None)
+    if url and url.startswith(("http://", "https://")):
+        path = os.path.join(output_path, f"{prefix}{stream.itag}.{stream.subtype}")
+        try:
+            return download_file(url, path)
+        except Exception as e:
+            print(f"Segmented download of itag {stream.itag} failed ({e}), falling back to a single request")
+    return stream.download(output_path=output_path, filename_prefix=prefix)
+
+
+def download_youtube_video(url, client=None, cache=None, interactive=False, pin=False):
+    """
+    Download a YouTube video (video and audio merged into one mp4) and return
+    its path, or None on failure.
+
+    The video stream is picked by the format policy (pick_video_stream);
+    with interactive=True the streams are listed and another one can be
+    chosen within 5 seconds. Video and audio are fetched at the same time,
+    each in parallel segments whose partial files are kept if the download
+    fails, so the next attempt resumes them. Downloads are kept in the media
+    cache (MediaCache, keyed by video ID and the chosen streams), so a video
+    fetched before is reused without downloading again; concurrent calls for
+    the same video and format wait for one download. With pin=True the file
+    is kept from eviction until cache.unpin(path). client(url) returns the
+    YouTube object (pytubefix YouTube by default, LocalYouTube to serve
+    fixture files).
+    """
+    client = client or default_client
+    cache = cache or media_cache
+    try:
+        yt = client(url)
+
+        video_streams, audio_stream = list_streams(yt)
+        selected_stream = pick_video_stream(video_streams)
+        if interactive:
+            selected_stream = choose_stream(video_streams, selected_stream)
+        if not selected_stream.is_progressive and audio_stream is None:
+            print("No separate audio stream available, downloading without audio")
+        fmt = format_id(selected_stream, audio_stream)
+
+        with cache.entry_lock(yt.video_id, fmt):
+            cached = cache.get(yt.video_id, fmt, pin=pin)
+            if cached:
+                print(f"✓ Using cached download: {cached}")
+                return cached
+
+            size = get_video_size(selected_stream)
+            stream_type = "Progressive" if selected_stream.is_progressive else "Adaptive"
+            print(f"\nFinal selection: {selected_stream.resolution}, Size: {size:.2f} MB, Type: {stream_type}")
+
+            # Partial files stay in the entry's directory until the merge succeeds
+            work_dir = cache.entry_dir(yt.video_id, fmt)
+            os.makedirs(work_dir, exist_ok=True)
+            output_file = os.path.join(work_dir, f"{safe_filename(yt.title)}.mp4")
+            adaptive = not selected_stream.is_progressive and audio_stream is not None
+
+            print(f"Downloading video{' and audio' if adaptive else ''}: {yt.title}")
+            with ThreadPoolExecutor(max_workers=2) as pool:
+                video_future = pool.submit(download_stream, selected_stream, work_dir, "video_")
+                audio_future = pool.submit(download_stream, audio_stream, work_dir, "audio_") if adaptive else None
+                video_file = video_future.result()
+                audio_file = audio_future.result() if audio_future else None
+
+            if adaptive:
+                print("Merging video and audio...")
+                merge_streams(video_file, audio_file, output_file)
+                os.remove(video_file)
+                os.remove(audio_file)
+            else:
+                os.replace(video_file, output_file)
+
+            output_file = cache.add(yt.video_id, fmt, output_file, yt.title, pin=pin)
 
-        
-        print(f"Downloaded: {yt.title} to 'videos' folder")
+        print(f"Downloaded: {yt.title} to '{cache.directory}' folder")
         print(f"File path: {output_file}")
         return output_file
 
     except Exception as e:
         print(f"An error occurred: {str(e)}")
-        print("Please make sure you have the latest version of pytube and ffmpeg-python installed.")
+        print("Please make sure you have the latest version of pytubefix and ffmpeg-python installed.")
         print("You can update them by running:")
-        print("pip install --upgrade pytube ffmpeg-python")
+        print("pip install --upgrade pytubefix ffmpeg-python")
         print("Also, ensure that ffmpeg is installed on your system and available in your PATH.")
 
 if __name__ == "__main__":
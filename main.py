@@ -1,46 +1,27 @@
-from Components.YoutubeDownloader import download_youtube_video
+from Components.YoutubeDownloader import download_youtube_video, media_cache
 from Components.Edit import extractAudio, crop_video
-from Components.Transcription import transcribeAudio
-from Components.LanguageTasks import GetHighlight
-from Components.FaceCrop import crop_to_vertical, combine_videos
+from Components.Transcription import stream_transcription, get_cached_transcription, get_cached_words
+from Components.WordTimings import WordTimings
+from Components.LanguageTasks import GetHighlightsWindowed, HighlightStream
+from Components.FaceCrop import crop_to_vertical, combine_videos, detect_face_positions, plan_vertical_crop
 from Components.Subtitles import add_subtitles_to_video
+from Components.Render import render_short, get_video_info
+from Components.ShotDetection import get_shot_index
+from Components.Models import preload_whisper_model, print_model_load_times
+from Components.JobQueue import JobQueue
+from Components.HighlightScorer import top_highlights, prefilter_segments
+from Components.VoiceActivity import get_vad_track
+from Components.JumpCut import compute_keep_intervals
 import sys
 import os
 import uuid
 import re
-
-# Generate unique session ID for this run (for concurrent execution support)
-session_id = str(uuid.uuid4())[:8]
-print(f"Session ID: {session_id}")
-
-# Check for auto-approve flag (for batch processing)
-auto_approve = "--auto-approve" in sys.argv
-if auto_approve:
-    sys.argv.remove("--auto-approve")
-
-# Check if URL/file was provided as command-line argument
-if len(sys.argv) > 1:
-    url_or_file = sys.argv[1]
-    print(f"Using input from command line: {url_or_file}")
-else:
-    url_or_file = input("Enter YouTube video URL or local video file path: ")
-
-# Check if input is a local file
-video_title = None
-if os.path.isfile(url_or_file):
-    print(f"Using local video file: {url_or_file}")
-    Vid = url_or_file
-    # Extract title from filename
-    video_title = os.path.splitext(os.path.basename(url_or_file))[0]
-else:
-    # Assume it's a YouTube URL
-    print(f"Downloading from YouTube: {url_or_file}")
-    Vid = download_youtube_video(url_or_file)
-    if Vid:
-        Vid = Vid.replace(".webm", ".mp4")
-        print(f"Downloaded video and audio files successfully! at {Vid}")
-        # Extract title from downloaded file path
-        video_title = os.path.splitext(os.path.basename(Vid))[0]
+import select
+import time
+import threading
+import contextlib
+from queue import Queue
+from concurrent.futures import Future, ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 # Clean and slugify title for filename
 def clean_filename(title):
@@ -57,132 +38,830 @@ def clean_filename(title):
     # Limit length
     return cleaned[:80]
 
-# Process video (works for both local files and downloaded videos)
-if Vid:
-    # Create unique temporary filenames
-    audio_file = f"audio_{session_id}.wav"
-    temp_clip = f"temp_clip_{session_id}.mp4"
-    temp_cropped = f"temp_cropped_{session_id}.mp4"
-    temp_subtitled = f"temp_subtitled_{session_id}.mp4"
-    
-    Audio = extractAudio(Vid, audio_file)
-    if Audio:
 
-        transcriptions = transcribeAudio(Audio)
-        if len(transcriptions) > 0:
+def load_source(url_or_file, interactive=False):
+    """
+    Return (video path, title) for a local file or a downloaded YouTube URL.
+    interactive offers the resolution choice before downloading. A download
+    is pinned in the media cache so other jobs can't evict it while it is in
+    use; release it with media_cache.unpin(path) (or by exiting).
+    """
+    # Check if input is a local file
+    video_title = None
+    if os.path.isfile(url_or_file):
+        print(f"Using local video file: {url_or_file}")
+        Vid = url_or_file
+        # Extract title from filename
+        video_title = os.path.splitext(os.path.basename(url_or_file))[0]
+    else:
+        # Assume it's a YouTube URL
+        print(f"Downloading from YouTube: {url_or_file}")
+        Vid = download_youtube_video(url_or_file, interactive=interactive, pin=True)
+        if Vid:
+            Vid = Vid.replace(".webm", ".mp4")
+            print(f"Downloaded video and audio files successfully! at {Vid}")
+            # Extract title from downloaded file path
+            video_title = os.path.splitext(os.path.basename(Vid))[0]
+    return Vid, video_title
+
+
+def transcribe_source(Vid, audio_file, workers=1, word_timestamps=False, on_segment=None):
+    """
+    Return (audio path or None, [text, start, end] segments, transcript text,
+    WordTimings or None); words are only collected with word_timestamps.
+    on_segment, if given, is called with each segment as soon as Whisper
+    produces it (e.g. HighlightStream.feed).
+    """
+    # A repeat run on the same source reuses its transcript without extracting audio
+    transcriptions = get_cached_transcription(source_path=Vid, word_timestamps=word_timestamps, workers=workers)
+    words = get_cached_words(source_path=Vid, workers=workers) if word_timestamps and transcriptions is not None else None
+    if word_timestamps and words is None:
+        transcriptions = None
+    TransText = ""
+    if transcriptions is not None:
+        print(f"✓ Using cached transcription: {len(transcriptions)} segments")
+        Audio = audio_file
+        for text, start, end in transcriptions:
+            TransText += (f"{start} - {end}: {text}\n")
+            if on_segment:
+                on_segment([text, start, end])
+    else:
+        Audio = extractAudio(Vid, audio_file)
+        transcriptions = []
+        word_list = [] if word_timestamps else None
+        if Audio:
+            # Consume segments as Whisper produces them
+            try:
+                for text, start, end in stream_transcription(Audio, source_path=Vid, workers=workers, words=word_list):
+                    transcriptions.append([text, start, end])
+                    TransText += (f"{start} - {end}: {text}\n")
+                    if on_segment:
+                        on_segment([text, start, end])
+                    if len(transcriptions) % 50 == 0:
+                        print(f"  ...{len(transcriptions)} segments transcribed (up to {end:.0f}s)")
+            except Exception as e:
+                print("Transcription Error:", e)
+        if word_timestamps:
+            words = WordTimings.from_words(word_list)
+    return Audio, transcriptions, TransText, words
+
+
+def select_highlights(segments, clips, local=False, audio_path=None, exclude=None):
+    """
+    List of (start, stop) highlights in seconds, best first. The LLM sees
+    the segments as compact sentences, split into token-budgeted windows for
+    long videos (GetHighlightsWindowed). With local=True they come from the
+    offline scorer instead (no network). Ranges in exclude are skipped either
+    way. If the LLM gives nothing back the offline scorer is used.
+    """
+    if local:
+        if audio_path and not os.path.isfile(audio_path):
+            audio_path = None
+        windows = top_highlights(segments, clips, audio_path,
+                                 exclude=[(start * 1000, stop * 1000) for start, stop in exclude or []])
+        for start, stop in windows:
+            print(f"Local highlight: {start / 1000}s - {stop / 1000}s")
+        return [(start / 1000, stop / 1000) for start, stop in windows]
+    highlights = GetHighlightsWindowed(segments, clips, exclude=exclude)
+    if not highlights:
+        print("LLM highlight selection failed, falling back to the offline scorer")
+        return select_highlights(segments, clips, True, audio_path, exclude)
+    return highlights
+
+
+def finish_highlights(stream, segments, clips, audio_path=None):
+    """
+    Highlights from a HighlightStream fed during transcription, falling back
+    to the offline scorer like select_highlights if the LLM gives nothing back.
+    """
+    highlights = stream.finish()
+    if not highlights:
+        print("LLM highlight selection failed, falling back to the offline scorer")
+        return select_highlights(segments, clips, True, audio_path)
+    return highlights
+
+
+def highlight_segments(transcriptions, clips, prefilter, audio_path=None):
+    """The segments sent to the LLM: all of them, or only the regions the local scorer rates highest"""
+    if not prefilter:
+        return transcriptions
+    if audio_path and not os.path.isfile(audio_path):
+        audio_path = None
+    kept = prefilter_segments(transcriptions, keep=max(5, 2 * clips), audio_path=audio_path)
+    print(f"Pre-filtered transcript: {len(kept)}/{len(transcriptions)} segments sent to the LLM")
+    return kept
+
+
+def load_vad_track(Vid, audio_file):
+    """
+    VadTrack of the source's audio for jump cuts and active-speaker tracking
+    (extracting the audio if the transcript came from the cache), or None to
+    cut on transcript times and follow the largest face
+    """
+    try:
+        if not os.path.isfile(audio_file):
+            extractAudio(Vid, audio_file)
+        return get_vad_track(audio_file)
+    except Exception as e:
+        print(f"Warning: Voice activity detection failed, continuing without it: {e}")
+        return None
+
+
+def start_shot_detection(Vid):
+    """Detect shot boundaries in a background thread; returns a future for the ShotIndex"""
+    print("Detecting shot boundaries in the background...")
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="shot-detect")
+    future = executor.submit(get_shot_index, Vid)
+    executor.shutdown(wait=False)
+    return future
+
+
+def wait_for_shots(future):
+    """ShotIndex from start_shot_detection, or None if there is none / detection failed"""
+    if future is None:
+        return None
+    try:
+        return future.result()
+    except Exception as e:
+        print(f"Warning: Shot detection failed, continuing without it: {e}")
+        return None
+
+
+def snap_highlights(highlights, shot_index, max_shift=1.5):
+    """Move highlight boundaries onto nearby cuts so clips don't start or end mid-shot"""
+    snapped = []
+    for start, stop in highlights:
+        new_start, new_stop = shot_index.snap(start, max_shift), shot_index.snap(stop, max_shift)
+        if new_stop <= new_start:
+            new_start, new_stop = start, stop
+        if (new_start, new_stop) != (start, stop):
+            print(f"Snapped highlight {start}s - {stop}s to shot boundaries: {new_start:.2f}s - {new_stop:.2f}s")
+        snapped.append((new_start, new_stop))
+    return snapped
+
+
+# Alternative selections computed ahead while one is waiting for approval
+SPECULATIVE_ALTERNATIVES = 2
+
+
+def run_in_thread(fn, *args, name=None):
+    """Run fn(*args) in a daemon thread (never holds up exit); returns a Future for its result"""
+    future = Future()
+
+    def run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=run, name=name, daemon=True).start()
+    return future
+
+
+class AlternativeHighlights:
+    """
+    Computes the next `depth` alternative selections in the background, so
+    pressing "r" shows one without waiting for the LLM. Each alternative
+    excludes every selection before it, and taking one queues another.
+    """
+
+    def __init__(self, regenerate, shown, depth=SPECULATIVE_ALTERNATIVES):
+        self.regenerate = regenerate
+        self.rejected = list(shown)  # only touched by the background thread
+        self.ready = Queue()
+        self.wanted = threading.Semaphore(depth)
+        self.closed = False
+        threading.Thread(target=self._run, name="alt-highlights", daemon=True).start()
+
+    def _run(self):
+        while True:
+            self.wanted.acquire()
+            if self.closed:
+                return
+            try:
+                alternative = self.regenerate(list(self.rejected))
+            except Exception as e:
+                print(f"Warning: Could not precompute an alternative highlight: {e}")
+                alternative = []
+            self.rejected.extend(alternative or [])
+            self.ready.put(alternative or [])
+
+    def next(self):
+        """The next alternative selection (waits only if it isn't ready yet)"""
+        alternative = self.ready.get()
+        self.wanted.release()
+        return alternative
+
+    def close(self):
+        self.closed = True
+        self.wanted.release()
+
+
+def _remove_outputs(outputs):
+    for output in outputs or []:
+        if output and os.path.exists(output):
+            os.remove(output)
+
+
+class SpeculativeRender:
+    """
+    Renders the selection being shown while the user decides. A rejected
+    selection's render is cancelled and its files removed before the next
+    one starts; an approved one is reused as it is.
+
+    render(highlights, cancel) returns the list of output paths.
+    """
+
+    def __init__(self, render):
+        self.render = render
+        self.highlights = None
+        self.future = None
+        self._cancel = None
+        self._finished = []
+        self._lock = threading.Lock()
+
+    def start(self, highlights):
+        if self.future is not None and self.highlights == list(highlights):
+            return
+        previous = self.discard()
+        cancel = threading.Event()
+        finished = []
+
+        def run():
+            if previous is not None:
+                wait([previous])
+            outputs = self.render(highlights, cancel)
+            with self._lock:
+                if cancel.is_set():
+                    _remove_outputs(outputs)
+                    return None
+                finished.append(outputs)
+                return outputs
+
+        self.highlights = list(highlights)
+        self._cancel = cancel
+        self._finished = finished
+        self.future = run_in_thread(run, name="speculative-render")
+
+    def discard(self):
+        """Cancel the current render; returns its future (done once its files are gone)"""
+        future = self.future
+        if future is None:
+            return None
+        with self._lock:
+            self._cancel.set()
+            for outputs in self._finished:
+                _remove_outputs(outputs)
+        self.future = None
+        self.highlights = None
+        return future
+
+    def stop(self):
+        """Cancel the current render and wait until it has stopped and removed its files"""
+        previous = self.discard()
+        if previous is not None:
+            print("Stopping the render started during approval...")
+            wait([previous])
+
+    def result(self, highlights):
+        """Output paths for highlights, reusing the speculative render when it matches"""
+        if self.future is not None and self.highlights == list(highlights):
+            print("Using the render started during approval...")
+            outputs = self.future.result()
+            if outputs is not None:
+                return outputs
+        previous = self.discard()
+        if previous is not None:
+            wait([previous])
+        return self.render(highlights, None)
+
+
+def approve_highlights(highlights, regenerate, auto_approve, speculative=None, prefetch=SPECULATIVE_ALTERNATIVES):
+    """
+    Interactive approval loop with timeout (skip if auto-approve).
+    regenerate(rejected) returns a new list of highlights, given every
+    highlight shown so far. Up to `prefetch` alternatives are computed in
+    the background while a selection is shown, and the optional
+    SpeculativeRender starts rendering the shown selection right away.
+    """
+    if auto_approve:
+        print(f"\n{'='*60}")
+        for start, stop in highlights:
+            print(f"SELECTED SEGMENT: {start}s - {stop}s ({stop-start}s duration)")
+        print(f"{'='*60}")
+        print("Auto-approved (batch mode)\n")
+        return highlights
+
+    alternatives = AlternativeHighlights(regenerate, highlights, prefetch) if prefetch else None
+    rejected = []
+    approved = False
+    try:
+        while not approved:
             print(f"\n{'='*60}")
-            print(f"TRANSCRIPTION SUMMARY: {len(transcriptions)} segments")
+            print(f"SELECTED SEGMENT DETAILS:")
+            for start, stop in highlights:
+                print(f"Time: {start}s - {stop}s ({stop-start}s duration)")
             print(f"{'='*60}\n")
-            TransText = ""
-
-            for text, start, end in transcriptions:
-                TransText += (f"{start} - {end}: {text}\n")
-
-            print("Analyzing transcription to find best highlight...")
-            start , stop = GetHighlight(TransText)
-            
-            # Check if GetHighlight failed
-            if start is None or stop is None:
-                print(f"\n{'='*60}")
-                print("ERROR: Failed to get highlight from LLM")
-                print(f"{'='*60}")
-                print("This could be due to:")
-                print("  - OpenAI API issues or rate limiting")
-                print("  - Invalid API key")
-                print("  - Network connectivity problems")
-                print("  - Malformed transcription data")
-                print(f"\nTranscription summary:")
-                print(f"  Total segments: {len(transcriptions)}")
-                print(f"  Total length: {len(TransText)} characters")
-                print(f"{'='*60}\n")
-                sys.exit(1) # Exit gracefully
-            
-            # Interactive approval loop with timeout (skip if auto-approve)
-            import select
-            
-            approved = auto_approve  # Auto-approve if flag is set
-            
-            if not auto_approve:
-                while not approved:
-                    print(f"\n{'='*60}")
-                    print(f"SELECTED SEGMENT DETAILS:")
-                    print(f"Time: {start}s - {stop}s ({stop-start}s duration)")
-                    print(f"{'='*60}\n")
-                    
-                    print("Options:")
-                    print("  [Enter/y] Approve and continue")
-                    print("  [r] Regenerate selection")
-                    print("  [n] Cancel")
-                    print("\nAuto-approving in 15 seconds if no input...")
-                    
-                    regenerate = False
-                    
-                    try:
-                        # Check if stdin is ready within 15 seconds
-                        ready, _, _ = select.select([sys.stdin], [], [], 15)
-                        if ready:
-                            user_input = sys.stdin.readline().strip().lower()
-                            if user_input == 'r':
-                                print("\nRegenerating selection...")
-                                start, stop = GetHighlight(TransText)
-                                regenerate = True
-                            elif user_input == 'n':
-                                print("Cancelled by user")
-                                sys.exit(0)
-                            else:
-                                print("Approved by user")
-                                approved = True
+            if speculative is not None:
+                speculative.start(highlights)
+
+            print("Options:")
+            print("  [Enter/y] Approve and continue")
+            print("  [r] Regenerate selection")
+            print("  [n] Cancel")
+            print("\nAuto-approving in 15 seconds if no input...")
+
+            try:
+                # Check if stdin is ready within 15 seconds
+                ready, _, _ = select.select([sys.stdin], [], [], 15)
+                if ready:
+                    user_input = sys.stdin.readline().strip().lower()
+                    if user_input == 'r':
+                        print("\nRegenerating selection...")
+                        rejected.extend(highlights)
+                        regenerated = alternatives.next() if alternatives else regenerate(rejected)
+                        if regenerated:
+                            highlights = regenerated
                         else:
-                            print("\nTimeout - auto-approving selection")
-                            approved = True
-                    except:
-                        # Fallback if select doesn't work (e.g., Windows)
-                        print("\nAuto-approving (timeout not available on this platform)")
+                            print("No other highlights found, keeping the current selection")
+                    elif user_input == 'n':
+                        print("Cancelled by user")
+                        if speculative is not None:
+                            speculative.stop()
+                        sys.exit(0)
+                    else:
+                        print("Approved by user")
                         approved = True
+                else:
+                    print("\nTimeout - auto-approving selection")
+                    approved = True
+            except SystemExit:
+                raise
+            except:
+                # Fallback if select doesn't work (e.g., Windows)
+                print("\nAuto-approving (timeout not available on this platform)")
+                approved = True
+    finally:
+        if alternatives is not None:
+            alternatives.close()
+    return highlights
+
+
+def render_clip(Vid, start, stop, transcriptions, final_output, temp_tag, single_pass, face_positions=None,
+                track_faces=False, shot_index=None, words=None, cancel=None, jump_cuts=False, vad=None):
+    """
+    Render one short; returns final_output, or None on failure. Setting the
+    optional cancel Event stops the render without leaving the output
+    behind: at the next frame while cropping, adding subtitles or rendering
+    in a single pass, else before the next step. jump_cuts cuts silences and
+    filler words (using the VadTrack vad if given, else the transcript
+    times) and always renders in a single pass. With track_faces, vad also
+    picks the active speaker to follow.
+    """
+    print(f"\nCreating short video: {start}s - {stop}s ({stop-start}s duration)")
+    print(f"Start: {start} , End: {stop}")
+
+    # Shot boundaries inside the clip, as frame indices from its start
+    cuts = None
+    info = get_video_info(Vid) if shot_index is not None or jump_cuts else None
+    if shot_index is not None:
+        cuts = shot_index.cut_frames(start, stop, info[2]) if info and info[2] else None
+
+    if single_pass or jump_cuts:
+        print("Rendering clip, vertical crop, subtitles and audio in a single pass...")
+        crop_plan = None
+        if face_positions is not None or track_faces or cuts:
+            crop_plan = plan_vertical_crop(Vid, start, stop, face_positions=face_positions, track_faces=track_faces,
+                                           cuts=cuts, vad=vad)
+        if cancel is not None and cancel.is_set():
+            return None
+        keep_intervals = None
+        if jump_cuts:
+            keep_intervals = compute_keep_intervals(start, stop, vad=vad, segments=transcriptions, words=words,
+                                                    fps=info[2] if info else None)
+        return render_short(Vid, final_output, start, stop, transcriptions, crop_plan=crop_plan, words=words,
+                            cancel=cancel, keep_intervals=keep_intervals)
+
+    # Create unique temporary filenames; the clip is MPEG-TS so crop_video
+    # can join a re-encoded head to the stream-copied rest (see fast_trim)
+    temp_clip = f"temp_clip_{temp_tag}.ts"
+    temp_cropped = f"temp_cropped_{temp_tag}.mp4"
+    temp_subtitled = f"temp_subtitled_{temp_tag}.mp4"
+    def cancelled():
+        return cancel is not None and cancel.is_set()
+
+    try:
+        print("Step 1/4: Extracting clip from original video...")
+        crop_video(Vid, temp_clip, start, stop)
+        if cancelled():
+            return None
+
+        print("Step 2/4: Cropping to vertical format (9:16)...")
+        fps = crop_to_vertical(temp_clip, temp_cropped, face_positions=face_positions, track_faces=track_faces,
+                               cuts=cuts, cancel=cancel, vad=vad.section(start, stop) if vad is not None else None)
+        if cancelled():
+            return None
+    
+        print("Step 3/4: Adding subtitles to video...")
+        add_subtitles_to_video(temp_cropped, temp_subtitled, transcriptions, video_start_time=start, words=words,
+                               cancel=cancel)
+        if cancelled():
+            return None
+    
+        print("Step 4/4: Adding audio to final video...")
+        combine_videos(temp_clip, temp_subtitled, final_output, fps)
+    finally:
+        # Clean up temporary files
+        try:
+            for temp_file in [temp_clip, temp_cropped, temp_subtitled]:
+                if os.path.exists(temp_file):
+                    os.remove(temp_file)
+        except Exception as e:
+            print(f"Warning: Could not clean up some temporary files: {e}")
+    return final_output if os.path.exists(final_output) else None
+
+
+def render_highlights(Vid, highlights, transcriptions, video_title, session_id, single_pass, render_workers=1,
+                      track_faces=False, shot_index=None, words=None, cancel=None, jump_cuts=False, vad=None):
+    """Render every approved highlight; returns the output paths (None for failed or cancelled clips)"""
+    # Generate final output filename with random identifier
+    clean_title = clean_filename(video_title) if video_title else "output"
+
+    if len(highlights) == 1:
+        start, stop = highlights[0]
+        final_output = f"{clean_title}_{session_id}_short.mp4"
+        return [render_clip(Vid, start, stop, transcriptions, final_output, session_id, single_pass,
+                            track_faces=track_faces, shot_index=shot_index, words=words, cancel=cancel,
+                            jump_cuts=jump_cuts, vad=vad)]
+
+    # Face analysis for all clips in one pass over the source, then
+    # render the clips in a bounded pool (face tracking and per-shot crops
+    # analyse each clip themselves)
+    if track_faces or shot_index is not None:
+        face_positions = [None] * len(highlights)
+    else:
+        face_positions = detect_face_positions(Vid, highlights)
+    print(f"Rendering {len(highlights)} clips with {render_workers} workers...")
+    with ThreadPoolExecutor(max_workers=render_workers) as pool:
+        futures = [
+            pool.submit(render_clip, Vid, start, stop, transcriptions,
+                        f"{clean_title}_{session_id}_short_{i}.mp4", f"{session_id}_{i}",
+                        single_pass, face_positions[i - 1], track_faces, shot_index, words, cancel,
+                        jump_cuts, vad)
+            for i, (start, stop) in enumerate(highlights, 1)
+        ]
+        outputs = []
+        for future in futures:
+            try:
+                outputs.append(future.result())
+            except Exception as e:
+                print(f"Error rendering clip: {e}")
+                outputs.append(None)
+    return outputs
+
+
+# Default number of jobs allowed in each stage at once in worker mode
+DEFAULT_STAGE_CONCURRENCY = {"download": 2, "transcribe": 1, "highlight": 4, "render": 2}
+
+
+def parse_concurrency(spec):
+    """'download=4,render=2' -> stage limits (unspecified stages keep their defaults)"""
+    limits = dict(DEFAULT_STAGE_CONCURRENCY)
+    for item in filter(None, spec.split(",")):
+        name, _, value = item.partition("=")
+        if name.strip() not in limits:
+            raise ValueError(f"Unknown stage '{name}' (expected one of {', '.join(limits)})")
+        limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+@contextlib.contextmanager
+def job_stage(queue, job_id, name, semaphores):
+    """Record the job's stage and hold one of that stage's slots while it runs"""
+    queue.set_stage(job_id, f"waiting:{name}")
+    with semaphores[name]:
+        queue.set_stage(job_id, name)
+        yield
+
+
+def run_job(queue, job, semaphores):
+    """Run one queued job through download -> transcribe -> highlight -> render"""
+    job_id = job["id"]
+    options = job["options"]
+    clips = options.get("clips", 1)
+    session_id = f"job{job_id}_{str(uuid.uuid4())[:8]}"
+    print(f"[job {job_id}] Starting {job['url']} (session {session_id})")
+
+    with job_stage(queue, job_id, "download", semaphores):
+        Vid, video_title = load_source(job["url"])
+    if not Vid:
+        raise RuntimeError("Unable to process the video")
+
+    shots = start_shot_detection(Vid) if options.get("shots") else None
+    audio_file = f"audio_{session_id}.wav"
+    local = options.get("local_highlights", False)
+    prefilter = options.get("prefilter", False)
+    # The LLM sees windows of the transcript while it is still being produced
+    stream = HighlightStream(clips) if not local and not prefilter else None
+    try:
+        with job_stage(queue, job_id, "transcribe", semaphores):
+            Audio, transcriptions, TransText, words = transcribe_source(Vid, audio_file, options.get("workers", 1),
+                                                                        options.get("karaoke", False),
+                                                                        stream.feed if stream else None)
+        if not Audio:
+            raise RuntimeError("No audio file found")
+        if len(transcriptions) == 0:
+            raise RuntimeError("No transcriptions found")
+
+        with job_stage(queue, job_id, "highlight", semaphores):
+            if stream:
+                highlights = finish_highlights(stream, transcriptions, clips, Audio)
             else:
-                print(f"\n{'='*60}")
-                print(f"SELECTED SEGMENT: {start}s - {stop}s ({stop-start}s duration)")
-                print(f"{'='*60}")
-                print("Auto-approved (batch mode)\n")
-            
-            print(f"\n✓ Final highlight: {start}s - {stop}s")
-            #handle the case when the highlight starts from 0s
-            if start>0 and stop>0 and stop>start:
-                print(f"\nCreating short video: {start}s - {stop}s ({stop-start}s duration)")
-                print(f"Start: {start} , End: {stop}")
-
-                print("Step 1/4: Extracting clip from original video...")
-                crop_video(Vid, temp_clip, start, stop)
-
-                print("Step 2/4: Cropping to vertical format (9:16)...")
-                crop_to_vertical(temp_clip, temp_cropped)
-                
-                print("Step 3/4: Adding subtitles to video...")
-                add_subtitles_to_video(temp_cropped, temp_subtitled, transcriptions, video_start_time=start)
-                
-                # Generate final output filename with random identifier
-                clean_title = clean_filename(video_title) if video_title else "output"
-                final_output = f"{clean_title}_{session_id}_short.mp4"
-                
-                print("Step 4/4: Adding audio to final video...")
-                combine_videos(temp_clip, temp_subtitled, final_output)
-                print(f"\n{'='*60}")
-                print(f"✓ SUCCESS: {final_output} is ready!")
-                print(f"{'='*60}\n")
-                
-                # Clean up temporary files
-                try:
-                    for temp_file in [audio_file, temp_clip, temp_cropped, temp_subtitled]:
-                        if os.path.exists(temp_file):
-                            os.remove(temp_file)
-                    print(f"Cleaned up temporary files for session {session_id}")
-                except Exception as e:
-                    print(f"Warning: Could not clean up some temporary files: {e}")
-            else:
-                print("Error in getting highlight")
+                segments = transcriptions if local else highlight_segments(transcriptions, clips, prefilter, Audio)
+                highlights = select_highlights(segments, clips, local, Audio)
+        highlights = [(start, stop) for start, stop in highlights if start>=0 and stop>start]
+        if not highlights:
+            raise RuntimeError("Failed to get highlight from LLM")
+        shot_index = wait_for_shots(shots)
+        if shot_index is not None:
+            highlights = snap_highlights(highlights, shot_index)
+
+        with job_stage(queue, job_id, "render", semaphores):
+            jump_cuts = options.get("jump_cuts", False)
+            track_faces = options.get("track_faces", False)
+            vad = load_vad_track(Vid, Audio) if jump_cuts or track_faces else None
+            outputs = render_highlights(Vid, highlights, transcriptions, video_title, session_id,
+                                        options.get("single_pass", False),
+                                        track_faces=track_faces,
+                                        shot_index=shot_index, words=words, jump_cuts=jump_cuts, vad=vad)
+    finally:
+        if stream:
+            stream.close()
+        if os.path.exists(audio_file):
+            os.remove(audio_file)
+        # The source may be evicted from the media cache from here on
+        media_cache.unpin(Vid)
+
+    if not any(outputs):
+        raise RuntimeError("Rendering failed")
+    return [output for output in outputs if output]
+
+
+def run_worker(db_path, stage_limits, drain=False, poll_interval=2.0):
+    """
+    Long-running worker: takes jobs from the SQLite queue and runs them with
+    the models (Whisper, face detectors) loaded once and kept warm. Jobs are
+    pipelined, so one can be downloading while another transcribes and a
+    third renders, each stage limited to stage_limits[stage] jobs at once.
+    With drain=True the worker exits once the queue is empty.
+    """
+    queue = JobQueue(db_path)
+    semaphores = {name: threading.BoundedSemaphore(limit) for name, limit in stage_limits.items()}
+    max_in_flight = sum(stage_limits.values())
+    print(f"Worker started on {db_path} (stage limits: {stage_limits})")
+
+    preload_whisper_model(background=False)
+
+    def run(job):
+        try:
+            outputs = run_job(queue, job, semaphores)
+            queue.finish(job["id"], outputs)
+            print(f"[job {job['id']}] ✓ Done: {', '.join(outputs)}")
+        except Exception as e:
+            queue.fail(job["id"], e)
+            print(f"[job {job['id']}] ✗ Failed: {e}")
+
+    in_flight = set()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+        try:
+            while True:
+                while len(in_flight) < max_in_flight:
+                    job = queue.claim()
+                    if job is None:
+                        break
+                    in_flight.add(pool.submit(run, job))
+
+                if not in_flight:
+                    if drain:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+                _, in_flight = wait(in_flight, timeout=poll_interval, return_when=FIRST_COMPLETED)
+        except KeyboardInterrupt:
+            print(f"\nStopping: waiting for {len(in_flight)} running jobs to finish...")
+    print(f"Worker finished. Job counts: {queue.counts()}")
+
+
+def print_queue_status(db_path):
+    queue = JobQueue(db_path)
+    for job in queue.jobs():
+        if job["error"]:
+            detail = f"{job['stage']}: {job['error']}"
         else:
-            print("No transcriptions found")
+            detail = job["stage"] or job["outputs"] or ""
+        print(f"{job['id']:>5}  {job['status']:<8}  {job['url']}  {detail}")
+    print(f"\nCounts: {queue.counts()}")
+
+
+def pop_flag(name):
+    """Remove a boolean flag from sys.argv, returning whether it was present"""
+    if name in sys.argv:
+        sys.argv.remove(name)
+        return True
+    return False
+
+
+def pop_option(name, default=None):
+    """Remove '--name value' from sys.argv, returning value (or default)"""
+    if name in sys.argv:
+        idx = sys.argv.index(name)
+        value = sys.argv[idx + 1]
+        del sys.argv[idx:idx + 2]
+        return value
+    return default
+
+
+def main():
+    # Generate unique session ID for this run (for concurrent execution support)
+    session_id = str(uuid.uuid4())[:8]
+    print(f"Session ID: {session_id}")
+
+    # Check for auto-approve flag (for batch processing)
+    auto_approve = pop_flag("--auto-approve")
+
+    # Check for single-pass render flag (decode once, encode once, no temp videos)
+    single_pass = pop_flag("--single-pass")
+
+    # Follow faces over time (multi-speaker interviews) instead of one static crop
+    track_faces = pop_flag("--track-faces")
+
+    # Detect shot boundaries (per-shot crops, no smoothing across cuts, snapped clip boundaries)
+    shots = pop_flag("--shots")
+
+    # Karaoke captions: word-level timestamps, the spoken word is highlighted
+    karaoke = pop_flag("--karaoke")
+
+    # Jump cuts: drop pauses and filler words from each clip (renders in a single pass)
+    jump_cuts = pop_flag("--jump-cuts")
+
+    # Offline highlight scoring (no OpenAI call), or use it to shrink the transcript sent to the LLM
+    local_highlights = pop_flag("--local-highlights")
+    prefilter = pop_flag("--prefilter")
+
+    # Parallel CPU transcription: --workers N splits the audio at silences into N chunks
+    workers = max(1, int(pop_option("--workers", 1)))
+
+    # Batch mode: --clips N makes N shorts from one download/transcription/analysis
+    clips = max(1, int(pop_option("--clips", 1)))
+
+    # Number of clips rendered concurrently in batch mode
+    render_workers = max(1, int(pop_option("--render-workers", 2)))
+
+    # Job queue / worker mode
+    db_path = pop_option("--db", "jobs.db")
+    enqueue_file = pop_option("--enqueue")
+    if enqueue_file:
+        queue = JobQueue(db_path)
+        source = sys.stdin if enqueue_file == "-" else open(enqueue_file)
+        with source:
+            urls = [line.strip() for line in source if line.strip() and not line.startswith("#")]
+        options = {"clips": clips, "single_pass": single_pass, "workers": workers, "track_faces": track_faces,
+                   "shots": shots, "karaoke": karaoke, "local_highlights": local_highlights,
+                   "prefilter": prefilter, "jump_cuts": jump_cuts}
+        for url in urls:
+            queue.add(url, options)
+        print(f"Queued {len(urls)} jobs in {db_path}")
+        return
+    if pop_flag("--status"):
+        print_queue_status(db_path)
+        return
+    if pop_flag("--worker"):
+        if pop_flag("--requeue"):
+            print(f"Requeued {JobQueue(db_path).requeue_running()} interrupted jobs")
+        run_worker(db_path, parse_concurrency(pop_option("--concurrency", "")), drain=pop_flag("--drain"))
+        return
+
+    # Start loading Whisper in the background so it overlaps with download/audio extraction
+    # (parallel mode loads one model per worker process instead)
+    if workers == 1:
+        preload_whisper_model()
+
+    # Check if URL/file was provided as command-line argument
+    if len(sys.argv) > 1:
+        url_or_file = sys.argv[1]
+        print(f"Using input from command line: {url_or_file}")
     else:
+        url_or_file = input("Enter YouTube video URL or local video file path: ")
+
+    # Batch runs use the format policy without waiting for a resolution choice
+    # (a download stays pinned in the media cache until this process exits)
+    Vid, video_title = load_source(url_or_file, interactive=not auto_approve)
+
+    # Process video (works for both local files and downloaded videos)
+    if not Vid:
+        print("Unable to process the video")
+        return
+
+    # Shot detection runs alongside transcription
+    shot_future = start_shot_detection(Vid) if shots else None
+
+    # Without --local-highlights/--prefilter, LLM requests start on the first
+    # transcript windows while Whisper is still decoding the rest
+    stream = HighlightStream(clips) if not local_highlights and not prefilter else None
+
+    audio_file = f"audio_{session_id}.wav"
+    Audio, transcriptions, TransText, words = transcribe_source(Vid, audio_file, workers, karaoke,
+                                                                stream.feed if stream else None)
+    if not Audio:
         print("No audio file found")
-else:
-    print("Unable to process the video")
\ No newline at end of file
+        return
+    if len(transcriptions) == 0:
+        print("No transcriptions found")
+        return
+
+    print(f"\n{'='*60}")
+    print(f"TRANSCRIPTION SUMMARY: {len(transcriptions)} segments")
+    print(f"{'='*60}\n")
+
+    print("Analyzing transcription to find best highlight...")
+    segments = transcriptions if local_highlights else highlight_segments(transcriptions, clips, prefilter, Audio)
+
+    def regenerate(rejected):
+        return select_highlights(segments, clips, local_highlights, Audio, exclude=rejected)
+
+    if stream:
+        highlights = finish_highlights(stream, segments, clips, Audio)
+    else:
+        highlights = select_highlights(segments, clips, local_highlights, Audio)
+
+    # Check if GetHighlight failed
+    if not highlights:
+        print(f"\n{'='*60}")
+        print("ERROR: Failed to get highlight from LLM")
+        print(f"{'='*60}")
+        print("This could be due to:")
+        print("  - OpenAI API issues or rate limiting")
+        print("  - Invalid API key")
+        print("  - Network connectivity problems")
+        print("  - Malformed transcription data")
+        print(f"\nTranscription summary:")
+        print(f"  Total segments: {len(transcriptions)}")
+        print(f"  Total length: {len(TransText)} characters")
+        print(f"{'='*60}\n")
+        sys.exit(1) # Exit gracefully
+
+    vad = load_vad_track(Vid, Audio) if jump_cuts or track_faces else None
+
+    def produce(selection, cancel=None):
+        """Snap a selection to shot boundaries and render it; returns the output paths"""
+        # A highlight may start at 0s; drop only negative or empty ranges
+        selection = [(start, stop) for start, stop in selection if start>=0 and stop>start]
+        if not selection:
+            return []
+        shot_index = wait_for_shots(shot_future)
+        if shot_index is not None:
+            selection = snap_highlights(selection, shot_index)
+        return render_highlights(Vid, selection, transcriptions, video_title, session_id, single_pass, render_workers,
+                                 track_faces=track_faces, shot_index=shot_index, words=words, cancel=cancel,
+                                 jump_cuts=jump_cuts, vad=vad)
+
+    # The shown selection starts rendering during the approval window
+    speculative = None if auto_approve else SpeculativeRender(produce)
+    highlights = approve_highlights(highlights, regenerate, auto_approve, speculative)
+
+    for start, stop in highlights:
+        print(f"\n✓ Final highlight: {start}s - {stop}s")
+    if not any(start>=0 and stop>start for start, stop in highlights):
+        print("Error in getting highlight")
+        if speculative is not None:
+            speculative.stop()
+        return
+
+    outputs = speculative.result(highlights) if speculative is not None else produce(highlights)
+
+    for final_output in outputs:
+        if final_output:
+            print(f"\n{'='*60}")
+            print(f"✓ SUCCESS: {final_output} is ready!")
+            print(f"{'='*60}\n")
+        else:
+            print("Error: Rendering failed")
+
+    print_model_load_times()
+
+    # Clean up temporary files
+    try:
+        if os.path.exists(audio_file):
+            os.remove(audio_file)
+        print(f"Cleaned up temporary files for session {session_id}")
+    except Exception as e:
+        print(f"Warning: Could not clean up some temporary files: {e}")
+
+    if not all(outputs):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
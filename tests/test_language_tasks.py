@@ -0,0 +1,166 @@
+import json
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import Components.LanguageTasks as lt
+from Components.Cache import DiskCache
+from Components.LanguageTasks import HighlightClient, HighlightStream, HighlightsResponse, get_highlights_async
+
+
+class ChatServer:
+    """
+    Local stand-in for the OpenAI chat completions endpoint. Each answer is
+    one highlight starting 1 s after the first timestamp in the user message.
+    """
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.fail_requests = 0  # this many requests get a 500 first
+        self.requests = 0
+        self.started = []  # time.monotonic() of every request
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def reply(self, status, payload):
+                data = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                with server._lock:
+                    server.requests += 1
+                    server.started.append(time.monotonic())
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                    fail = server.fail_requests > 0
+                    if fail:
+                        server.fail_requests -= 1
+                try:
+                    time.sleep(server.delay)
+                    if fail:
+                        self.reply(500, {"error": {"message": "internal error", "type": "server_error"}})
+                        return
+                    times = re.findall(r"^(\d+(?:\.\d+)?) - ", body["messages"][1]["content"], re.M)
+                    start = float(times[0]) + 1 if times else 0.0
+                    name = body["tool_choice"]["function"]["name"]
+                    highlight = {"start": start, "content": "highlight", "end": start + 30}
+                    arguments = {"highlights": [highlight]} if name == "HighlightsResponse" else highlight
+                    self.reply(200, {
+                        "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": body["model"],
+                        "choices": [{"index": 0, "finish_reason": "tool_calls", "message": {
+                            "role": "assistant", "content": None,
+                            "tool_calls": [{"id": "call-test", "type": "function",
+                                            "function": {"name": name, "arguments": json.dumps(arguments)}}],
+                        }}],
+                    })
+                finally:
+                    with server._lock:
+                        server.in_flight -= 1
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/v1"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = ChatServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(lt, "LLM_BACKOFF_SECONDS", 0.01)
+
+
+@pytest.fixture
+def make_client(server, tmp_path):
+    clients = []
+
+    def make(**options):
+        options.setdefault("requests_per_minute", 0)
+        client = HighlightClient(base_url=server.url, api_key="test", cache=DiskCache(str(tmp_path / "llm")),
+                                 **options)
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        client.close()
+
+
+def test_retry_then_cache(server, make_client):
+    server.fail_requests = 1
+    client = make_client()
+
+    first = client.run(get_highlights_async("10.0 - 40.0: Something surprising.\n", 1, client=client))
+    assert first == [(11, 41)]
+    assert server.requests == 2  # the 500, then the retry
+
+    # Same prompt again: answered from the response cache
+    second = client.run(get_highlights_async("10.0 - 40.0: Something surprising.\n", 1, client=client))
+    assert second == first
+    assert server.requests == 2
+
+
+def test_retries_exhausted(server, make_client):
+    server.fail_requests = 10
+    client = make_client(max_retries=2)
+    with pytest.raises(Exception):
+        client.run(client.complete("system", "0.0 - 5.0: Hi.\n", HighlightsResponse))
+    assert server.requests == 3
+
+
+def test_concurrent_windows_respect_limits(server, make_client):
+    server.delay = 0.2
+    client = make_client(max_concurrency=2)
+    futures = [client.submit(get_highlights_async(f"{i * 100}.0 - {i * 100 + 50}.0: Window {i}.\n", 1,
+                                                  client=client))
+               for i in range(6)]
+    assert [f.result() for f in futures] == [[(i * 100 + 1, i * 100 + 31)] for i in range(6)]
+    # Requests overlap, but never more than max_concurrency at once
+    assert server.max_in_flight == 2
+
+
+def test_rate_limit_spaces_requests(server, make_client):
+    # A burst of 2, then one request every 0.1 s
+    client = make_client(max_concurrency=2, requests_per_minute=600)
+    futures = [client.submit(get_highlights_async(f"{i}.0 - {i + 1}.0: Line {i}.\n", 1, client=client))
+               for i in range(6)]
+    for future in futures:
+        future.result()
+    started = sorted(server.started)
+    assert started[-1] - started[0] >= 4 * 0.1 - 0.05
+
+
+def test_highlight_stream_windows(server, make_client):
+    client = make_client(max_concurrency=4)
+    stream = HighlightStream(count=1, max_tokens=60, overlap_tokens=0, client=client)
+    for i in range(12):
+        stream.feed([f"Sentence number {i} of the transcript.", i * 10.0, i * 10.0 + 9.0])
+    highlights = stream.finish()
+
+    windows = len(stream.requests)
+    assert windows > 1
+    # One request per window plus the reduce step, all on the local server
+    assert server.requests == windows + 1
+    assert len(highlights) == 1
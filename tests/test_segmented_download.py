@@ -0,0 +1,126 @@
+import os
+import re
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+import Components.SegmentedDownload as sd
+
+
+class RangeServer:
+    """Local HTTP server with Range/If-Range support that can drop connections mid-body"""
+
+    def __init__(self, body):
+        self.body = body
+        self.etag = '"v1"'
+        self.fail_requests = 0  # this many ranged responses are cut off after a third of the body
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                data = server.body
+                match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+                if_range = self.headers.get("If-Range")
+                if match and (if_range is None or if_range == server.etag):
+                    start = int(match.group(1))
+                    end = int(match.group(2)) if match.group(2) else len(data) - 1
+                    body = data[start:end + 1]
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+                else:
+                    body = data
+                    self.send_response(200)
+                self.send_header("ETag", server.etag)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                with server._lock:
+                    fail = server.fail_requests > 0 and len(body) > 1
+                    if fail:
+                        server.fail_requests -= 1
+                if fail:
+                    body = body[:len(body) // 3]
+                    self.wfile.write(body)
+                    self.wfile.flush()
+                    self.connection.shutdown(2)
+                else:
+                    self.wfile.write(body)
+                with server._lock:
+                    server.bytes_sent += len(body)
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/file.bin"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def server():
+    server = RangeServer(os.urandom(400_000))
+    yield server
+    server.close()
+
+
+@pytest.fixture(autouse=True)
+def small_segments(monkeypatch):
+    monkeypatch.setattr(sd.segment_bounds, "__defaults__", (sd.DOWNLOAD_SEGMENTS, 50_000))
+    monkeypatch.setattr(sd, "DOWNLOAD_BACKOFF_SECONDS", 0.01)
+
+
+def leftovers(path):
+    directory, name = os.path.split(path)
+    return [f for f in os.listdir(directory) if f.startswith(name + ".part")]
+
+
+def test_segmented_download(server, tmp_path):
+    path = str(tmp_path / "out.bin")
+    sd.download_file(server.url, path, segments=4)
+    assert open(path, 'rb').read() == server.body
+    assert leftovers(path) == []
+
+
+def test_dropped_connections_are_retried(server, tmp_path):
+    server.fail_requests = 3
+    path = str(tmp_path / "out.bin")
+    sd.download_file(server.url, path, segments=4)
+    assert open(path, 'rb').read() == server.body
+
+
+def test_interrupted_download_resumes(server, tmp_path, monkeypatch):
+    path = str(tmp_path / "out.bin")
+    monkeypatch.setattr(sd, "DOWNLOAD_RETRIES", 0)
+    server.fail_requests = 4
+    with pytest.raises(Exception):
+        sd.download_file(server.url, path, segments=4)
+    assert not os.path.exists(path)
+    assert leftovers(path)
+
+    server.bytes_sent = 0
+    sd.download_file(server.url, path, segments=4)
+    assert open(path, 'rb').read() == server.body
+    assert leftovers(path) == []
+    # Only the missing two thirds (plus the 1-byte probe) were fetched again
+    assert server.bytes_sent < len(server.body)
+
+
+def test_changed_resource_discards_parts(server, tmp_path, monkeypatch):
+    path = str(tmp_path / "out.bin")
+    monkeypatch.setattr(sd, "DOWNLOAD_RETRIES", 0)
+    server.fail_requests = 4
+    with pytest.raises(Exception):
+        sd.download_file(server.url, path, segments=4)
+    assert leftovers(path)
+
+    # New content, different size but the same number of segments
+    server.body = os.urandom(380_000)
+    server.etag = '"v2"'
+    sd.download_file(server.url, path, segments=4)
+    assert open(path, 'rb').read() == server.body
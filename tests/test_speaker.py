@@ -0,0 +1,45 @@
+import numpy as np
+
+from Components.Speaker import follow_speaker
+from Components.VoiceActivity import VadTrack
+
+# Two faces as fractions of a 300x300 detector image: a tall one on the left,
+# a smaller one on the right
+BOXES = np.array([[0.05, 0.1, 0.35, 0.7], [0.6, 0.3, 0.85, 0.6]], dtype=np.float32)
+TALLEST = 0
+
+
+def frame(mouth_open):
+    """Gray faces; the right face's mouth is a dark bar when open"""
+    image = np.full((300, 300, 3), 128, np.uint8)
+    if mouth_open:
+        image[165:178, 190:245] = 20
+    return image
+
+
+def run(speaking):
+    state = {}
+    picks = []
+    for i, flag in enumerate(speaking):
+        picks.append(follow_speaker(state, frame(i % 2 == 1), np.array([0, 1]), BOXES, TALLEST, flag))
+    return picks
+
+
+def test_follows_moving_lips_while_speaking():
+    assert run([True] * 6) == [0, 1, 1, 1, 1, 1]
+
+
+def test_keeps_last_speaker_in_silence():
+    # The mouth moves between every pair of frames, so speech switches right away
+    assert run([False, False, True, True, False, False]) == [0, 0, 1, 1, 1, 1]
+
+
+def test_tallest_face_without_speech():
+    assert run([False] * 4) == [0] * 4
+
+
+def test_vad_section():
+    track = VadTrack([False, False, True, True, False, True], frame_seconds=0.5)
+    section = track.section(1.0, 2.5)
+    assert list(section.speech) == [True, True, False]
+    assert section.is_speech(0.2) and not section.is_speech(1.2)
@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+
+moviepy_editor = pytest.importorskip("moviepy.editor")
+
+from Components.TextOverlay import EnhancedTextOverlay
+from Components.WordTimings import WordTimings
+
+TRANSCRIPTIONS = [["hello karaoke world", 0.0, 2.0]]
+WORDS = WordTimings.from_words([[" hello", 0.0, 0.6], [" karaoke", 0.6, 1.3], [" world", 1.3, 2.0]])
+
+
+@pytest.fixture
+def video(tmp_path):
+    """A 2 s black 320x240 clip"""
+    path = str(tmp_path / "black.mp4")
+    clip = moviepy_editor.ColorClip((320, 240), color=(0, 0, 0), duration=2)
+    clip.write_videofile(path, fps=10, codec='libx264', audio=False, logger=None)
+    clip.close()
+    return path
+
+
+def test_karaoke_frames(video, tmp_path):
+    output = str(tmp_path / "karaoke.mp4")
+    overlay = EnhancedTextOverlay(video_path=video, output_path=output)
+    overlay.create_karaoke_video(TRANSCRIPTIONS, WORDS, fps=10)
+
+    with moviepy_editor.VideoFileClip(output) as result:
+        first = result.get_frame(0.3).astype(int)
+        second = result.get_frame(1.0).astype(int)
+    # Captions are drawn, and the highlight moves from "hello" to "karaoke"
+    assert first.max() > 100 and second.max() > 100
+    assert np.abs(first - second).sum() > 0
@@ -0,0 +1,49 @@
+import numpy as np
+
+from Components.Transcription import find_split_points
+
+SAMPLE_RATE = 16000
+
+
+def noise(seconds, seed=0):
+    """Steady 'speech' with no pauses at all"""
+    rng = np.random.default_rng(seed)
+    return (rng.standard_normal(int(seconds * SAMPLE_RATE)) * 3000).astype(np.int16)
+
+
+def chunk_lengths(audio, splits):
+    bounds = [0] + splits + [len(audio)]
+    return [b - a for a, b in zip(bounds, bounds[1:])]
+
+
+def test_chunks_roughly_equal_without_pauses():
+    audio = noise(60)
+    splits = find_split_points(audio, 8, SAMPLE_RATE)
+    assert len(splits) == 7
+    equal = len(audio) / 8
+    for length in chunk_lengths(audio, splits):
+        assert 0.5 * equal <= length <= 1.5 * equal
+
+
+def test_short_audio_does_not_search_past_its_chunks():
+    # 10 s in 8 chunks: a 10 s search window would span the whole file
+    audio = noise(10, seed=1)
+    splits = find_split_points(audio, 8, SAMPLE_RATE)
+    assert len(splits) == 7
+    equal = len(audio) / 8
+    for length in chunk_lengths(audio, splits):
+        assert 0.5 * equal <= length <= 1.5 * equal
+
+
+def test_splits_land_in_nearby_pauses():
+    audio = noise(60, seed=2)
+    # A 0.5 s pause 2 s after each equal-length boundary
+    pauses = []
+    for i in range(1, 4):
+        start = int((i * 15 + 2) * SAMPLE_RATE)
+        audio[start:start + SAMPLE_RATE // 2] = 0
+        pauses.append((start, start + SAMPLE_RATE // 2))
+    splits = find_split_points(audio, 4, SAMPLE_RATE)
+    assert len(splits) == 3
+    for split, (start, end) in zip(splits, pauses):
+        assert start <= split <= end
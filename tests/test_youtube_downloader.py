@@ -0,0 +1,108 @@
+import json
+import os
+import shutil
+
+import pytest
+
+import Components.YoutubeDownloader as yd
+from Components.YoutubeDownloader import LocalYouTube, MediaCache, download_youtube_video
+
+VIDEO_ID = "dQw4w9WgXcQ"
+URL = f"https://youtu.be/{VIDEO_ID}"
+
+
+@pytest.fixture
+def fixtures(tmp_path):
+    """A fixture directory with two progressive streams (no ffmpeg needed to 'download' them)"""
+    directory = tmp_path / "fixtures"
+    directory.mkdir()
+    (directory / "p360.mp4").write_bytes(b"360p" * 1000)
+    (directory / "p720.mp4").write_bytes(b"720p" * 1000)
+    (directory / f"{VIDEO_ID}.json").write_text(json.dumps({
+        "title": "Fixture: talk?",
+        "streams": [
+            {"itag": 18, "type": "video", "resolution": "360p", "codec": "avc1", "progressive": True,
+             "file": "p360.mp4"},
+            {"itag": 22, "type": "video", "resolution": "720p", "codec": "avc1", "progressive": True,
+             "file": "p720.mp4"},
+        ],
+    }))
+    return str(directory)
+
+
+@pytest.fixture
+def downloads(monkeypatch):
+    """Streams fetched through download_stream, by itag"""
+    fetched = []
+    original = yd.download_stream
+
+    def counting(stream, output_path, prefix):
+        fetched.append(stream.itag)
+        return original(stream, output_path, prefix)
+
+    monkeypatch.setattr(yd, "download_stream", counting)
+    return fetched
+
+
+def test_download_and_reuse(fixtures, tmp_path, downloads):
+    cache = MediaCache(str(tmp_path / "videos"))
+    client = lambda url: LocalYouTube(url, fixtures)
+
+    path = download_youtube_video(URL, client, cache)
+    assert path == os.path.join(cache.directory, VIDEO_ID, "22", "Fixture- talk.mp4")
+    assert open(path, 'rb').read() == b"720p" * 1000
+    assert downloads == [22]
+    assert list(cache.entries()) == [f"{VIDEO_ID}/22"]
+
+    # Second run: served from the cache without downloading
+    assert download_youtube_video(URL, client, cache) == path
+    assert downloads == [22]
+
+
+def test_format_policy(fixtures, tmp_path, downloads, monkeypatch):
+    monkeypatch.setattr(yd, "DOWNLOAD_MAX_HEIGHT", 480)
+    monkeypatch.setattr(yd.pick_video_stream, "__defaults__", (480, "avc1"))
+    cache = MediaCache(str(tmp_path / "videos"))
+    path = download_youtube_video(URL, lambda url: LocalYouTube(url, fixtures), cache)
+    assert downloads == [18]
+    assert open(path, 'rb').read() == b"360p" * 1000
+
+
+def test_eviction_skips_pinned(fixtures, tmp_path):
+    cache = MediaCache(str(tmp_path / "videos"), max_bytes=5000)
+    path = download_youtube_video(URL, lambda url: LocalYouTube(url, fixtures), cache, pin=True)
+
+    other = tmp_path / "other.mp4"
+    other.write_bytes(b"x" * 4000)
+    cache.add("aaaaaaaaaaa", "18", str(other), "other")
+    assert os.path.exists(path)
+
+    cache.unpin(path)
+    other.write_bytes(b"y" * 4000)
+    cache.add("bbbbbbbbbbb", "18", str(other), "other")
+    assert not os.path.exists(path)
+    assert f"{VIDEO_ID}/22" not in cache.entries()
+
+
+@pytest.mark.skipif(shutil.which("ffmpeg") is None, reason="ffmpeg not installed")
+def test_adaptive_streams_are_merged(tmp_path, downloads):
+    import ffmpeg
+    directory = tmp_path / "fixtures"
+    directory.mkdir()
+    source = ffmpeg.input("testsrc=size=320x240:rate=25:duration=1", f="lavfi")
+    tone = ffmpeg.input("sine=frequency=440:duration=1", f="lavfi")
+    ffmpeg.output(source, str(directory / "v.mp4"), vcodec="libx264").run(quiet=True)
+    ffmpeg.output(tone, str(directory / "a.m4a"), acodec="aac").run(quiet=True)
+    (directory / f"{VIDEO_ID}.json").write_text(json.dumps({
+        "title": "Adaptive",
+        "streams": [
+            {"itag": 137, "type": "video", "resolution": "240p", "codec": "avc1", "file": "v.mp4"},
+            {"itag": 140, "type": "audio", "abr": "128kbps", "file": "a.m4a"},
+        ],
+    }))
+    cache = MediaCache(str(tmp_path / "videos"))
+    path = download_youtube_video(URL, lambda url: LocalYouTube(url, str(directory)), cache)
+    assert sorted(downloads) == [137, 140]
+    streams = {s["codec_type"] for s in ffmpeg.probe(path)["streams"]} if shutil.which("ffprobe") else None
+    assert streams in (None, {"video", "audio"})
+    assert os.listdir(os.path.dirname(path)) == ["Adaptive.mp4"]